@@ -17,4 +17,31 @@ CORE_CONFIG_NAME_EMA = "ema-solr-config"
 # Path to directory with master db configuration
 CORE_CONFIG_SOURCE_PATH_MASTER = os.path.join(os.path.dirname(__file__), CORE_CONFIG_NAME_MASTER)
 # Path to directory with Ema db configuration
-CORE_CONFIG_SOURCE_PATH_EMA = os.path.join(os.path.dirname(__file__), CORE_CONFIG_NAME_EMA)
\ No newline at end of file
+CORE_CONFIG_SOURCE_PATH_EMA = os.path.join(os.path.dirname(__file__), CORE_CONFIG_NAME_EMA)
+# Path to directory with sync state (checkpoints & watermarks) of the source databases
+SYNC_STATE_PATH = os.path.join(os.path.dirname(__file__), "sync-state")
+# Name of the SQLite file (in the sync state directory) with content hashes of saved documents
+DOC_HASH_INDEX_NAME = "doc-hashes.sqlite"
+# Path to directory with local snapshots of exports of the source databases
+SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), "snapshots")
+# Path to the hint server, whose Morphodita tagger client is shared for index-time lemmatization
+HINT_SERVER_PATH = os.path.join(os.path.dirname(__file__), "..", "Edubot.HintServer.Server")
+# URL pattern of the Morphodita tagger for index-time lemmatization (same as LemmatizeUrlPattern of the hint server)
+LEMMATIZE_URL_PATTERN = "http://lindat.mff.cuni.cz/services/morphodita/api/tag?data={text}&output=json&convert_tagset=strip_lemma_id"
+# Name of the SQLite file (in the sync state directory) with cached lemmatized texts
+LEMMA_CACHE_NAME = "lemma-cache.sqlite"
+# Path to directory with facet snapshots of the cores, precomputed after each sync for the hint server
+FACET_SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), "facet-snapshots")
+# Fields faceted in the facet snapshots, by core (WizardHintFields, SearchHintFields & DropdownFields of the hint server's collections)
+FACET_SNAPSHOT_FIELDS = {
+    CORE_NAME_EMA: ["stupen_vzdelavani", "rocnik", "typ", "jazyk", "licence", "dostupnost"],
+}
+# Suffix of the shadow core a full rebuild is synced into, before it's swapped with the live core
+REBUILD_CORE_SUFFIX = "_rebuild"
+# Suffix of the core with the previous index, kept after a rebuild for rollback
+PREVIOUS_CORE_SUFFIX = "_previous"
+# Fields whose facet counts are compared between the live and the rebuilt core, by core
+REBUILD_CHECK_FIELDS = {
+    CORE_NAME_MASTER: ["source_database"],
+    CORE_NAME_EMA: FACET_SNAPSHOT_FIELDS[CORE_NAME_EMA],
+}
@@ -1,35 +1,128 @@
 import argparse
+import http.client
+import io
 import os
 import shutil
 import urllib.request
 import urllib.error
+import urllib.parse
 import json
-from typing import Any, Optional
-from socket import timeout
+import queue
+import threading
+import time
+import traceback
+import socket
+import hashlib
+import sqlite3
+import gzip
+import mmap
+import sys
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional
 
-from config import SOLR_PATH, SOLR_URL, EXPORT_URL_PATTRN, CORE_NAME_MASTER, CORE_NAME_EMA, CORE_CONFIG_NAME_MASTER, CORE_CONFIG_NAME_EMA, CORE_CONFIG_SOURCE_PATH_MASTER, CORE_CONFIG_SOURCE_PATH_EMA
+from config import SOLR_PATH, SOLR_URL, EXPORT_URL_PATTRN, CORE_NAME_MASTER, CORE_NAME_EMA, CORE_CONFIG_NAME_MASTER, CORE_CONFIG_NAME_EMA, CORE_CONFIG_SOURCE_PATH_MASTER, CORE_CONFIG_SOURCE_PATH_EMA, SYNC_STATE_PATH, DOC_HASH_INDEX_NAME, SNAPSHOT_PATH, HINT_SERVER_PATH, LEMMATIZE_URL_PATTERN, LEMMA_CACHE_NAME, FACET_SNAPSHOT_PATH, FACET_SNAPSHOT_FIELDS, REBUILD_CORE_SUFFIX, PREVIOUS_CORE_SUFFIX, REBUILD_CHECK_FIELDS
+
+# the Morphodita tagger client is shared with the hint server
+sys.path.append(HINT_SERVER_PATH)
+from hint_server.tagger import tagBatch, lemmatizedText
 
 def main():
     parser = argparse.ArgumentParser(
         description="Methods for wornking with Solr database.")
     parser.add_argument("--job", required=True, type=str,
-                        choices=["create", "drop", "sync"], help="Job that should be executed.")
+                        choices=["create", "drop", "sync", "sync-all", "rebuild", "rollback"], help="Job that should be executed.")
     parser.add_argument("--last_changed", type=str,
-                        help="Get items for synchronization that are newer than this date.")
+                        help="Get items for synchronization that are newer than this date. "
+                             "By default, an interrupted sync is resumed, or the sync continues from the last one's watermark.")
     parser.add_argument("--source_db", choices=["ema", "clanky", "dum", "kc",
                         "ema_only"], type=str, help="Source database for synchronization.")
+    parser.add_argument("--sources", nargs="+", choices=list(KNOWN_SOURCES), default=list(KNOWN_SOURCES),
+                        help="Source databases synchronized concurrently by sync-all.")
+    parser.add_argument("--export_rate", type=float, default=5.0,
+                        help="Maximum number of export API requests per second of sync-all & rebuild, shared by all sources; 0 for no limit.")
+    parser.add_argument("--core", choices=[CORE_NAME_MASTER, CORE_NAME_EMA], type=str,
+                        help="Core to rebuild from all its source databases, or to roll back to the previous index.")
+    parser.add_argument("--fetch_workers", type=int, default=4,
+                        help="Number of export pages fetched concurrently.")
+    parser.add_argument("--map_workers", type=int, default=2,
+                        help="Number of workers mapping exported items to Solr documents.")
+    parser.add_argument("--write_workers", type=int, default=2,
+                        help="Number of parallel Solr update requests (per core with sync-all & rebuild, shared by its sources).")
+    parser.add_argument("--page_size", type=int, default=500,
+                        help="Number of items per export page.")
+    parser.add_argument("--batch_size", type=int, default=500,
+                        help="Maximum number of documents per Solr update request.")
+    parser.add_argument("--batch_bytes", type=int, default=1 << 20,
+                        help="Initial size of Solr update requests in bytes, adapted to Solr response times.")
+    parser.add_argument("--max_batch_bytes", type=int, default=8 << 20,
+                        help="Memory cap for the size of one Solr update request in bytes.")
+    parser.add_argument("--target_batch_seconds", type=float, default=2.0,
+                        help="Solr response time the update request size is adapted to.")
+    parser.add_argument("--solr_timeout", type=float, default=10,
+                        help="Timeout of Solr update requests (s); timeouts are retried with backoff.")
+    parser.add_argument("--state_dir", type=str, default=SYNC_STATE_PATH,
+                        help="Directory with sync state (checkpoints, watermarks & document hashes) of the source databases.")
+    parser.add_argument("--force", action="store_true",
+                        help="Save all documents, even those that didn't change since they were last saved.")
+    parser.add_argument("--delete_missing", action="store_true",
+                        help="After a full export, delete documents of the source database missing from it.")
+    parser.add_argument("--snapshot_dir", type=str, default=SNAPSHOT_PATH,
+                        help="Directory with local snapshots of exports of the source databases.")
+    parser.add_argument("--save_snapshot", action="store_true",
+                        help="Save fetched export pages to a local snapshot.")
+    parser.add_argument("--from_snapshot", action="store_true",
+                        help="Read export pages from the local snapshot instead of the export API.")
+    parser.add_argument("--commit_within", type=int, default=60000,
+                        help="Solr commitWithin for updates (ms); a hard commit is always issued at the end.")
+    parser.add_argument("--lemmatize_url", type=str, default=LEMMATIZE_URL_PATTERN,
+                        help="URL pattern of the Morphodita tagger for the lemmatized fields; empty to index them unlemmatized.")
+    parser.add_argument("--lemmatize_batch_chars", type=int, default=20000,
+                        help="Maximum number of characters sent to the tagger in one call.")
+    parser.add_argument("--facet_snapshot_dir", type=str, default=FACET_SNAPSHOT_PATH,
+                        help="Directory the facet snapshot of the synchronized core is saved to, for the hint server; empty to skip it.")
+    parser.add_argument("--rebuild_min_ratio", type=float, default=0.95,
+                        help="Minimum ratio of document & facet counts of the rebuilt core to the live one (and of indexed to exported documents).")
+    parser.add_argument("--rebuild_sample_values", type=int, default=20,
+                        help="Number of the most frequent values of each checked field whose facet counts are compared after a rebuild.")
 
     args = parser.parse_args()
 
     if args.job == "create":
         create()
     elif args.job == "drop":
-        drop()
+        drop(args.state_dir)
     elif args.job == "sync":
         if args.source_db is None:
             parser.print_usage()
             return
-        sync(args.last_changed, args.source_db)
+        sync(args.last_changed, args.source_db, args.fetch_workers, args.map_workers, args.write_workers,
+             args.page_size, args.batch_size, args.commit_within,
+             args.batch_bytes, args.max_batch_bytes, args.target_batch_seconds, args.solr_timeout, args.state_dir,
+             args.force, args.delete_missing, args.snapshot_dir, args.save_snapshot, args.from_snapshot,
+             args.lemmatize_url, args.lemmatize_batch_chars, args.facet_snapshot_dir)
+    elif args.job == "sync-all":
+        syncAll(args.sources, args.export_rate, args.last_changed, args.write_workers,
+                fetchWorkers=args.fetch_workers, mapWorkers=args.map_workers,
+                perPage=args.page_size, maxBatchDocs=args.batch_size, commitWithinMs=args.commit_within,
+                batchBytes=args.batch_bytes, maxBatchBytes=args.max_batch_bytes, targetBatchSeconds=args.target_batch_seconds,
+                solrTimeout=args.solr_timeout, stateDir=args.state_dir, force=args.force, deleteMissing=args.delete_missing,
+                snapshotDir=args.snapshot_dir, saveSnapshot=args.save_snapshot, fromSnapshot=args.from_snapshot,
+                lemmatizeUrl=args.lemmatize_url, lemmatizeBatchChars=args.lemmatize_batch_chars,
+                facetSnapshotDir=args.facet_snapshot_dir)
+    elif args.job in ["rebuild", "rollback"]:
+        if args.core is None:
+            parser.print_usage()
+            return
+        if args.job == "rollback":
+            rollback(args.core, args.state_dir, args.facet_snapshot_dir)
+            return
+        rebuild(args.core, args.rebuild_min_ratio, args.rebuild_sample_values, args.state_dir, args.facet_snapshot_dir,
+                args.export_rate, fetchWorkers=args.fetch_workers, mapWorkers=args.map_workers, writeWorkers=args.write_workers,
+                perPage=args.page_size, maxBatchDocs=args.batch_size, commitWithinMs=args.commit_within,
+                batchBytes=args.batch_bytes, maxBatchBytes=args.max_batch_bytes, targetBatchSeconds=args.target_batch_seconds,
+                solrTimeout=args.solr_timeout, snapshotDir=args.snapshot_dir, saveSnapshot=args.save_snapshot,
+                fromSnapshot=args.from_snapshot, lemmatizeUrl=args.lemmatize_url, lemmatizeBatchChars=args.lemmatize_batch_chars)
 
 
 def create():
@@ -74,24 +167,25 @@ def create():
             except urllib.error.HTTPError as e:
                 print(e.readlines())
 
-def drop():
+def drop(stateDir: str = SYNC_STATE_PATH):
     instanceTargetPath = os.path.join(SOLR_PATH, "data")
     configsetsTargetPath = os.path.join(instanceTargetPath, "configsets")
     # Remove schema directory and drop core for both dbs
     for srcPath, configName, coreName in [(CORE_CONFIG_SOURCE_PATH_MASTER, CORE_CONFIG_NAME_MASTER, CORE_NAME_MASTER), (CORE_CONFIG_SOURCE_PATH_EMA, CORE_CONFIG_NAME_EMA, CORE_NAME_EMA)]:
         print(f"Deleting {coreName}")
         # Detect if core exists
-        url = f"{SOLR_URL}admin/cores?action=STATUS"
-        response = urllib.request.urlopen(url).read()
-        parsedResponse = json.loads(response)
-        if coreName in parsedResponse["status"]:
-            # Create core
-            url = f"{SOLR_URL}admin/cores?action=UNLOAD&core={coreName}"
-            response = urllib.request.urlopen(url).read()
-            parsedResponse = json.loads(response)
+        existingCores = coreNames()
+        if coreName in existingCores:
+            # after a rebuild, the instance dir of the live core is the rebuild's one, not the data dir below
+            unloadCore(coreName)
             print(f"Core {coreName} deleted")
         else:
             print(f"Core {coreName} already deleted")
+        # Drop the cores of rebuilds, their instance dirs are not the one of the core
+        for otherCoreName in [coreName + REBUILD_CORE_SUFFIX, coreName + PREVIOUS_CORE_SUFFIX]:
+            if otherCoreName in existingCores:
+                unloadCore(otherCoreName)
+                print(f"Core {otherCoreName} deleted")
         # Delete schema dir
         tgtPath = os.path.join(configsetsTargetPath, configName)
         if os.path.exists(tgtPath):
@@ -106,6 +200,29 @@ def drop():
             print(f"Path {tgtPath} deleted")
         else:
             print(f"Path {tgtPath} already had been deleted")
+        # Forget sync state, so that the next sync starts from scratch
+        forgetSyncState(coreName, stateDir)
+
+def forgetSyncState(coreName: str, stateDir: str):
+    if not os.path.exists(stateDir):
+        return
+    for sourceDb, (_, _, sourceCoreName, _) in KNOWN_SOURCES.items():
+        statePath = checkpointPath(stateDir, sourceDb)
+        if sourceCoreName == coreName and os.path.exists(statePath):
+            os.remove(statePath)
+            print(f"Sync state of {sourceDb} deleted")
+    DocHashIndex(os.path.join(stateDir, DOC_HASH_INDEX_NAME)).delete(coreName)
+
+def coreAdmin(action: str, **params) -> dict:
+    url = f"{SOLR_URL}admin/cores?{urllib.parse.urlencode(dict(action=action, **params))}"
+    return json.loads(urllib.request.urlopen(url).read())
+
+def coreNames() -> set[str]:
+    return set(coreAdmin("STATUS")["status"])
+
+def unloadCore(coreName: str):
+    """Unload the core and delete its instance dir (with the data)."""
+    coreAdmin("UNLOAD", core=coreName, deleteInstanceDir="true")
 
 def valueOrDefault(item: Any, key: str, default = None) -> Any:
     return default if ((key not in item) or (item[key] is None)) else item[key]
@@ -313,70 +430,958 @@ def map_kc(item: Any):
         "user_id": valueOrDefault(item, "user_id"),
     }
 
-def sync(lastChanged: str, sourceDb: str):
-    # Retrieve parameters by source database
-    knownSources = {
-        "ema": (map_ema, "ema", CORE_NAME_MASTER),
-        "clanky": (map_clanky, "clanky", CORE_NAME_MASTER),
-        "dum": (map_dum, "dum", CORE_NAME_MASTER),
-        "kc": (map_kc, "kc", CORE_NAME_MASTER),
-        "ema_only": (map_ema_only, "ema", CORE_NAME_EMA)
-    }
-    mappingFn, typeName, coreName = knownSources[sourceDb]
-    lastChanged = lastChanged if lastChanged is not None else "1900-01-01"
-    perPage = 500
+class SyncProgress:
+    """Thread-safe counter of indexed documents, reporting throughput; optionally also counted
+    into the combined progress of all sources synchronized at once."""
 
-    # Load count of items
-    url = EXPORT_URL_PATTRN.format(page=1, per_page=1, last_change=lastChanged, type=typeName)
+    def __init__(self, typeName: str, combined: Optional["SyncProgress"] = None):
+        self.typeName = typeName
+        self.combined = combined
+        self.docs = 0
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add(self, docs: int, page: int, pageCount: int):
+        with self.lock:
+            self.docs += docs
+            message = f"Saved page {page}/{pageCount} for {self.typeName}, {self.docs} docs total, {self.docsPerSecond():.1f} docs/s"
+        if self.combined is not None:
+            with self.combined.lock:
+                self.combined.docs += docs
+                message += f"; all sources {self.combined.docs} docs, {self.combined.docsPerSecond():.1f} docs/s"
+        print(message)
+
+    def docsPerSecond(self) -> float:
+        return self.docs / max(time.monotonic() - self.started, 1e-6)
+
+
+def pageCount(count: int, perPage: int) -> int:
+    return (count + perPage - 1) // perPage
+
+
+class RateLimiter:
+    """Token bucket limiting the calls of all threads to one API to `rate` per second (with bursts)."""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def fetchPage(typeName: str, page: int, perPage: int, lastChanged: str, limiter: Optional[RateLimiter] = None) -> Any:
+    url = EXPORT_URL_PATTRN.format(page=page, per_page=perPage, last_change=lastChanged, type=typeName)
+    if limiter is not None:
+        limiter.acquire()
     response = urllib.request.urlopen(url).read()
-    parsedResponse = json.loads(response)
-    count = int(parsedResponse["all_results_count"])
-    pageCount = count // perPage
-
-    # Loop through pages
-    page = 0
-    while page < pageCount:
-        page += 1
-        print(f"Fetching page {page}/{pageCount} for {typeName}")
-
-        # Retrieve items
-        url = EXPORT_URL_PATTRN.format(page=page, per_page=perPage, last_change=lastChanged, type=typeName)
-        response = urllib.request.urlopen(url).read()
-        parsedResponse = json.loads(response)
+    return json.loads(response)
+
+
+class AdaptiveBatchSize:
+    """Target size of Solr update batches in bytes, adapted to measured Solr response times.
+
+    Grows while Solr answers well within the target time, shrinks proportionally when it's slower
+    and halves on timeouts; always stays between MIN_BYTES and the memory cap."""
+
+    MIN_BYTES = 64 * 1024
+
+    def __init__(self, initialBytes: int, maxBytes: int, targetSeconds: float):
+        self.maxBytes = maxBytes
+        self.targetSeconds = targetSeconds
+        self.bytes = max(self.MIN_BYTES, min(initialBytes, maxBytes))
+        self.lock = threading.Lock()
+
+    def observe(self, batchBytes: int, seconds: float):
+        with self.lock:
+            if seconds > self.targetSeconds:
+                self.bytes = max(self.MIN_BYTES, int(self.bytes * self.targetSeconds / seconds))
+            elif seconds < self.targetSeconds / 2 and batchBytes >= self.bytes * 0.8:
+                # only grow on batches that were actually (nearly) full
+                self.bytes = min(self.maxBytes, int(self.bytes * 1.25))
+
+    def onTimeout(self):
+        with self.lock:
+            self.bytes = max(self.MIN_BYTES, self.bytes // 2)
+
+
+# Serialized Solr document: (id, content hash, JSON)
+SerializedDoc = tuple[str, bytes, bytes]
+
+
+def serializeDocs(docs: Iterable[dict]) -> Iterator[SerializedDoc]:
+    """Serialize Solr documents one by one, yielding each with its content hash."""
+    for doc in docs:
+        data = json.dumps(doc, sort_keys=True).encode("utf-8")
+        yield str(doc["id"]), hashlib.blake2b(data, digest_size=16).digest(), data
+
+
+def skipUnchanged(docs: Iterator[SerializedDoc], hashIndex: "DocHashIndex", coreName: str, runId: int) -> Iterator[SerializedDoc]:
+    """Pass only documents whose content changed since they were last saved; mark the rest as seen."""
+    unchanged = []
+    for doc in docs:
+        if hashIndex.get(coreName, doc[0]) == doc[1]:
+            unchanged.append(doc[0])
+        else:
+            yield doc
+    hashIndex.markSeen(coreName, unchanged, runId)
+
+
+def batchDocs(docs: Iterator[SerializedDoc], batchSize: AdaptiveBatchSize, maxDocs: int) -> Iterator[list[SerializedDoc]]:
+    """Group serialized documents into batches of the current target size in bytes (and at most maxDocs)."""
+    batch = []
+    batchBytes = 0
+    for doc in docs:
+        batch.append(doc)
+        batchBytes += len(doc[2])
+        if batchBytes >= batchSize.bytes or len(batch) >= maxDocs:
+            yield batch
+            batch = []
+            batchBytes = 0
+    if batch:
+        yield batch
+
 
-        # Refresh count (in case of modifications)
-        count = int(parsedResponse["all_results_count"])
-        pageCount = count // perPage
+def jsonArrayChunks(docs: list[SerializedDoc], chunkBytes: int = 65536) -> Iterator[bytes]:
+    """Stream serialized documents as a JSON array in chunks, without building the whole body."""
+    parts = [b"["]
+    partsBytes = 1
+    for i, (_, _, data) in enumerate(docs):
+        if i:
+            parts.append(b",")
+        parts.append(data)
+        partsBytes += len(data) + 1
+        if partsBytes >= chunkBytes:
+            yield b"".join(parts)
+            parts = []
+            partsBytes = 0
+    parts.append(b"]")
+    yield b"".join(parts)
 
-        # Map items to internal db format
-        print(f"Mapping page {page}/{pageCount} for {typeName}")
-        parsedItems = []
 
-        for resultItem in parsedResponse["results"]:
-            parsedItem = mappingFn(resultItem)
-            parsedItems.append(parsedItem)
+def isTimeout(e: Exception) -> bool:
+    if isinstance(e, urllib.error.URLError):
+        return isinstance(e.reason, socket.timeout)
+    return isinstance(e, socket.timeout)
 
-        # Save items
-        print(f"Saving page {page}/{pageCount} for {typeName}")
-        attempts = 10
-        timeout = 10
-        for i in range(attempts):
+
+class SolrWritePool:
+    """Keep-alive connections for the update requests to one Solr core. At most `size` requests run
+    at once, which makes it the write concurrency budget of the core, shared by all sources writing to it."""
+
+    def __init__(self, size: int):
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = queue.LifoQueue()
+
+    def post(self, url: str, body: Callable[[], Iterable[bytes]], contentType: str, timeout: float) -> bytes:
+        """POST the body (chunked) & return the response; raises HTTPError on error statuses like urlopen."""
+        parts = urllib.parse.urlsplit(url)
+        with self.slots:
+            for attempt in range(2):
+                connection = self._connection(parts, timeout)
+                try:
+                    connection.request("POST", f"{parts.path}?{parts.query}", body=body(),
+                                       headers={"Content-Type": contentType}, encode_chunked=True)
+                    response = connection.getresponse()
+                    data = response.read()
+                except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                    connection.close()
+                    if attempt == 0:
+                        continue  # the server closed an idle connection, try a fresh one
+                    raise
+                except BaseException:
+                    connection.close()
+                    raise
+                self.idle.put((parts.scheme, parts.netloc, connection))
+                break
+        if response.status >= 400:
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(data))
+        return data
+
+    def _connection(self, parts: urllib.parse.SplitResult, timeout: float) -> http.client.HTTPConnection:
+        while True:
             try:
-                url = f"{SOLR_URL}{coreName}/update?commit=true"
-                data = json.dumps(parsedItems).encode("utf-8")
-                request = urllib.request.Request(url, data=data, method="post")
+                scheme, netloc, connection = self.idle.get_nowait()
+            except queue.Empty:
+                connectionClass = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+                return connectionClass(parts.netloc, timeout=timeout)
+            if (scheme, netloc) != (parts.scheme, parts.netloc):
+                connection.close()
+                continue
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            return connection
+
+
+def postDocs(coreName: str, docs: list[SerializedDoc], commitWithinMs: int, timeout: float, batchSize: AdaptiveBatchSize,
+             pool: Optional[SolrWritePool] = None):
+    attempts = 10
+    url = f"{SOLR_URL}{coreName}/update?commitWithin={commitWithinMs}"
+    for i in range(attempts):
+        started = time.monotonic()
+        try:
+            if pool is not None:
+                response = pool.post(url, lambda: jsonArrayChunks(docs), "application/json", timeout)
+            else:
+                # no Content-Length, so the body goes out with chunked transfer encoding
+                request = urllib.request.Request(url, data=jsonArrayChunks(docs), method="post")
                 request.add_header("Content-Type", "application/json")
-                request.add_header("Content-Length", len(data))
                 response = urllib.request.urlopen(request, timeout=timeout).read()
-                parsedResponse = json.loads(response)
-                break
-            except urllib.error.URLError as e:
-                if isinstance(e.reason, timeout):
-                    print(f"Timeout, retrying ({attempts-i-1} attempts left)")
-                    continue
-                else:
-                    print(e.readlines())
-                    break
+        except urllib.error.HTTPError as e:
+            raise Exception(f"Saving to {coreName} failed: {e.code} {e.read().decode('utf-8', 'replace')}") from e
+        except (OSError, urllib.error.URLError) as e:
+            if not isTimeout(e):
+                raise
+            batchSize.onTimeout()
+            delay = min(2 ** i, 60)
+            print(f"Timeout, retrying in {delay} s ({attempts-i-1} attempts left)")
+            time.sleep(delay)
+            continue
+        batchSize.observe(sum(len(data) for _, _, data in docs), time.monotonic() - started)
+        return json.loads(response)
+    raise Exception(f"Saving to {coreName} timed out {attempts} times")
+
+
+class DocHashIndex:
+    """Content hashes of the documents saved to Solr, keyed by core & document ID, in a local SQLite file.
+
+    Each document also remembers the last sync run that saw it in the export, so that documents
+    missing from a full export can be found and deleted."""
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS doc_hashes (core TEXT, id TEXT, source TEXT, hash BLOB, seen INTEGER, PRIMARY KEY (core, id))")
+        self.connection.commit()
+
+    def get(self, coreName: str, docId: str) -> Optional[bytes]:
+        with self.lock:
+            row = self.connection.execute("SELECT hash FROM doc_hashes WHERE core = ? AND id = ?", (coreName, docId)).fetchone()
+        return None if row is None else row[0]
+
+    def store(self, coreName: str, sourceDb: str, docs: list[SerializedDoc], runId: int):
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO doc_hashes VALUES (?, ?, ?, ?, ?)",
+                                        [(coreName, docId, sourceDb, digest, runId) for docId, digest, _ in docs])
+            self.connection.commit()
+
+    def markSeen(self, coreName: str, docIds: list[str], runId: int):
+        with self.lock:
+            self.connection.executemany("UPDATE doc_hashes SET seen = ? WHERE core = ? AND id = ?",
+                                        [(runId, coreName, docId) for docId in docIds])
+            self.connection.commit()
+
+    def unseen(self, coreName: str, sourceDb: str, runId: int) -> list[str]:
+        with self.lock:
+            rows = self.connection.execute("SELECT id FROM doc_hashes WHERE core = ? AND source = ? AND seen != ?",
+                                           (coreName, sourceDb, runId)).fetchall()
+        return [row[0] for row in rows]
+
+    def renameCore(self, coreName: str, newCoreName: str):
+        """Move the hashes of a core under another name, replacing the hashes stored there."""
+        with self.lock:
+            self.connection.execute("DELETE FROM doc_hashes WHERE core = ?", (newCoreName,))
+            self.connection.execute("UPDATE doc_hashes SET core = ? WHERE core = ?", (newCoreName, coreName))
+            self.connection.commit()
+
+    def delete(self, coreName: str, docIds: Optional[list[str]] = None):
+        """Forget the given documents, or the whole core."""
+        with self.lock:
+            if docIds is None:
+                self.connection.execute("DELETE FROM doc_hashes WHERE core = ?", (coreName,))
+            else:
+                self.connection.executemany("DELETE FROM doc_hashes WHERE core = ? AND id = ?",
+                                            [(coreName, docId) for docId in docIds])
+            self.connection.commit()
+
+
+def foldAscii(text: str) -> str:
+    """Strip diacritics, as in the *_ascii fields."""
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+class LemmaCache:
+    """Lemmatized texts keyed by tagger URL pattern & original text, in a local SQLite file."""
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS lemmas (tagger TEXT, text TEXT, lemmatized TEXT, PRIMARY KEY (tagger, text))")
+        self.connection.commit()
+
+    def get(self, tagger: str, texts: list[str]) -> dict[str, str]:
+        found = {}
+        with self.lock:
+            for start in range(0, len(texts), 500):  # stay within the SQLite limit of query parameters
+                chunk = texts[start:start + 500]
+                rows = self.connection.execute(f"SELECT text, lemmatized FROM lemmas WHERE tagger = ? AND text IN ({','.join('?' * len(chunk))})",
+                                               [tagger] + chunk).fetchall()
+                found.update(rows)
+        return found
+
+    def store(self, tagger: str, lemmas: dict[str, str]):
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO lemmas VALUES (?, ?, ?)",
+                                        [(tagger, text, lemmatized) for text, lemmatized in lemmas.items()])
+            self.connection.commit()
+
+
+class IndexLemmatizer:
+    """Fills the *_lemmatized fields of mapped documents (which hold the original texts) with lemmatized texts.
+
+    Texts of a whole page are looked up in the lemma cache and the rest is tagged in batched calls
+    of up to batchChars characters; fields flagged as ASCII are also stripped of diacritics."""
+
+    def __init__(self, urlPattern: str, cache: LemmaCache, fields: dict[str, bool], batchChars: int, timeout: float = 60):
+        self.urlPattern = urlPattern
+        self.cache = cache
+        self.fields = fields
+        self.batchChars = batchChars
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.cached = 0
+        self.tagged = 0
+
+    def lemmatizeDocs(self, docs: list[dict]) -> list[dict]:
+        texts = list({text: None for doc in docs for field in self.fields for text in self._texts(doc.get(field)) if text})
+        lemmas = self.cache.get(self.urlPattern, texts)
+        missing = [text for text in texts if text not in lemmas]
+        with self.lock:
+            self.cached += len(texts) - len(missing)
+            self.tagged += len(missing)
+        for batch in self._batches(missing):
+            tagged = {text: lemmatizedText(tokens) for text, tokens in zip(batch, tagBatch(self.urlPattern, batch, self.timeout))}
+            self.cache.store(self.urlPattern, tagged)
+            lemmas.update(tagged)
+
+        for doc in docs:
+            for field, fold in self.fields.items():
+                value = doc.get(field)
+                if isinstance(value, list):
+                    doc[field] = [self._lemmatize(text, lemmas, fold) for text in value]
+                elif value is not None:
+                    doc[field] = self._lemmatize(value, lemmas, fold)
+        return docs
+
+    def _texts(self, value) -> list[str]:
+        return value if isinstance(value, list) else [] if value is None else [value]
+
+    def _lemmatize(self, text: str, lemmas: dict[str, str], fold: bool) -> str:
+        lemmatized = lemmas.get(text, text)
+        return foldAscii(lemmatized) if fold else lemmatized
+
+    def _batches(self, texts: list[str]) -> Iterator[list[str]]:
+        batch = []
+        batchChars = 0
+        for text in texts:
+            if batch and batchChars + len(text) > self.batchChars:
+                yield batch
+                batch = []
+                batchChars = 0
+            batch.append(text)
+            batchChars += len(text)
+        if batch:
+            yield batch
+
+
+def deleteDocs(coreName: str, docIds: list[str], commitWithinMs: int):
+    url = f"{SOLR_URL}{coreName}/update?commitWithin={commitWithinMs}"
+    data = json.dumps({"delete": docIds}).encode("utf-8")
+    request = urllib.request.Request(url, data=data, method="post")
+    request.add_header("Content-Type", "application/json")
+    response = urllib.request.urlopen(request).read()
+    return json.loads(response)
+
+
+def queryFacets(coreName: str, fields: list[str], filter: Optional[tuple[str, str]] = None) -> dict:
+    """Get count & facet counts of the given fields for the whole core, or for a single-value filter."""
+    params = [("q", "*:*"), ("rows", "0"), ("wt", "json"), ("facet", "true"), ("facet.limit", "-1"),
+              ("facet.mincount", "1"), ("json.nl", "map")]
+    params += [("facet.field", field) for field in fields]
+    if filter is not None:
+        params.append(("fq", f"{filter[0]}:\"{filter[1]}\""))
+    url = f"{SOLR_URL}{coreName}/select?{urllib.parse.urlencode(params)}"
+    response = json.loads(urllib.request.urlopen(url).read())
+    return {"numFound": response["response"]["numFound"], "facets": response["facet_counts"]["facet_fields"]}
+
+
+def writeFacetSnapshot(coreName: str, fields: list[str], path: str, workers: int = 4):
+    """Precompute facets of the whole core & of every single-value filter for the hint server.
+
+    The file has a one-line JSON header (fields & entry key -> [offset, length] of its data), followed
+    by compact JSON data of the entries; it's replaced atomically, so the server can keep it memory-mapped."""
+    whole = queryFacets(coreName, fields)
+    filters = [(field, value) for field in fields for value in whole["facets"].get(field, {})]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        filtered = list(executor.map(lambda filter: queryFacets(coreName, fields, filter), filters))
+
+    entries = {}
+    data = []
+    offset = 0
+    for key, entry in [("", whole)] + [(f"{field}\t{value}", entry) for (field, value), entry in zip(filters, filtered)]:
+        entryData = json.dumps(entry, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        entries[key] = [offset, len(entryData)]
+        data.append(entryData)
+        offset += len(entryData)
+    header = {"core": coreName, "generatedAt": time.strftime("%Y-%m-%dT%H:%M:%S"), "fields": fields, "entries": entries}
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as file:
+        file.write(json.dumps(header, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n")
+        for entryData in data:
+            file.write(entryData)
+    os.replace(path + ".tmp", path)
+    print(f"Saved facet snapshot of {coreName} with {len(entries)} entries to {path}")
+
+
+def commit(coreName: str):
+    url = f"{SOLR_URL}{coreName}/update?commit=true"
+    request = urllib.request.Request(url, data=b"[]", method="post")
+    request.add_header("Content-Type", "application/json")
+    response = urllib.request.urlopen(request).read()
+    return json.loads(response)
+
+
+class ExportSnapshot:
+    """Local compressed copy of an export of one source database.
+
+    Pages are stored as separately gzip-compressed NDJSON members of one file (so the whole file is
+    still a valid .ndjson.gz), with an index of their offsets. Any page can be read on its own through
+    a memory map of the file."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.dataPath = os.path.join(directory, "pages.ndjson.gz")
+        self.indexPath = os.path.join(directory, "index.json")
+        self.lock = threading.Lock()
+        self.index = None
+        self.file = None
+        self.mmap = None
+
+    def openForWriting(self, lastChanged: str, perPage: int, resume: bool):
+        """Start a new snapshot, or append to the existing one when resuming an interrupted sync."""
+        os.makedirs(self.directory, exist_ok=True)
+        if resume and os.path.exists(self.indexPath):
+            self.index = self._loadIndex()
+            if self.index["lastChanged"] == lastChanged and self.index["perPage"] == perPage:
+                self.file = open(self.dataPath, "ab")
+                return
+        self.index = {"lastChanged": lastChanged, "perPage": perPage, "count": 0, "pages": {}}
+        self.file = open(self.dataPath, "wb")
+        self._saveIndex()
+
+    def addPage(self, page: int, count: int, results: list):
+        data = gzip.compress("".join(json.dumps(item, ensure_ascii=False) + "\n" for item in results).encode("utf-8"))
+        with self.lock:
+            offset = self.file.seek(0, os.SEEK_END)
+            self.file.write(data)
+            self.file.flush()
+            self.index["pages"][str(page)] = [offset, len(data)]
+            self.index["count"] = count
+            self._saveIndex()
+
+    def openForReading(self):
+        self.index = self._loadIndex()
+        self.file = open(self.dataPath, "rb")
+        if os.path.getsize(self.dataPath) > 0:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def readPage(self, page: int) -> list:
+        if str(page) not in self.index["pages"]:
+            raise Exception(f"Page {page} is missing in snapshot {self.directory}")
+        offset, length = self.index["pages"][str(page)]
+        data = gzip.decompress(memoryview(self.mmap)[offset:offset + length])
+        return [json.loads(line) for line in data.splitlines() if line]
+
+    def close(self):
+        if self.mmap is not None:
+            self.mmap.close()
+        if self.file is not None:
+            self.file.close()
+
+    def _loadIndex(self) -> dict:
+        with open(self.indexPath, "r", encoding="utf8") as file:
+            return json.load(file)
+
+    def _saveIndex(self):
+        tmpPath = self.indexPath + ".tmp"
+        with open(tmpPath, "w", encoding="utf8") as file:
+            json.dump(self.index, file)
+        os.replace(tmpPath, self.indexPath)
+
+
+class SyncCheckpoint:
+    """Persistent sync state of one source database, so that an interrupted sync can resume without
+    re-posting finished pages and the next sync continues from the high-water mark of the last one.
+
+    A page counts as finished once all its batches are saved; the state file is rewritten atomically
+    after every finished page."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf8") as file:
+                self.state = json.load(file)
+        self.pages = {}  # page -> {"batches": N or None if not mapped yet, "saved": N, "maxChanged": str}
+
+    def isInProgress(self) -> bool:
+        return self.state.get("inProgress", False)
+
+    def start(self, lastChanged: str, perPage: int, resume: bool):
+        """Start a new run (or resume the interrupted one)."""
+        if not resume:
+            self.state = {"watermark": self.state.get("watermark"), "lastChanged": lastChanged, "perPage": perPage,
+                          "inProgress": True, "finishedPages": [], "runWatermark": None, "runId": time.time_ns()}
+        self.save()
+
+    def finishedPages(self) -> set[int]:
+        return set(self.state["finishedPages"])
+
+    def pageMapped(self, page: int, batches: int, maxChanged: Optional[str]):
+        with self.lock:
+            pageState = self.pages.setdefault(page, {"saved": 0})
+            pageState["batches"] = batches
+            pageState["maxChanged"] = maxChanged
+            self._checkFinished(page)
+
+    def batchSaved(self, page: int):
+        with self.lock:
+            pageState = self.pages.setdefault(page, {"saved": 0, "batches": None})
+            pageState["saved"] += 1
+            self._checkFinished(page)
+
+    def finish(self):
+        """Mark the run as complete, the next one continues from its watermark."""
+        with self.lock:
+            self.state["inProgress"] = False
+            self.state["finishedPages"] = []
+            self.state["watermark"] = maxOrNone(self.state["runWatermark"], self.state.get("watermark"))
+            self.save()
+
+    def _checkFinished(self, page: int):
+        pageState = self.pages[page]
+        if pageState.get("batches") is None or pageState["saved"] < pageState["batches"]:
+            return
+        del self.pages[page]
+        self.state["finishedPages"].append(page)
+        self.state["runWatermark"] = maxOrNone(self.state["runWatermark"], pageState["maxChanged"])
+        self.save()
+
+    def save(self):
+        tmpPath = self.path + ".tmp"
+        with open(tmpPath, "w", encoding="utf8") as file:
+            json.dump(self.state, file)
+        os.replace(tmpPath, self.path)
+
+
+def maxOrNone(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    return a if b is None else b if a is None else max(a, b)
+
+
+# Source database -> mapping function, export type, target core, field with date of last change
+KNOWN_SOURCES = {
+    "ema": (map_ema, "ema", CORE_NAME_MASTER, "datum_posledni_zmeny"),
+    "clanky": (map_clanky, "clanky", CORE_NAME_MASTER, "published"),
+    "dum": (map_dum, "dum", CORE_NAME_MASTER, "published"),
+    "kc": (map_kc, "kc", CORE_NAME_MASTER, "post_date"),
+    "ema_only": (map_ema_only, "ema", CORE_NAME_EMA, "datum_posledni_zmeny")
+}
+
+# Source database -> fields lemmatized at index time -> whether they are ASCII-folded
+LEMMATIZED_FIELDS = {
+    "ema_only": {
+        "popis_lemmatized": False,
+        "popis_lemmatized_ascii": True,
+        "klicova_slova_lemmatized": False,
+        "klicova_slova_lemmatized_ascii": True,
+    },
+}
+
+
+def sync(lastChanged: str, sourceDb: str, fetchWorkers: int = 4, mapWorkers: int = 2, writeWorkers: int = 2,
+         perPage: int = 500, maxBatchDocs: int = 500, commitWithinMs: int = 60000,
+         batchBytes: int = 1 << 20, maxBatchBytes: int = 8 << 20, targetBatchSeconds: float = 2.0, solrTimeout: float = 10,
+         stateDir: str = SYNC_STATE_PATH, force: bool = False, deleteMissing: bool = False,
+         snapshotDir: str = SNAPSHOT_PATH, saveSnapshot: bool = False, fromSnapshot: bool = False,
+         lemmatizeUrl: Optional[str] = LEMMATIZE_URL_PATTERN, lemmatizeBatchChars: int = 20000,
+         facetSnapshotDir: Optional[str] = FACET_SNAPSHOT_PATH, targetCore: Optional[str] = None,
+         exportLimiter: Optional[RateLimiter] = None, writePool: Optional[SolrWritePool] = None,
+         batchSize: Optional[AdaptiveBatchSize] = None, combinedProgress: Optional[SyncProgress] = None) -> int:
+    """Export -> map -> index pipeline: pages are fetched concurrently, mapped in a worker pool and posted
+    to Solr by parallel writers relying on commitWithin, with a single hard commit at the end.
+
+    Documents are serialized one by one into batches sized adaptively in bytes and streamed to Solr,
+    so memory stays bounded by the queue lengths times maxBatchBytes. Documents whose content hash didn't
+    change since they were last saved are skipped (unless forced); after a full export, documents missing
+    from it may be deleted.
+
+    Fetched pages can be saved to a local snapshot, and a later sync can read them from the snapshot
+    instead of the export API.
+
+    The *_lemmatized fields of a page are lemmatized in batched tagger calls, backed by a persistent lemma cache.
+    After the commit, facets of the core are precomputed into a snapshot file for the hint server.
+
+    The documents can be saved to another core than the source database's one (e.g. the shadow core of
+    a rebuild); its sync state is kept apart. Returns the number of saved documents.
+
+    When several sources are synced at once, they can share the export rate limiter, and the write pool
+    (write concurrency budget) & the adaptive batch size of their core."""
+    # Retrieve parameters by source database
+    mappingFn, typeName, coreName, changedField = KNOWN_SOURCES[sourceDb]
+    coreName = targetCore if targetCore is not None else coreName
+
+    # Resume an interrupted run, or continue from the last watermark, unless the date is given explicitly
+    os.makedirs(stateDir, exist_ok=True)
+    checkpoint = SyncCheckpoint(checkpointPath(stateDir, sourceDb, targetCore))
+    snapshot = ExportSnapshot(os.path.join(snapshotDir, sourceDb))
+    if fromSnapshot:
+        snapshot.openForReading()
+        lastChanged, perPage = snapshot.index["lastChanged"], snapshot.index["perPage"]
+        resume = checkpoint.isInProgress() and checkpoint.state["lastChanged"] == lastChanged and checkpoint.state["perPage"] == perPage
+        print(f"Syncing {sourceDb} from snapshot of {lastChanged}" + (", resuming interrupted sync" if resume else ""))
+    elif lastChanged is None and checkpoint.isInProgress():
+        resume = True
+        lastChanged, perPage = checkpoint.state["lastChanged"], checkpoint.state["perPage"]
+        print(f"Resuming interrupted sync of {sourceDb} from {lastChanged}, {len(checkpoint.finishedPages())} pages already done")
+    else:
+        resume = False
+        if lastChanged is None and checkpoint.state.get("watermark"):
+            lastChanged = checkpoint.state["watermark"][:10]  # the watermark day is re-exported, updates are idempotent
+            print(f"Continuing sync of {sourceDb} from watermark {lastChanged}")
+    lastChanged = lastChanged if lastChanged is not None else "1900-01-01"
+    checkpoint.start(lastChanged, perPage, resume)
+    if saveSnapshot and not fromSnapshot:
+        snapshot.openForWriting(lastChanged, perPage, resume)
+    finishedPages = checkpoint.finishedPages()
+    runId = checkpoint.state["runId"]
+    hashIndex = DocHashIndex(os.path.join(stateDir, DOC_HASH_INDEX_NAME))
+    lemmatizer = None
+    if lemmatizeUrl and sourceDb in LEMMATIZED_FIELDS:
+        lemmatizer = IndexLemmatizer(lemmatizeUrl, LemmaCache(os.path.join(stateDir, LEMMA_CACHE_NAME)),
+                                     LEMMATIZED_FIELDS[sourceDb], lemmatizeBatchChars)
+    if deleteMissing and lastChanged != "1900-01-01":
+        print("Deleting missing documents requires a full export (--last_changed 1900-01-01), skipping")
+        deleteMissing = False
+
+    def getPage(page: int) -> tuple[int, list]:
+        """Get total count of items & items of the given page, from the snapshot or the export API."""
+        if fromSnapshot:
+            return snapshot.index["count"], snapshot.readPage(page)
+        parsedResponse = fetchPage(typeName, page, perPage, lastChanged, exportLimiter)
+        count, results = int(parsedResponse["all_results_count"]), parsedResponse["results"]
+        if saveSnapshot:
+            snapshot.addPage(page, count, results)
+        return count, results
+
+    # Load count of items
+    if fromSnapshot:
+        count = snapshot.index["count"]
+    else:
+        count = int(fetchPage(typeName, 1, 1, lastChanged, exportLimiter)["all_results_count"])
+    pages = {"next": 1, "count": pageCount(count, perPage)}
+    pagesLock = threading.Lock()
+
+    # Bounded queues between the stages, so fetching can't run arbitrarily ahead of indexing
+    mapQueue = queue.Queue(maxsize=2 * mapWorkers)
+    writeQueue = queue.Queue(maxsize=2 * writeWorkers)
+    failed = threading.Event()
+    progress = SyncProgress(typeName, combinedProgress)
+    if batchSize is None:
+        batchSize = AdaptiveBatchSize(batchBytes, maxBatchBytes, targetBatchSeconds)
+
+    def fail(stage: str):
+        print(f"{stage} failed for {typeName}:")
+        traceback.print_exc()
+        failed.set()
+
+    def fetcher():
+        while not failed.is_set():
+            with pagesLock:
+                while pages["next"] in finishedPages:
+                    pages["next"] += 1
+                page = pages["next"]
+                if page > pages["count"]:
+                    return
+                pages["next"] += 1
+                currentPageCount = pages["count"]
+            print(f"Fetching page {page}/{currentPageCount} for {typeName}")
+            try:
+                count, results = getPage(page)
+            except Exception:
+                fail("Fetching")
+                return
+            # Refresh count (in case of modifications)
+            with pagesLock:
+                pages["count"] = pageCount(count, perPage)
+            mapQueue.put((page, results))
+
+    def mapper():
+        # keep consuming after a failure, so that the upstream stage never blocks
+        for page, results in iter(mapQueue.get, None):
+            if failed.is_set():
+                continue
+            try:
+                batches = 0
+                docs = map(mappingFn, results)
+                if lemmatizer is not None:
+                    docs = lemmatizer.lemmatizeDocs(list(docs))
+                docs = serializeDocs(docs)
+                if not force:
+                    docs = skipUnchanged(docs, hashIndex, coreName, runId)
+                for batch in batchDocs(docs, batchSize, maxBatchDocs):
+                    writeQueue.put((page, batch))
+                    batches += 1
+                maxChanged = max((item[changedField] for item in results if item.get(changedField)), default=None)
+                checkpoint.pageMapped(page, batches, maxChanged)
+            except Exception:
+                fail("Mapping")
+
+    def writer():
+        for page, batch in iter(writeQueue.get, None):
+            if failed.is_set():
+                continue
+            try:
+                postDocs(coreName, batch, commitWithinMs, solrTimeout, batchSize, writePool)
+                hashIndex.store(coreName, sourceDb, batch, runId)
+            except Exception:
+                fail("Saving")
+                continue
+            checkpoint.batchSaved(page)
+            progress.add(len(batch), page, pages["count"])
+
+    def runStage(target, workers: int) -> list[threading.Thread]:
+        threads = [threading.Thread(target=target, daemon=True) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def finishStage(threads: list[threading.Thread], nextQueue: Optional[queue.Queue], nextWorkers: int):
+        for thread in threads:
+            thread.join()
+        for _ in range(nextWorkers):
+            nextQueue.put(None)
+
+    fetchers = runStage(fetcher, fetchWorkers)
+    mappers = runStage(mapper, mapWorkers)
+    writers = runStage(writer, writeWorkers)
+    finishStage(fetchers, mapQueue, mapWorkers)
+    finishStage(mappers, writeQueue, writeWorkers)
+    finishStage(writers, None, 0)
+    snapshot.close()
+
+    if failed.is_set():
+        raise Exception(f"Synchronization of {typeName} failed, see errors above")
+
+    if deleteMissing:
+        missing = hashIndex.unseen(coreName, sourceDb, runId)
+        print(f"Deleting {len(missing)} docs of {typeName} missing from the export")
+        for start in range(0, len(missing), maxBatchDocs):
+            deleteDocs(coreName, missing[start:start + maxBatchDocs], commitWithinMs)
+            hashIndex.delete(coreName, missing[start:start + maxBatchDocs])
+
+    print(f"Committing {coreName}")
+    commit(coreName)
+    checkpoint.finish()
+    if facetSnapshotDir and coreName in FACET_SNAPSHOT_FIELDS:
+        writeFacetSnapshot(coreName, FACET_SNAPSHOT_FIELDS[coreName], os.path.join(facetSnapshotDir, f"{coreName}.facets"))
+    print(f"Synchronized {progress.docs} docs of {typeName} in {time.monotonic() - progress.started:.1f} s, {progress.docsPerSecond():.1f} docs/s")
+    if lemmatizer is not None:
+        print(f"Lemmatized {lemmatizer.tagged} texts, {lemmatizer.cached} more found in the lemma cache")
+    return progress.docs
+
+
+def syncAll(sources: list[str], exportRate: float = 5.0, lastChanged: Optional[str] = None, writeWorkers: int = 2,
+            batchBytes: int = 1 << 20, maxBatchBytes: int = 8 << 20, targetBatchSeconds: float = 2.0,
+            facetSnapshotDir: Optional[str] = FACET_SNAPSHOT_PATH, **syncOptions):
+    """Sync the source databases concurrently, each in its own thread. All of them share one rate limiter
+    of the export API; the sources of one core share its write pool (the budget of writeWorkers parallel
+    update requests) and adaptive batch size. A failed source doesn't stop the others; the job fails
+    at the end, after the facet snapshots of the cores are written and a report of all sources is printed.
+    Returns the number of saved documents of each source."""
+    exportLimiter = RateLimiter(exportRate, burst=exportRate) if exportRate > 0 else None
+    targetCores = {KNOWN_SOURCES[sourceDb][2] for sourceDb in sources}
+    writePools = {coreName: SolrWritePool(writeWorkers) for coreName in targetCores}
+    batchSizes = {coreName: AdaptiveBatchSize(batchBytes, maxBatchBytes, targetBatchSeconds) for coreName in targetCores}
+    combinedProgress = SyncProgress("all sources")
+    # source -> (status, saved docs or None if failed, seconds); a thread that dies without a result leaves it failed
+    results = {sourceDb: ("failed: no result", None, 0.0) for sourceDb in sources}
+    resultsLock = threading.Lock()
+
+    def run(sourceDb: str):
+        coreName = KNOWN_SOURCES[sourceDb][2]
+        started = time.monotonic()
+        try:
+            docs = sync(lastChanged, sourceDb, writeWorkers=writeWorkers, facetSnapshotDir=None,
+                        exportLimiter=exportLimiter, writePool=writePools[coreName], batchSize=batchSizes[coreName],
+                        combinedProgress=combinedProgress, **syncOptions)
+            result = ("ok", docs, time.monotonic() - started)
+        except Exception as e:
+            traceback.print_exc()
+            result = (f"failed: {e}", None, time.monotonic() - started)
+        with resultsLock:
+            results[sourceDb] = result
+
+    threads = [threading.Thread(target=run, args=(sourceDb,), name=f"sync-{sourceDb}") for sourceDb in sources]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # the cores are snapshotted once, after all their sources are in
+    for coreName in sorted(targetCores):
+        if facetSnapshotDir and coreName in FACET_SNAPSHOT_FIELDS:
+            writeFacetSnapshot(coreName, FACET_SNAPSHOT_FIELDS[coreName], os.path.join(facetSnapshotDir, f"{coreName}.facets"))
+
+    print(f"{'source':<10} {'core':<24} {'docs':>9} {'seconds':>9} {'docs/s':>9}  status")
+    for sourceDb in sources:
+        status, docs, seconds = results[sourceDb]
+        docsText = str(docs) if docs is not None else "-"
+        docsPerSecond = f"{docs / seconds:.1f}" if docs is not None and seconds > 0 else "-"
+        print(f"{sourceDb:<10} {KNOWN_SOURCES[sourceDb][2]:<24} {docsText:>9} {seconds:>9.1f} {docsPerSecond:>9}  {status}")
+    print(f"Synchronized {combinedProgress.docs} docs of {len(sources)} sources in {time.monotonic() - combinedProgress.started:.1f} s, "
+          f"{combinedProgress.docsPerSecond():.1f} docs/s")
+
+    failed = [sourceDb for sourceDb in sources if results[sourceDb][1] is None]
+    if failed:
+        raise Exception(f"Sync of {', '.join(failed)} failed")
+    return {sourceDb: results[sourceDb][1] for sourceDb in sources}
+
+
+def rebuild(coreName: str, minRatio: float = 0.95, sampleValues: int = 20, stateDir: str = SYNC_STATE_PATH,
+            facetSnapshotDir: Optional[str] = FACET_SNAPSHOT_PATH, exportRate: float = 5.0, **syncOptions):
+    """Full rebuild of a core without downtime: all its source databases are synced concurrently (as by sync-all)
+    into a new shadow core with the same configset, which is swapped with the live core after sanity checks. Until the swap,
+    queries are answered by the live core; after it, the old index is kept as the previous core for rollback."""
+    configName = CORE_CONFIG_NAME_MASTER if coreName == CORE_NAME_MASTER else CORE_CONFIG_NAME_EMA
+    shadowCoreName = coreName + REBUILD_CORE_SUFFIX
+    previousCoreName = coreName + PREVIOUS_CORE_SUFFIX
+    sources = [sourceDb for sourceDb, (_, _, sourceCoreName, _) in KNOWN_SOURCES.items() if sourceCoreName == coreName]
+
+    # A leftover shadow core is from a failed rebuild, start from scratch
+    cores = coreNames()
+    if shadowCoreName in cores:
+        print(f"Deleting shadow core {shadowCoreName} of an unfinished rebuild")
+        unloadCore(shadowCoreName)
+    for sourceDb in sources:
+        if os.path.exists(checkpointPath(stateDir, sourceDb, shadowCoreName)):
+            os.remove(checkpointPath(stateDir, sourceDb, shadowCoreName))
+    hashIndex = DocHashIndex(os.path.join(stateDir, DOC_HASH_INDEX_NAME))
+    hashIndex.delete(shadowCoreName)
+
+    # Each rebuild gets a new instance dir, the live core's one stays untouched until it's retired
+    instanceDir = started = f"{configName}-{time.strftime('%Y%m%d%H%M%S')}"
+    suffix = 1
+    while os.path.exists(os.path.join(SOLR_PATH, "data", instanceDir)):  # the live core's, if rebuilt in the same second
+        instanceDir = f"{started}-{suffix}"
+        suffix += 1
+    os.makedirs(os.path.join(SOLR_PATH, "data", instanceDir))
+    coreAdmin("CREATE", name=shadowCoreName, configSet=configName, instanceDir=instanceDir)
+    print(f"Created shadow core {shadowCoreName} in {instanceDir}")
+
+    syncedDocs = syncAll(sources, exportRate, "1900-01-01", stateDir=stateDir, force=True, facetSnapshotDir=None,
+                         targetCore=shadowCoreName, **syncOptions)
+
+    problems = checkRebuild(coreName if coreName in cores else None, shadowCoreName, syncedDocs, minRatio, sampleValues)
+    if problems:
+        for problem in problems:
+            print(f"Sanity check failed: {problem}")
+        raise Exception(f"Rebuild of {coreName} failed the sanity checks, the live core is unchanged; "
+                        f"shadow core {shadowCoreName} is kept for inspection")
+
+    if coreName in cores:
+        print(f"Swapping {coreName} with {shadowCoreName}")
+        coreAdmin("SWAP", core=coreName, other=shadowCoreName)
+        if previousCoreName in cores:
+            print(f"Deleting core {previousCoreName} of the rebuild before")
+            unloadCore(previousCoreName)
+        coreAdmin("RENAME", core=shadowCoreName, other=previousCoreName)
+        print(f"Previous index of {coreName} kept as {previousCoreName}")
+    else:
+        coreAdmin("RENAME", core=shadowCoreName, other=coreName)
+
+    # The sync state of the shadow core now belongs to the live one
+    for sourceDb in sources:
+        os.replace(checkpointPath(stateDir, sourceDb, shadowCoreName), checkpointPath(stateDir, sourceDb))
+    hashIndex.renameCore(shadowCoreName, coreName)
+
+    if facetSnapshotDir and coreName in FACET_SNAPSHOT_FIELDS:
+        writeFacetSnapshot(coreName, FACET_SNAPSHOT_FIELDS[coreName], os.path.join(facetSnapshotDir, f"{coreName}.facets"))
+    print(f"Rebuilt {coreName} with {sum(syncedDocs.values())} docs")
+
+
+def checkRebuild(liveCoreName: Optional[str], shadowCoreName: str, syncedDocs: dict[str, int],
+                 minRatio: float, sampleValues: int) -> list[str]:
+    """Compare document counts per source database & facet counts of the most frequent values of the checked
+    fields of the rebuilt core with the live one (if any) and with the numbers of synced documents."""
+    coreName = KNOWN_SOURCES[next(iter(syncedDocs))][2]
+    fields = REBUILD_CHECK_FIELDS.get(coreName, [])
+    shadow = queryFacets(shadowCoreName, fields)
+    live = queryFacets(liveCoreName, fields) if liveCoreName is not None else None
+
+    problems = []
+    if shadow["numFound"] == 0:
+        problems.append(f"{shadowCoreName} is empty")
+
+    def sourceCounts(result: dict) -> dict[str, int]:
+        if "source_database" in result["facets"]:
+            return {sourceDb: result["facets"]["source_database"].get(sourceDb, 0) for sourceDb in syncedDocs}
+        return {sourceDb: result["numFound"] for sourceDb in syncedDocs}  # a core of a single source database
+
+    shadowCounts = sourceCounts(shadow)
+    liveCounts = sourceCounts(live) if live is not None else {}
+    for sourceDb, count in shadowCounts.items():
+        print(f"{sourceDb}: {count} docs in {shadowCoreName}, {syncedDocs[sourceDb]} synced"
+              + (f", {liveCounts[sourceDb]} in {liveCoreName}" if live is not None else ""))
+        if count < minRatio * syncedDocs[sourceDb]:
+            problems.append(f"only {count} of {syncedDocs[sourceDb]} synced docs of {sourceDb} are in {shadowCoreName}")
+        if live is not None and count < minRatio * liveCounts[sourceDb]:
+            problems.append(f"{sourceDb} has {count} docs in {shadowCoreName}, but {liveCounts[sourceDb]} in {liveCoreName}")
+
+    if live is None:
+        return problems
+    for field in fields:
+        liveValues = live["facets"].get(field, {})
+        shadowValues = shadow["facets"].get(field, {})
+        for value in sorted(liveValues, key=lambda value: -liveValues[value])[:sampleValues]:
+            if shadowValues.get(value, 0) < minRatio * liveValues[value]:
+                problems.append(f"{field}:\"{value}\" has {shadowValues.get(value, 0)} docs in {shadowCoreName}, "
+                                f"but {liveValues[value]} in {liveCoreName}")
+    return problems
+
+
+def rollback(coreName: str, stateDir: str = SYNC_STATE_PATH, facetSnapshotDir: Optional[str] = FACET_SNAPSHOT_PATH):
+    """Swap the live core back with the previous one kept by the last rebuild."""
+    previousCoreName = coreName + PREVIOUS_CORE_SUFFIX
+    if previousCoreName not in coreNames():
+        raise Exception(f"There is no previous core {previousCoreName} to roll back to")
+    print(f"Swapping {coreName} with {previousCoreName}")
+    coreAdmin("SWAP", core=coreName, other=previousCoreName)
+    # the sync state describes the rebuilt index, the next sync has to start over
+    forgetSyncState(coreName, stateDir)
+    if facetSnapshotDir and coreName in FACET_SNAPSHOT_FIELDS:
+        writeFacetSnapshot(coreName, FACET_SNAPSHOT_FIELDS[coreName], os.path.join(facetSnapshotDir, f"{coreName}.facets"))
+    print(f"Rolled back {coreName}; {previousCoreName} now holds the rebuilt index")
+
+
+def checkpointPath(stateDir: str, sourceDb: str, targetCore: Optional[str] = None) -> str:
+    return os.path.join(stateDir, f"{sourceDb}.json" if targetCore is None else f"{sourceDb}.{targetCore}.json")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,92 @@
+"""rebuild & drop against a fake core admin API, with the syncs stubbed out: instance dirs & concurrency.
+
+Usage: python -m pytest tests (or python -m unittest discover tests)"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import edubot_hintserver_db as db
+
+
+class FakeCoreAdmin:
+    """Cores of a Solr instance: name -> instance dir, which UNLOAD with deleteInstanceDir removes."""
+
+    def __init__(self, dataDir: str):
+        self.dataDir = dataDir
+        self.cores = {}
+
+    def __call__(self, action: str, **params) -> dict:
+        if action == "STATUS":
+            return {"status": {name: {} for name in self.cores}}
+        if action == "CREATE":
+            self.cores[params["name"]] = params["instanceDir"]
+        elif action == "SWAP":
+            self.cores[params["core"]], self.cores[params["other"]] = self.cores[params["other"]], self.cores[params["core"]]
+        elif action == "RENAME":
+            self.cores[params["other"]] = self.cores.pop(params["core"])
+        elif action == "UNLOAD":
+            instanceDir = self.cores.pop(params["core"])
+            if params.get("deleteInstanceDir") == "true":
+                shutil.rmtree(os.path.join(self.dataDir, instanceDir))
+        return {}
+
+
+class RebuildTest(unittest.TestCase):
+
+    def setUp(self):
+        self.solrPath = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.solrPath)
+        self.stateDir = os.path.join(self.solrPath, "sync-state")
+        os.makedirs(self.stateDir)
+        self.dataDir = os.path.join(self.solrPath, "data")
+        os.makedirs(os.path.join(self.dataDir, "configsets", db.CORE_CONFIG_NAME_MASTER))
+        os.makedirs(os.path.join(self.dataDir, db.CORE_CONFIG_NAME_MASTER))
+        self.admin = FakeCoreAdmin(self.dataDir)
+        self.admin.cores[db.CORE_NAME_MASTER] = db.CORE_CONFIG_NAME_MASTER
+        self.sources = [sourceDb for sourceDb, (_, _, coreName, _) in db.KNOWN_SOURCES.items() if coreName == db.CORE_NAME_MASTER]
+        self.inFlight = threading.Barrier(len(self.sources), timeout=5)
+        self.patch("SOLR_PATH", self.solrPath)
+        self.patch("coreAdmin", self.admin)
+        self.patch("sync", self.sync)
+        self.patch("checkRebuild", lambda *args: [])
+
+    def patch(self, name: str, value):
+        original = getattr(db, name)
+        setattr(db, name, value)
+        self.addCleanup(setattr, db, name, original)
+
+    def sync(self, lastChanged, sourceDb, stateDir, targetCore, **options) -> int:
+        # fails unless all sources of the core are synced at the same time
+        self.inFlight.wait()
+        with open(db.checkpointPath(stateDir, sourceDb, targetCore), "w") as file:
+            file.write("{}")
+        return 10
+
+    def rebuild(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.rebuild(db.CORE_NAME_MASTER, stateDir=self.stateDir, facetSnapshotDir=None, exportRate=0)
+
+    def test_sources_are_synced_concurrently(self):
+        self.rebuild()
+        self.assertEqual(set(self.admin.cores), {db.CORE_NAME_MASTER, db.CORE_NAME_MASTER + db.PREVIOUS_CORE_SUFFIX})
+        self.assertNotEqual(self.admin.cores[db.CORE_NAME_MASTER], db.CORE_CONFIG_NAME_MASTER)
+
+    def test_drop_after_rebuild_deletes_all_instance_dirs(self):
+        self.rebuild()
+        self.rebuild()
+        self.assertEqual(len(os.listdir(self.dataDir)), 3)  # configsets, the live & the previous instance dir
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.drop(self.stateDir)
+        self.assertEqual(self.admin.cores, {})
+        self.assertEqual(os.listdir(self.dataDir), ["configsets"])
+        self.assertEqual(os.listdir(os.path.join(self.dataDir, "configsets")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
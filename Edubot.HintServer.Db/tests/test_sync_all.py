@@ -0,0 +1,105 @@
+"""sync-all with the export API & Solr updates stubbed out: sharing per core & failure isolation.
+
+Usage: python -m pytest tests (or python -m unittest discover tests)"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import edubot_hintserver_db as db
+
+
+def emaItem(i: int) -> dict:
+    return {"id": i, "nazev": f"n{i}", "popis": "p", "typ": ["video"], "datum_posledni_zmeny": "2022-01-01T00:00:00+01:00"}
+
+
+class SyncAllTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stateDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.stateDir)
+        self.lock = threading.Lock()
+        self.posts = []  # (core, docs, batch size, write pool)
+        self.failingTypes = {"clanky"}
+        self.patch("fetchPage", self.fetchPage)
+        self.patch("postDocs", self.postDocs)
+        self.patch("commit", lambda coreName: None)
+
+    def patch(self, name: str, value):
+        original = getattr(db, name)
+        setattr(db, name, value)
+        self.addCleanup(setattr, db, name, original)
+
+    def fetchPage(self, typeName: str, page: int, perPage: int, lastChanged: str, limiter=None) -> dict:
+        if limiter is not None:
+            limiter.acquire()
+        if typeName in self.failingTypes:
+            raise Exception(f"export of {typeName} is down")
+        count = 120
+        return {"all_results_count": count, "results": [emaItem(i) for i in range((page - 1) * perPage, min(page * perPage, count))]}
+
+    def postDocs(self, coreName: str, docs: list, commitWithinMs: int, timeout: float, batchSize, pool=None):
+        with self.lock:
+            self.posts.append((coreName, len(docs), batchSize, pool))
+
+    def syncAll(self, sources: list[str], **options) -> str:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+            db.syncAll(sources, 0, "1900-01-01", 2, stateDir=self.stateDir, lemmatizeUrl=None, facetSnapshotDir=None,
+                       perPage=50, **options)
+        return out.getvalue()
+
+    def test_failed_source_does_not_stop_the_others(self):
+        out = io.StringIO()
+        with self.assertRaisesRegex(Exception, "Sync of clanky failed"), contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+            db.syncAll(["ema", "clanky", "ema_only"], 0, "1900-01-01", 2, stateDir=self.stateDir, lemmatizeUrl=None,
+                       facetSnapshotDir=None, perPage=50)
+        docsByCore = {}
+        for coreName, docs, _, _ in self.posts:
+            docsByCore[coreName] = docsByCore.get(coreName, 0) + docs
+        self.assertEqual(docsByCore, {db.CORE_NAME_MASTER: 120, db.CORE_NAME_EMA: 120})
+        report = [line.split() for line in out.getvalue().splitlines() if line.split()[:1] in [["ema"], ["clanky"], ["ema_only"]]]
+        self.assertEqual([(row[0], row[2]) for row in report if len(row) > 5], [("ema", "120"), ("clanky", "-"), ("ema_only", "120")])
+        self.assertIn("failed: export of clanky is down", out.getvalue())
+
+    def test_core_shares_write_pool_and_batch_size(self):
+        calls = []
+
+        def sync(lastChanged, sourceDb, **options):
+            with self.lock:
+                calls.append((sourceDb, options))
+            return 1
+
+        self.patch("sync", sync)
+        self.syncAll(["ema", "clanky", "dum", "ema_only"])
+        options = dict(calls)
+        for name in ["writePool", "batchSize", "combinedProgress", "exportLimiter"]:
+            self.assertIs(options["ema"][name], options["dum"][name])
+            self.assertIs(options["ema"][name], options["clanky"][name])
+        self.assertIsNot(options["ema"]["writePool"], options["ema_only"]["writePool"])
+        self.assertIsNot(options["ema"]["batchSize"], options["ema_only"]["batchSize"])
+        self.assertIs(options["ema"]["combinedProgress"], options["ema_only"]["combinedProgress"])
+
+    def test_report_survives_a_thread_dying_without_result(self):
+        def sync(lastChanged, sourceDb, **options):
+            if sourceDb == "dum":
+                raise SystemExit()  # not an Exception, so not caught by the source's thread
+            return 5
+
+        self.patch("sync", sync)
+        originalHook = threading.excepthook
+        threading.excepthook = lambda args: None
+        self.addCleanup(setattr, threading, "excepthook", originalHook)
+        out = io.StringIO()
+        with self.assertRaisesRegex(Exception, "Sync of dum failed"), contextlib.redirect_stdout(out):
+            db.syncAll(["ema", "dum"], 0, "1900-01-01", 2, stateDir=self.stateDir)
+        self.assertIn("failed: no result", out.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
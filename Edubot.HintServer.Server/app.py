@@ -3,12 +3,23 @@ import traceback
 import hint_server.models as models
 import hint_server.logic as logic
 import hint_server.config as config
+import hint_server.metrics as metrics
+import hint_server.warmup as warmup
+from hint_server.deadline import Deadline
+from hint_server.admission import AdmissionRejectedError, PRIORITY_CHEAP
+from hint_server.slow_log import RequestTrace
 import argparse
+import contextlib
 import logging
+import sys
+from typing import ContextManager, Optional
 
 app = Flask(__name__)
 app.json_encoder = models.ApiModelJSONEncoder
 
+# Header through which clients can override the configured request deadline
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+
 def errorPage(error: str, code: int):
     return render_template("error.html", error=error), code
 
@@ -20,6 +31,25 @@ def error500(error):
 def error404(error):
     return errorPage(error, 404)
 
+def rejectedPage(ex: AdmissionRejectedError):
+    return render_template("error.html", error=ex.reason), ex.status, {"Retry-After": str(ex.retryAfter)}
+
+def admit(clientKey: Optional[str], priority: int, deadline: Deadline) -> ContextManager:
+    """Wait for a processing slot from the admission controller, if it's enabled."""
+    controller = logic.getOrCreateAdmissionController(config.config)
+    if controller is None:
+        return contextlib.nullcontext()
+    return controller.admit(clientKey or request.remote_addr, priority, deadline)
+
+def requestDeadline() -> Deadline:
+    defaultConfig = config.config.defaultConfiguration
+    budgetMs = models.getNumberFromDict(request.headers, DEADLINE_HEADER, int)
+    if budgetMs is None:
+        budgetMs = defaultConfig.requestDeadlineMs
+    if budgetMs is not None and budgetMs <= 0:  # null or 0: no deadline
+        budgetMs = None
+    return Deadline(budgetMs, defaultConfig.degradeMinBudgetsMs)
+
 @app.route("/api")
 def api():
     if config.config is None: return errorPage(config.error_description, 500)
@@ -28,26 +58,75 @@ def api():
 @app.route("/search", methods = ["POST"])
 def search():
     if config.config is None: return errorPage(config.error_description, 500)
+    trace = RequestTrace("search")
     try:
         searchRequest = models.SearchRequest(request.get_json())
-        searchResponse = logic.search(searchRequest, config.config)
+        deadline = requestDeadline()
+        with admit(searchRequest.userId, logic.searchPriority(searchRequest, config.config), deadline):
+            trace.addStage("admission", trace.elapsedMs())
+            searchResponse = logic.search(searchRequest, config.config, deadline, trace)
+        trace.details["degradedStages"] = searchResponse.degradedStages
         return jsonify(searchResponse)
+    except AdmissionRejectedError as ex:
+        trace.details["rejected"] = ex.reason
+        return rejectedPage(ex)
     except:
         error = traceback.format_exc()
         print(error)
+        trace.details["error"] = error.splitlines()[-1]
         return errorPage(error, 500)
+    finally:
+        logic.recordTrace(trace, config.config)
 
 @app.route("/hint", methods = ["POST"])
 def hint():
     if config.config is None: return errorPage(config.error_description, 500)
+    trace = RequestTrace("hint")
     try:
         hintRequest = models.HintRequest(request.get_json())
-        hintResponse = logic.hint(hintRequest, config.config)
+        deadline = requestDeadline()
+        with admit(None, PRIORITY_CHEAP, deadline):
+            trace.addStage("admission", trace.elapsedMs())
+            hintResponse = logic.hint(hintRequest, config.config, trace, deadline)
+        trace.details["degradedStages"] = hintResponse.degradedStages
         return jsonify(hintResponse)
+    except AdmissionRejectedError as ex:
+        trace.details["rejected"] = ex.reason
+        return rejectedPage(ex)
     except:
         error = traceback.format_exc()
         print(error)
+        trace.details["error"] = error.splitlines()[-1]
         return errorPage(error, 500)
+    finally:
+        logic.recordTrace(trace, config.config)
+
+@app.route("/suggest", methods = ["POST"])
+def suggest():
+    if config.config is None: return errorPage(config.error_description, 500)
+    try:
+        suggestRequest = models.SuggestRequest(request.get_json())
+        suggestResponse = logic.suggest(suggestRequest, config.config)
+        return jsonify(suggestResponse)
+    except:
+        error = traceback.format_exc()
+        print(error)
+        return errorPage(error, 500)
+
+@app.route("/ready")
+def ready():
+    if config.config is None: return errorPage(config.error_description, 503)
+    status = warmup.getStatus()
+    return jsonify(status), 200 if status["state"] == "done" else 503
+
+@app.route("/metrics")
+def metricsReport():
+    return jsonify(metrics.snapshot())
+
+@app.route("/shadow-report")
+def shadowReport():
+    if config.config is None: return errorPage(config.error_description, 500)
+    return jsonify(logic.shadowReport(config.config))
 
 #@app.route("/redirect", methods = ["POST"])
 #def redirect():
@@ -68,14 +147,29 @@ def catch_all(path):
     return abort(404, "Not found")
 
 if __name__ == '__main__':
-    config.readAndValidateConfig("app.config.json")
     ap = argparse.ArgumentParser()
+    ap.add_argument('command', nargs='?', default='serve', choices=['serve', 'compile-config'],
+                    help='Run the server, or validate the config & save it as a compiled snapshot for fast startup')
     ap.add_argument('--port', default=8000, type=int, help='Port to run on')
     ap.add_argument('--debug', action='store_true', help='Enable flask debug mode')
+    ap.add_argument('--config-snapshot', metavar='PATH',
+                    help='Compiled config snapshot to write (compile-config) or to load if up to date (serve); by default none is used')
     args = ap.parse_args()
 
     logging.basicConfig(format='%(asctime)s:%(levelname)s - %(message)s', level=logging.DEBUG if args.debug else logging.INFO)
 
+    if args.command == 'compile-config':
+        if args.config_snapshot is None:
+            ap.error('compile-config needs --config-snapshot')
+        if not config.compileConfig("app.config.json", args.config_snapshot):
+            print(config.error_description)
+            sys.exit(1)
+        sys.exit(0)
+
+    config.loadConfig("app.config.json", args.config_snapshot)
+    if config.config is not None:
+        warmup.startWarmUp(config.config)
+
     if False: # TEMP
         from waitress import serve
         serve(app, host="0.0.0.0", port=8000)
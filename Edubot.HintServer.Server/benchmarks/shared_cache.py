@@ -0,0 +1,60 @@
+"""Overhead of shared cache reads: time of a hit compared with decoding the value, which a hit needs anyway.
+
+Usage: python benchmarks/shared_cache.py [--entries N] [--repeat N]
+
+Values are JSON bytes of the sizes of cached lemmatizations (~200 B) and trimmed Solr responses (~20 kB)."""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from hint_server.shared_cache import SharedCache
+
+
+def value(size: int, rng: random.Random) -> bytes:
+    facets = {}
+    while len(json.dumps(facets)) < size:
+        facets[f"hodnota {rng.randrange(10 ** 6)}"] = rng.randrange(1000)
+    return json.dumps({"response": {"numFound": 42}, "facets": facets}, ensure_ascii=False).encode("utf-8")
+
+
+def best(run, repeat: int) -> float:
+    """Best time of one run (s)."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--entries", type=int, default=1000, help="Number of entries of each size in the cache")
+    ap.add_argument("--repeat", type=int, default=5, help="Number of timed runs (best one is reported)")
+    args = ap.parse_args()
+
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as directory:
+        cache = SharedCache(os.path.join(directory, "shared.sqlite"), maxBytes=256 << 20)
+        print(f"{'value':>10} {'get':>10} {'json.loads':>10}")
+        for size in [200, 20000]:
+            values = {f"{size}-{i}": value(size, rng) for i in range(args.entries)}
+            for i, (key, data) in enumerate(values.items()):
+                cache.put("bench", key, data)
+                if i % 100 == 99:
+                    cache.flush()  # don't overflow the write queue
+            cache.flush()
+            keys = list(values)
+            getTime = best(lambda: [cache.get("bench", key) for key in keys], args.repeat) / len(keys)
+            decodeTime = best(lambda: [json.loads(values[key]) for key in keys], args.repeat) / len(keys)
+            print(f"{len(values[keys[0]]):>9}B {getTime * 1e6:>8.1f}us {decodeTime * 1e6:>8.1f}us")
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Compare a selective Solr response decoder with json.load: time & peak memory.
+
+Usage: python benchmarks/solr_decoder.py [recorded-response.json ...]
+
+Without arguments, synthetic responses shaped like recorded stats.facet responses are generated:
+10 documents and stats facets of the hint fields with per-value statistics.
+
+The selective decoder builds only the parts of a response the hint engine uses. It still needs the whole
+body as text: a pure Python incremental tokenizer, reading keys as bytes arrive, was ~10x slower than
+json.load. Even so it's slower than json.load (e.g. 38ms vs 21ms on a 1.3MB response), saving only the
+memory of a short-lived object that is trimmed before caching anyway, so the Solr pool uses json.loads."""
+import argparse
+import io
+import json
+import os
+import random
+import re
+import time
+import tracemalloc
+from typing import Any, BinaryIO, Union
+
+# Paths of a Solr select response the hint engine uses: key -> subtree of wanted keys, or True to keep the
+# whole value; "*" matches any key. Everything else (documents, facet statistics other than counts) is skipped.
+SOLR_RESPONSE_PATHS = {
+    "responseHeader": {"QTime": True},
+    "response": {"numFound": True},
+    "stats": {"stats_fields": {"*": {"facets": {"*": {"*": {"count": True}}}}}},
+    "facet_counts": {"facet_fields": True},
+}
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+# runs of characters that are neither strings nor brackets, i.e. the boring parts of a skipped value
+SKIPPABLE = re.compile(r'[^"{}\[\]]+')
+SCALAR = re.compile(r'[^,:{}\[\]\s]+')
+
+decoder = json.JSONDecoder()
+
+
+class SelectiveDecoder:
+    """JSON decoder building only the given paths of the document.
+
+    Values off the paths are skipped by scanning for their end, without creating any objects for them.
+    Objects of which only some plain keys are wanted (e.g. facet counts without the other statistics)
+    are decoded by the C decoder one by one and projected right away, so they never pile up."""
+
+    def __init__(self, paths: dict):
+        self.paths = paths
+
+    def load(self, stream: BinaryIO) -> Any:
+        return self.loads(stream.read())
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        text = data.decode("utf-8") if isinstance(data, bytes) else data
+        try:
+            value, end = self._value(text, WHITESPACE.match(text, 0).end(), self.paths)
+        except (IndexError, AttributeError):  # ran out of data, or a string isn't terminated
+            raise json.JSONDecodeError("Unexpected end of data", text, len(text))
+        if WHITESPACE.match(text, end).end() != len(text):
+            raise json.JSONDecodeError("Extra data", text, end)
+        return value
+
+    def _value(self, text: str, pos: int, paths: Union[dict, bool]) -> tuple[Any, int]:
+        if paths is True or text[pos] != "{":
+            return decoder.raw_decode(text, pos)
+        if isProjection(paths):
+            obj, pos = decoder.raw_decode(text, pos)
+            return project(obj, paths), pos
+        if len(paths) == 1 and isProjection(paths.get("*")):
+            # e.g. the values of a facet field: decoded together (a single field at a time) and projected
+            obj, pos = decoder.raw_decode(text, pos)
+            return {key: project(value, paths["*"]) for key, value in obj.items()}, pos
+
+        obj = {}
+        pos = WHITESPACE.match(text, pos + 1).end()
+        if text[pos] == "}":
+            return obj, pos + 1
+        while True:
+            keyMatch = STRING.match(text, pos)
+            if keyMatch is None:
+                raise json.JSONDecodeError("Expecting property name enclosed in double quotes", text, pos)
+            key = keyMatch.group(0)
+            key = json.loads(key) if "\\" in key else key[1:-1]
+            pos = WHITESPACE.match(text, keyMatch.end()).end()
+            if text[pos] != ":":
+                raise json.JSONDecodeError("Expecting ':' delimiter", text, pos)
+            pos = WHITESPACE.match(text, pos + 1).end()
+
+            subpaths = paths.get(key, paths.get("*"))
+            if subpaths is None:
+                pos = skipValue(text, pos)
+            else:
+                obj[key], pos = self._value(text, pos, subpaths)
+
+            pos = WHITESPACE.match(text, pos).end()
+            if text[pos] == "}":
+                return obj, pos + 1
+            if text[pos] != ",":
+                raise json.JSONDecodeError("Expecting ',' delimiter", text, pos)
+            pos = WHITESPACE.match(text, pos + 1).end()
+
+
+def isProjection(paths: Union[dict, bool, None]) -> bool:
+    """Whether the paths select just some plain keys of an object."""
+    return isinstance(paths, dict) and "*" not in paths and all(subpaths is True for subpaths in paths.values())
+
+
+def project(obj: Any, keys: dict) -> Any:
+    return {key: obj[key] for key in keys if key in obj} if isinstance(obj, dict) else obj
+
+
+def skipValue(text: str, pos: int) -> int:
+    """Position right after the JSON value starting at the given position."""
+    char = text[pos]
+    if char == '"':
+        return STRING.match(text, pos).end()
+    if char not in "{[":
+        return SCALAR.match(text, pos).end()  # number, true, false, null
+
+    depth = 0
+    while True:
+        char = text[pos]
+        if char == '"':
+            pos = STRING.match(text, pos).end()
+        elif char in "{[":
+            depth += 1
+            pos += 1
+        elif char in "}]":
+            depth -= 1
+            pos += 1
+            if depth == 0:
+                return pos
+        else:
+            pos = SKIPPABLE.match(text, pos).end()
+
+
+
+def syntheticResponse(valuesPerField: int, rows: int = 10) -> bytes:
+    rng = random.Random(valuesPerField)
+    words = ["pracovní", "list", "matematika", "základní", "vzdělávání", "čeština", "video", "úloha", "zlomky"]
+
+    def text(n: int) -> str:
+        return " ".join(rng.choice(words) for _ in range(n))
+
+    def stats(count: int) -> dict:
+        return {"min": "1", "max": str(count * 7), "count": count, "missing": 0, "distinctValues": list(range(count % 5)),
+                "countDistinct": count % 5, "sum": count * 3.5, "sumOfSquares": count * 12.25, "mean": 3.5, "stddev": 0.0}
+
+    fields = ["stupen_vzdelavani", "rocnik", "typ", "jazyk", "licence", "dostupnost", "obor_vzdelavani"]
+    response = {
+        "responseHeader": {"status": 0, "QTime": 42, "params": {"q": text(20), "rows": str(rows), "wt": "json"}},
+        "response": {"numFound": 12345, "start": 0, "maxScore": 12.5, "docs": [
+            {"id": str(i), "nazev": text(6), "popis": text(120), "popis_lemmatized": text(120), "klicova_slova": text(8).split(),
+             "url": f"https://example.org/{i}", "celkova_reputace": rng.random(), "score": rng.random() * 10}
+            for i in range(rows)]},
+        "stats": {"stats_fields": {"id": {"min": "1", "max": "99999", "count": 12345, "missing": 0, "facets": {
+            field: {f"{text(2)} {i}": stats(rng.randint(1, 1000)) for i in range(valuesPerField)} for field in fields}}}},
+    }
+    return json.dumps(response, ensure_ascii=False).encode("utf-8")
+
+
+def measure(decode, data: bytes, repeat: int) -> tuple[float, int, int]:
+    """Best time of one decode (s), peak memory allocated by it and memory held by the result (bytes)."""
+    best = None
+    for _ in range(repeat):
+        stream = io.BytesIO(data)
+        started = time.perf_counter()
+        decode(stream)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    stream = io.BytesIO(data)
+    tracemalloc.start()
+    result = decode(stream)
+    kept, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return best, peak, kept
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("responses", nargs="*", help="Files with recorded Solr responses")
+    ap.add_argument("--repeat", type=int, default=20, help="Number of timed runs per decoder (best one is reported)")
+    args = ap.parse_args()
+
+    if args.responses:
+        inputs = [(os.path.basename(path), open(path, "rb").read()) for path in args.responses]
+    else:
+        inputs = [(f"synthetic, {n} values/field", syntheticResponse(n)) for n in [10, 100, 1000]]
+
+    selective = SelectiveDecoder(SOLR_RESPONSE_PATHS)
+    print(f"{'':43} {'json.load':^32} {'selective':^32}")
+    print(f"{'response':32} {'size':>10} " + f"{'time':>10} {'peak':>10} {'result':>10} " * 2)
+    for name, data in inputs:
+        results = [measure(decode, data, args.repeat) for decode in [json.load, selective.load]]
+        print(f"{name:32} {len(data) / 1024:8.0f}kB " + "".join(
+            f"{elapsed * 1000:8.2f}ms {peak / 1024:8.0f}kB {kept / 1024:8.0f}kB " for elapsed, peak, kept in results))
+
+
+if __name__ == "__main__":
+    main()
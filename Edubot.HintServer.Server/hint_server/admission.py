@@ -0,0 +1,149 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import hint_server.metrics as metrics
+from hint_server.deadline import Deadline
+
+# Priority classes, served in this order when requests have to queue
+PRIORITY_CHEAP = 0  # /hint, searches answered from sessions or precomputed facets
+PRIORITY_EXPENSIVE = 1  # everything else
+PRIORITY_NAMES = {PRIORITY_CHEAP: "cheap", PRIORITY_EXPENSIVE: "expensive"}
+
+
+class AdmissionRejectedError(Exception):
+    """Request rejected before processing; to be answered with the given HTTP status & Retry-After."""
+
+    def __init__(self, status: int, retryAfter: float, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.retryAfter = max(1, math.ceil(retryAfter))
+        self.reason = reason
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updatedAt = now
+
+    def take(self, now: float) -> float:
+        """Take a token; return 0 if there was one, or the time until there is one."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updatedAt) * self.rate)
+        self.updatedAt = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionTicket:
+    """Slot of an admitted request, released when the request is done (use as a context manager)."""
+
+    def __init__(self, controller: "AdmissionController", priority: int):
+        self.controller = controller
+        self.priority = priority
+        self.startedAt = time.monotonic()
+
+    def __enter__(self) -> "AdmissionTicket":
+        return self
+
+    def __exit__(self, *exc):
+        self.controller._release(self)
+
+
+class AdmissionController:
+    """Caps requests processed at once; the rest wait in a bounded priority queue.
+
+    A request is rejected right away (503) if the queue is full or if its expected wait, estimated from
+    the queue ahead of it & the average service time, exceeds the maximum queue wait or its deadline,
+    whichever is shorter; it's also rejected if that time passes while queued. Each client (user ID or IP)
+    is rate-limited by a token bucket (429)."""
+
+    def __init__(self, maxInFlight: int, maxQueueDepth: int, ratePerSecond: Optional[float], burst: float,
+                 maxQueueWaitMs: int = 2000, maxClients: int = 10000):
+        self.maxInFlight = maxInFlight
+        self.maxQueueDepth = maxQueueDepth
+        self.maxQueueWait = maxQueueWaitMs / 1000
+        self.ratePerSecond = ratePerSecond
+        self.burst = burst
+        self.maxClients = maxClients
+        self.lock = threading.Lock()
+        self.inFlight = 0
+        self.waiting: list[tuple[int, int, threading.Event]] = []  # heap of (priority, arrival, wakeup)
+        self.arrivals = itertools.count()
+        self.serviceTime = {priority: None for priority in PRIORITY_NAMES}  # moving averages in seconds
+        self.buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+
+    def admit(self, clientKey: Optional[str], priority: int, deadline: Deadline) -> AdmissionTicket:
+        """Wait for a processing slot; raise AdmissionRejectedError if the request should be shed."""
+        with self.lock:
+            now = time.monotonic()
+            if clientKey and self.ratePerSecond:
+                retryAfter = self._bucket(clientKey, now).take(now)
+                if retryAfter > 0:
+                    metrics.increment("admission.rateLimited")
+                    raise AdmissionRejectedError(429, retryAfter, f"Rate limit exceeded for {clientKey}")
+
+            if self.inFlight < self.maxInFlight and not self.waiting:
+                self.inFlight += 1
+                return AdmissionTicket(self, priority)
+
+            if len(self.waiting) >= self.maxQueueDepth:
+                metrics.increment("admission.queueFull")
+                raise AdmissionRejectedError(503, self._expectedWait(self.waiting), "Server is overloaded (queue full)")
+            expectedWait = self._expectedWait([waiter for waiter in self.waiting if waiter[0] <= priority])
+            remaining = deadline.remaining()
+            maxWait = self.maxQueueWait if remaining is None else min(remaining, self.maxQueueWait)
+            if expectedWait > maxWait:
+                metrics.increment("admission.overloaded")
+                raise AdmissionRejectedError(503, expectedWait, f"Server is overloaded (expected wait {expectedWait:.2f} s)")
+
+            waiter = (priority, next(self.arrivals), threading.Event())
+            heapq.heappush(self.waiting, waiter)
+
+        # the slot is handed over by a releasing request (inFlight is not decremented in between)
+        if not waiter[2].wait(maxWait):
+            with self.lock:
+                if not waiter[2].is_set():
+                    self.waiting.remove(waiter)
+                    heapq.heapify(self.waiting)
+                    metrics.increment("admission.expiredInQueue")
+                    raise AdmissionRejectedError(503, self._expectedWait(self.waiting), "Server is overloaded (waited too long in queue)")
+        metrics.observe("admission.queueWait", time.monotonic() - now)
+        return AdmissionTicket(self, priority)
+
+    def _release(self, ticket: AdmissionTicket):
+        serviceTime = time.monotonic() - ticket.startedAt
+        with self.lock:
+            average = self.serviceTime[ticket.priority]
+            self.serviceTime[ticket.priority] = serviceTime if average is None else 0.9 * average + 0.1 * serviceTime
+            if self.waiting:
+                heapq.heappop(self.waiting)[2].set()
+            else:
+                self.inFlight -= 1
+
+    def _expectedWait(self, ahead: list[tuple[int, int, threading.Event]]) -> float:
+        """Expected queueing time behind the given waiters, all slots being busy (one of them has to free up first)."""
+        known = [average for average in self.serviceTime.values() if average is not None]
+        if not known:
+            return 0.0
+        mean = sum(known) / len(known)
+        averages = {priority: mean if average is None else average for priority, average in self.serviceTime.items()}
+        work = mean + sum(averages[priority] for priority, _, _ in ahead)
+        return work / self.maxInFlight
+
+    def _bucket(self, clientKey: str, now: float) -> TokenBucket:
+        bucket = self.buckets.get(clientKey)
+        if bucket is None:
+            bucket = TokenBucket(self.ratePerSecond, self.burst, now)
+            self.buckets[clientKey] = bucket
+            if len(self.buckets) > self.maxClients:
+                self.buckets.popitem(last=False)
+        self.buckets.move_to_end(clientKey)
+        return bucket
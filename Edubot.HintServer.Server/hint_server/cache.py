@@ -0,0 +1,41 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import hint_server.metrics as metrics
+
+
+class LruCache:
+    """Thread-safe LRU cache with an optional TTL; hits & misses are counted in metrics under the given name."""
+
+    def __init__(self, name: str, maxEntries: int, ttlSeconds: Optional[float] = None):
+        self.name = name
+        self.maxEntries = maxEntries
+        self.ttlSeconds = ttlSeconds
+        self.entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttlSeconds is not None and now - entry[0] > self.ttlSeconds:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                metrics.increment(f"{self.name}.misses")
+                return None
+            self.entries.move_to_end(key)
+        metrics.increment(f"{self.name}.hits")
+        return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -1,11 +1,98 @@
+import hashlib
+import importlib
+import io
 import json
-from typing import Any
+import logging
+import os
+import pickle
+import sys
+import types
+from typing import Any, Optional
 
+import hint_server.logic as logic
 from hint_server.models import AppConfiguration
+from hint_server.suggest import SuggestIndex
+from hint_server.url_template import UrlTemplate
 
 config = None
 error_description = None
 
+# Version of the compiled config snapshot format; bump it when code outside the hashed modules changes
+# how the precomputed structures are computed
+SNAPSHOT_VERSION = 3
+
+
+class ModuleRecordingPickler(pickle.Pickler):
+    """Pickler recording the hint_server modules of the classes & functions of pickled objects."""
+
+    def __init__(self, file, protocol: int):
+        super().__init__(file, protocol)
+        self.modules = set()
+
+    def reducer_override(self, obj):
+        # classes & functions are pickled by reference to their module, other objects by their class
+        module = obj.__module__ if isinstance(obj, (type, types.FunctionType)) else type(obj).__module__
+        if module and module.split(".")[0] == "hint_server":
+            self.modules.add(module)
+        return NotImplemented
+
+
+def sourceHashes(path: str, modules: list[str]) -> dict[str, Any]:
+    """Hashes of everything a compiled snapshot depends on: the JSON config, the given modules & Python version."""
+    with open(path, "rb") as file:
+        configHash = hashlib.sha256(file.read()).hexdigest()
+    moduleHashes = {}
+    for name in modules:
+        with open(importlib.import_module(name).__file__, "rb") as file:
+            moduleHashes[name] = hashlib.sha256(file.read()).hexdigest()
+    return {"version": SNAPSHOT_VERSION, "config": configHash, "modules": moduleHashes, "python": sys.version}
+
+
+def compileConfig(path: str, snapshotPath: str) -> bool:
+    """Validate the JSON config and save it with all precomputed structures as a binary snapshot.
+
+    The snapshot starts with the hashes of its sources: the modules of all pickled objects' classes,
+    the module computing the precomputed structures, the JSON config & Python version."""
+    readAndValidateConfig(path)
+    if config is None:
+        return False
+
+    for collectionObj in config.collections.values():
+        logic.precompute(collectionObj)
+
+    data = io.BytesIO()
+    pickler = ModuleRecordingPickler(data, protocol=pickle.HIGHEST_PROTOCOL)
+    pickler.dump(config)
+    modules = sorted(pickler.modules | {logic.precompute.__module__})
+    with open(snapshotPath + ".tmp", "wb") as file:
+        pickle.dump(sourceHashes(path, modules), file, protocol=pickle.HIGHEST_PROTOCOL)
+        file.write(data.getbuffer())
+    os.replace(snapshotPath + ".tmp", snapshotPath)
+    return True
+
+
+def loadConfig(path: str, snapshotPath: Optional[str] = None):
+    """Load the compiled config snapshot if given, or read the JSON config if there's none or it's stale."""
+    global config
+    global error_description
+
+    if snapshotPath is not None and os.path.exists(snapshotPath):
+        try:
+            with open(snapshotPath, "rb") as file:
+                sources = pickle.load(file)
+                if sources.get("version") == SNAPSHOT_VERSION and sources == sourceHashes(path, list(sources["modules"])):
+                    config = pickle.load(file)
+                    error_description = None
+                    logging.info(f"Loaded compiled config {snapshotPath}")
+                    return
+            logging.warning(f"Compiled config {snapshotPath} is stale, reading {path}")
+        except Exception:
+            logging.exception(f"Could not load compiled config {snapshotPath}, reading {path}")
+    elif snapshotPath is not None:
+        logging.warning(f"Compiled config {snapshotPath} doesn't exist, reading {path}")
+
+    readAndValidateConfig(path)
+
 def readAndValidateConfig(path: str):
     global config
     global error_description
@@ -55,6 +142,24 @@ def readAndValidateConfig(path: str):
 
         assert collectionObj.searchField in ["id", "code", "text"]
 
+        if collectionObj.solrReplicaUrls and not any(collectionObj.solrQueryUrlPattern.startswith(url) for url in collectionObj.solrReplicaUrls):
+            config = None
+            error_description = f"{collectionPath}/SolrQueryUrlPattern must start with one of {collectionPath}/SolrReplicaUrls"
+            return
+
+        shadowPattern = collectionObj.shadowSolrQueryUrlPattern
+        if shadowPattern and collectionObj.solrReplicaUrls and not any(shadowPattern.startswith(url) for url in collectionObj.solrReplicaUrls):
+            config = None
+            error_description = f"{collectionPath}/ShadowSolrQueryUrlPattern must start with one of {collectionPath}/SolrReplicaUrls"
+            return
+        if shadowPattern:
+            try:
+                UrlTemplate(shadowPattern)
+            except Exception as ex:
+                config = None
+                error_description = f"{collectionPath}/ShadowSolrQueryUrlPattern: {ex}"
+                return
+
         assert collectionObj.enumValues is not None
         for enumValueObj in collectionObj.enumValues:
             if isNone(enumValueObj.id, "Id"): return
@@ -63,6 +168,18 @@ def readAndValidateConfig(path: str):
             if isNone(enumValueObj.isUnknown, "IsUnknown"): return
             if isNone(enumValueObj.isNotRelevant, "IsNotRelevant"): return
 
+        # resolve keyword redirections right away, rejecting cycles, and lemmatize their targets
+        try:
+            logic.getOrCreateKeywordRedirections(collectionObj)
+            logic.getOrCreateRedirectionLemmas(collectionObj)
+        except Exception as ex:
+            config = None
+            error_description = f"{keywordsPath}: {ex}"
+            return
+
+        # build the typeahead index right away, so that the first suggestions are fast as well
+        collectionObj.precomputedSuggestIndex = SuggestIndex.fromCollection(collectionObj)
+
     assert config.defaultConfiguration is not None
     if config.defaultConfiguration.defaultCollection not in config.collections:
         config = None
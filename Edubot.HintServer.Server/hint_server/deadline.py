@@ -0,0 +1,51 @@
+import logging
+import socket
+import time
+import urllib.error
+import concurrent.futures
+from typing import Optional
+
+# Stages that can be degraded and the minimum remaining budget (ms) each needs to run
+DEFAULT_MIN_BUDGETS_MS = {
+    "lemmatize": 100,  # otherwise search with plain text
+    "detection": 10,  # otherwise skip keyword detection & redirection
+    "solr": 50,  # otherwise return the response without hints
+    "backoff": 200,  # otherwise skip the zero-hit rerun without detection
+}
+
+
+class Deadline:
+    """Time budget of one request, with a record of stages degraded to stay within it."""
+
+    def __init__(self, budgetMs: Optional[int], minBudgetsMs: Optional[dict[str, int]] = None):
+        self.expiresAt = None if budgetMs is None else time.monotonic() + budgetMs / 1000
+        self.minBudgetsMs = dict(DEFAULT_MIN_BUDGETS_MS, **(minBudgetsMs or {}))
+        self.degradedStages: list[str] = []
+
+    def remaining(self) -> Optional[float]:
+        """Remaining time in seconds, None if there's no deadline."""
+        return None if self.expiresAt is None else self.expiresAt - time.monotonic()
+
+    def timeout(self) -> Optional[float]:
+        """Remaining time usable as a socket timeout."""
+        remaining = self.remaining()
+        return None if remaining is None else max(remaining, 0.001)
+
+    def allows(self, stage: str) -> bool:
+        """Check that there's enough time left to run the given stage; mark it as degraded if not."""
+        remaining = self.remaining()
+        if remaining is None or remaining * 1000 >= self.minBudgetsMs.get(stage, 0):
+            return True
+        self.degrade(stage)
+        return False
+
+    def degrade(self, stage: str):
+        logging.debug(f"Deadline: degrading stage {stage}")
+        if stage not in self.degradedStages:
+            self.degradedStages.append(stage)
+
+
+def isTimeout(ex: Exception) -> bool:
+    if isinstance(ex, urllib.error.URLError):
+        return isinstance(ex.reason, socket.timeout)
+    return isinstance(ex, (socket.timeout, concurrent.futures.TimeoutError))
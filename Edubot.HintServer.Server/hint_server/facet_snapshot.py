@@ -0,0 +1,85 @@
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+from typing import Optional
+
+# Key of the entry with facets of the whole core
+WHOLE_CORE_KEY = ""
+
+
+def entryKey(field: Optional[str] = None, value: Optional[str] = None) -> str:
+    """Key of the snapshot entry for the whole core or for a single-value filter."""
+    return WHOLE_CORE_KEY if field is None else f"{field}\t{value}"
+
+
+class FacetSnapshot:
+    """Memory-mapped facet counts precomputed by the Db sync for the whole core & all single-value filters.
+
+    The file starts with a one-line JSON header (faceted fields & entry key -> [offset, length]), followed
+    by a compact JSON object {"numFound": N, "facets": {field: {value: count}}} per entry. The file is
+    replaced atomically after each sync; it's reopened when it changes, checked at most every checkInterval."""
+
+    def __init__(self, path: str, checkInterval: float = 5.0):
+        self.path = path
+        self.checkInterval = checkInterval
+        self.lock = threading.Lock()
+        self.checkedAt: Optional[float] = None
+        self.fileId = None
+        self.file = None
+        self.map: Optional[mmap.mmap] = None
+        self.fields: set[str] = set()
+        self.entries: dict[str, list[int]] = {}
+        self.dataStart = 0
+
+    def lookup(self, key: str, fields: list[str]) -> Optional[dict]:
+        """Get entry with the given key, if the snapshot has it & covers all the given fields."""
+        with self.lock:
+            self._refresh()
+            if self.map is None or key not in self.entries or not self.fields.issuperset(fields):
+                return None
+            offset, length = self.entries[key]
+            start = self.dataStart + offset
+            return json.loads(self.map[start:start + length])
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self.checkedAt is not None and now - self.checkedAt < self.checkInterval:
+            return
+        self.checkedAt = now
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._close()
+            return
+        fileId = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if fileId == self.fileId:
+            return
+        self._close()
+        try:
+            self.file = open(self.path, "rb")
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            headerEnd = self.map.find(b"\n")
+            header = json.loads(self.map[:headerEnd])
+        except Exception:
+            logging.exception(f"Could not open facet snapshot {self.path}")
+            self._close()
+            return
+        self.fields = set(header["fields"])
+        self.entries = header["entries"]
+        self.dataStart = headerEnd + 1
+        self.fileId = fileId
+        logging.info(f"Loaded facet snapshot {self.path} of {header.get('generatedAt')}, {len(self.entries)} entries")
+
+    def _close(self):
+        if self.map is not None:
+            self.map.close()
+        if self.file is not None:
+            self.file.close()
+        self.file = None
+        self.map = None
+        self.fileId = None
+        self.fields = set()
+        self.entries = {}
@@ -14,7 +14,7 @@ def generateSearchHints(enumValues: Optional[dict[str, list[str]]], notRelevantF
             specifiedFields[field] = True
 
     totalFound = int(solrResponse["response"]["numFound"])
-    facetObj = solrResponse["stats"]["stats_fields"][idField]["facets"]
+    facetObj = getFacets(solrResponse, collectionConfig)
     candidates = []
     unkIrrVals = getOrCreateUnkIrrVals(collectionConfig)
 
@@ -63,7 +63,7 @@ def generateWizardHints(enumValues: Optional[dict[str, list[str]]], notRelevantF
             specifiedFields[field] = True
 
     totalFound = int(solrResponse["response"]["numFound"])
-    facetObj = solrResponse["stats"]["stats_fields"][idField]["facets"]
+    facetObj = getFacets(solrResponse, collectionConfig)
     candidates = []
     unkIrrVals = getOrCreateUnkIrrVals(collectionConfig)
 
@@ -98,3 +98,22 @@ def generateWizardHints(enumValues: Optional[dict[str, list[str]]], notRelevantF
     candidates = sorted(candidates, key=lambda item: item[2])
 
     return list(map(lambda item: WizardHint(field=item[0], values=item[1]), candidates))
+
+
+def trimSolrResponse(solrResponse: SolrResponse, collectionConfig: CollectionConfiguration) -> SolrResponse:
+    """Keep only the parts of a Solr response that hints are generated from."""
+    idField = collectionConfig.idField
+    return {
+        "response": {"numFound": solrResponse["response"]["numFound"]},
+        "stats": {"stats_fields": {idField: {"facets": getFacets(solrResponse, collectionConfig)}}},
+    }
+
+
+def getFacets(solrResponse: SolrResponse, collectionConfig: CollectionConfiguration) -> dict[str, dict[str, dict]]:
+    """Get facet counts as field -> value -> {"count": N}, from either stats facets or (multi-select) facet fields."""
+    if "stats" in solrResponse:
+        return solrResponse["stats"]["stats_fields"][collectionConfig.idField]["facets"]
+
+    facetFields = solrResponse["facet_counts"]["facet_fields"]
+    return {field: {value: {"count": count} for value, count in values.items()}
+            for field, values in facetFields.items()}
@@ -0,0 +1,53 @@
+import json
+import logging
+import threading
+from urllib.request import urlopen
+from typing import Optional
+
+
+def indexVersionUrl(solrQueryUrl: str) -> str:
+    """URL of the replication handler's indexversion command of the core queried by the (pattern) URL."""
+    coreUrl = solrQueryUrl.split("?", 1)[0].rsplit("/", 1)[0]
+    return f"{coreUrl}/replication?command=indexversion&wt=json"
+
+
+class IndexGeneration:
+    """Generation of the Solr core's index (it changes with each commit), polled by a background thread
+    from each replica every checkInterval, so that reading it never waits for Solr.
+
+    The generation is known only if all replicas answered with the same one; while they differ (e.g. during
+    replication) or any of them can't be asked, it's None, as any of the replicas can answer a query."""
+
+    def __init__(self, urls: list[str], checkInterval: float = 30.0, timeout: float = 2.0):
+        self.urls = urls
+        self.checkInterval = checkInterval
+        self.timeout = timeout
+        self.generation: Optional[int] = None
+        self.stopped = threading.Event()
+        self.poller = threading.Thread(target=self._poll, name="index-generation", daemon=True)
+        self.poller.start()
+
+    def current(self) -> Optional[int]:
+        return self.generation
+
+    def close(self):
+        self.stopped.set()
+
+    def _poll(self):
+        while not self.stopped.is_set():
+            self.generation = self._fetch()
+            self.stopped.wait(self.checkInterval)
+
+    def _fetch(self) -> Optional[int]:
+        generations = set()
+        for url in self.urls:
+            try:
+                with urlopen(url, timeout=self.timeout) as connection:
+                    generations.add(int(json.load(connection)["generation"]))
+            except Exception:
+                logging.exception(f"Could not get index generation from {url}")
+                return None
+        if len(generations) != 1:
+            logging.info(f"Solr replicas are at different index generations {sorted(generations)}")
+            return None
+        return generations.pop()
@@ -0,0 +1,99 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional
+
+import hint_server.models as models
+import hint_server.metrics as metrics
+from hint_server.tagger import callTagger, tagBatch
+
+
+def lemmatize(urlPattern: Optional[str], text: str, timeout: Optional[float] = None) -> models.LemmatizedString:
+    """Lemmatize using Morphodita API, if URL is set up; produce alignment between original and lemmatized"""
+    if urlPattern:
+        # get the lemmatized version
+        tokens = callTagger(urlPattern, text, timeout)
+        return alignTokens(text, tokens)
+    else:
+        # backoff to no lemmatization
+        return models.LemmatizedString(plain=text, lemmatized=text)
+
+
+def lemmatizeAll(urlPattern: Optional[str], texts: list[str], timeout: Optional[float] = None) -> list[models.LemmatizedString]:
+    """Lemmatize several texts in one tagger call (if the URL is set up)."""
+    if not urlPattern:
+        return [lemmatize(None, text) for text in texts]
+    return [alignTokens(text, tokens) for text, tokens in zip(texts, tagBatch(urlPattern, texts, timeout))]
+
+
+def alignTokens(text: str, tokens: list[dict]) -> models.LemmatizedString:
+    """Build lemmatized text from tagged tokens & compute alignment between original and lemmatized"""
+    lemmatized = ''
+    alignment = [(0, 0)]
+    plain_pos = 0
+    for tok in tokens:
+        space = tok.get('space', '')
+        lemmatized = lemmatized + tok['lemma'] + space
+        plain_pos += len(tok['token']) + len(space)
+        alignment.append((len(lemmatized), plain_pos))
+    return models.LemmatizedString(plain=text, lemmatized=lemmatized, alignment=alignment)
+
+
+class LemmatizerBatcher:
+    """Collects concurrent lemmatization requests and sends them as one multi-sentence tagger call.
+
+    A batch is sent when it reaches maxBatchSize texts or its oldest text waited maxWaitMs. The tagger call
+    gets the remaining time of the latest request deadline in the batch (at most timeoutMs); texts whose
+    deadline passed while they were collected are not sent."""
+
+    def __init__(self, urlPattern: str, maxWaitMs: float, maxBatchSize: int, maxConcurrentBatches: int = 4, timeoutMs: int = 10000):
+        self.urlPattern = urlPattern
+        self.maxWait = maxWaitMs / 1000
+        self.maxBatchSize = maxBatchSize
+        self.timeout = timeoutMs / 1000
+        self.queue: queue.Queue = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=maxConcurrentBatches, thread_name_prefix="lemmatizer")
+        self.collector = threading.Thread(target=self._collect, name="lemmatizer-batcher", daemon=True)
+        self.collector.start()
+
+    def lemmatize(self, text: str, timeout: Optional[float] = None) -> models.LemmatizedString:
+        future = Future()
+        self.queue.put((text, future, None if timeout is None else time.monotonic() + timeout))
+        return future.result(timeout)
+
+    def _collect(self):
+        while True:
+            batch = [self.queue.get()]
+            sendAt = time.monotonic() + self.maxWait
+            while len(batch) < self.maxBatchSize:
+                remaining = sendAt - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.executor.submit(self._send, batch)
+
+    def _send(self, batch: list[tuple[str, Future, Optional[float]]]):
+        now = time.monotonic()
+        expired = [item for item in batch if item[2] is not None and item[2] <= now]
+        for _, future, _ in expired:
+            future.set_exception(FutureTimeoutError("Deadline passed before the lemmatizer was called"))
+        batch = [item for item in batch if item not in expired]
+        if not batch:
+            return
+        timeout = self.timeout
+        if all(expiresAt is not None for _, _, expiresAt in batch):
+            timeout = min(timeout, max(expiresAt for _, _, expiresAt in batch) - now)
+
+        metrics.increment("lemmatizer.batches")
+        metrics.observe("lemmatizer.batchSize", len(batch))
+        try:
+            parts = tagBatch(self.urlPattern, [text for text, _, _ in batch], timeout)
+            for (text, future, _), tokens in zip(batch, parts):
+                future.set_result(alignTokens(text, tokens))
+        except Exception as ex:
+            for _, future, _ in batch:
+                future.set_exception(ex)
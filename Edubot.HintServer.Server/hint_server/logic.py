@@ -1,16 +1,34 @@
-import json
 import re
+import json
 import logging
 import copy
-from urllib.request import urlopen
+import threading
 from urllib.parse import quote
-from typing import TypeVar, Optional
+from typing import Callable, TypeVar, Optional
 
 import hint_server.models as models
 from hint_server.model_mapping import downgradeSearchHint2EnumItem, downgradeWizardHint2EnumList
-from hint_server.hints import generateSearchHints, generateWizardHints
+from hint_server.hints import generateSearchHints, generateWizardHints, trimSolrResponse, getFacets, getOrCreateUnkIrrVals
+from hint_server.solr import SolrReplicaPool
+from hint_server.deadline import Deadline, isTimeout
+from hint_server.lemmatizer import lemmatize, lemmatizeAll, LemmatizerBatcher
+from hint_server.sessions import SearchSession, SessionStore
+from hint_server.facet_snapshot import FacetSnapshot, entryKey
+from hint_server.suggest import SuggestIndex
+from hint_server.admission import AdmissionController, PRIORITY_CHEAP, PRIORITY_EXPENSIVE
+from hint_server.cache import LruCache
+from hint_server.shared_cache import SharedCache
+from hint_server.url_template import UrlTemplate
+from hint_server.slow_log import RequestTrace, SlowRequestLog
+from hint_server.shadow_traffic import ShadowTraffic
+from hint_server.index_generation import IndexGeneration, indexVersionUrl
+import hint_server.metrics as metrics
 
 T = TypeVar("T")
+R = TypeVar("R", models.SearchResponse, models.HintResponse)
+
+# Guards the creation of runtime objects (pools, threads, caches), so that concurrent first requests share one
+runtimeLock = threading.RLock()
 
 
 def asNotNone(value: Optional[T]) -> T:
@@ -22,8 +40,12 @@ def defaultIfNone(value: Optional[T], defaultValue: T) -> T:
     return defaultValue if value is None else value
 
 
-def search(request: models.SearchRequest, config: models.AppConfiguration) -> models.SearchResponse:
+def search(request: models.SearchRequest, config: models.AppConfiguration, deadline: Optional[Deadline] = None,
+           trace: Optional[RequestTrace] = None) -> models.SearchResponse:
     originalRequest =  copy.copy(request) # store a copy of the original request if needed for backoff
+    deadline = defaultIfNone(deadline, Deadline(None))
+    trace = defaultIfNone(trace, RequestTrace("search"))
+    trace.details.setdefault("query", request.query)
     response = models.SearchResponse()
     response.originalQuery = request.query
 
@@ -33,21 +55,46 @@ def search(request: models.SearchRequest, config: models.AppConfiguration) -> mo
     collectionConfig = asNotNone(config.collections)[defaultCollection]
     hintingparams = getOrCreateSolrUrlParams(collectionConfig)
 
-    # prepare lemmatized text if lemmatizer URL is non-empty
-    lemmatized = lemmatize(collectionConfig.lemmatizeUrlPattern, request.query)
+    # Reuse lemmatization & detection of the user's previous search if only the enum filters changed
+    sessionStore = getOrCreateSessionStore(collectionConfig) if request.userId else None
+    session = sessionStore.get(request.userId) if sessionStore is not None else None
+    if session is not None and not session.matches(request):
+        session = None
+    if session is not None:
+        metrics.increment("sessions.hits")
+
+    # prepare lemmatized text if lemmatizer URL is non-empty (plain text if we're out of time)
+    lemmatized = None
+    if session is not None:
+        lemmatized = session.lemmatized
+    elif deadline.allows("lemmatize"):
+        try:
+            with trace.stage("lemmatize"):
+                lemmatized = lemmatizeQuery(collectionConfig, request.query, deadline.timeout())
+        except Exception as ex:
+            if not isTimeout(ex):
+                raise
+            deadline.degrade("lemmatize")
+    if lemmatized is None:
+        lemmatized = lemmatize(None, request.query)
     request.lemmatizedQuery = lemmatized.lemmatized
 
     # Conditionally redirect
     redirectResponse = None
-    if request.detectEnums is True or request.doRedirection is True:
-        redirectRequest = mapSearchRequestToRedirectRequest(request, lemmatized, collectionConfig)
-        redirectResponse = redirect(redirectRequest, collectionConfig)
-
-        if redirectResponse.anyDetection or redirectResponse.anyRedirection:
-            response.originalQuery = request.query
-            response.redirectedFromReducedQuery = None  # XXX not sure why this isn't actually used
-            response.redirectedFromEnumValues = []
-            request = addRedirectToResponse(request, redirectResponse, collectionConfig)
+    if session is not None:
+        redirectResponse = session.redirectResponse
+    elif (request.detectEnums is True or request.doRedirection is True) and deadline.allows("detection"):
+        with trace.stage("detection"):
+            redirectRequest = mapSearchRequestToRedirectRequest(request, lemmatized, collectionConfig)
+            redirectResponse = redirect(redirectRequest, collectionConfig, deadline)
+    if redirectResponse is not None and redirectResponse.anyDetection:
+        trace.details["detectedEnums"] = [f"{val.field}:{val.code}" for val in redirectResponse.detectedEnumValues or []]
+
+    if redirectResponse is not None and (redirectResponse.anyDetection or redirectResponse.anyRedirection):
+        response.originalQuery = request.query
+        response.redirectedFromReducedQuery = None  # XXX not sure why this isn't actually used
+        response.redirectedFromEnumValues = []
+        request = addRedirectToResponse(request, redirectResponse, collectionConfig)
 
     # Add redirected values to response
     if response.originalQuery is None:
@@ -66,32 +113,82 @@ def search(request: models.SearchRequest, config: models.AppConfiguration) -> mo
                          for item in request.enumValues
                          if item.isNotRelevant}
 
-    # Generate URL for Solr
-    url = formatUrl(collectionConfig.solrQueryUrlPattern, request.query, request.lemmatizedQuery,
-                    hintingparams, enumValues, notRelevantFields)
+    # Skip the query with detected enums if the same detection led to zero hits in the current index before
+    detectionKey = None
+    if session is None and redirectResponse is not None and redirectResponse.anyDetection:
+        detectionKey = getDetectionOutcomeKey(collectionConfig, request.lemmatizedQuery, enumValues, notRelevantFields)
+        if detectionKey is not None and getOrCreateDetectionNegativeCache(collectionConfig).get(detectionKey):
+            metrics.increment("detectionNegativeCache.savedSolrCalls")
+            originalRequest.detectEnums = False
+            trace.details["backoff"] = "negativeCache"
+            return search(originalRequest, config, deadline, trace)
 
-    # Call Solr
-    connection = urlopen(url)
-    solrResponse = json.load(connection)
+    # Generate URL for Solr
+    url = getOrCreateUrlTemplate(collectionConfig).format(request.query, request.lemmatizedQuery,
+                                                          hintingparams, enumValues, notRelevantFields)
+
+    # Call Solr (if we're out of time, return just the query analysis without any hints)
+    solrStats = None
+    if session is not None and session.solrUrl == url and session.solrResponse is not None:
+        solrResponse = session.solrResponse
+        metrics.increment("sessions.solrReused")
+    else:
+        solrResponse = lookupFacetSnapshot(collectionConfig, request.query, enumValues, notRelevantFields)
+    if solrResponse is None and deadline.allows("solr"):
+        try:
+            solrResponse = traceSolr(trace, lambda stats: querySolr(collectionConfig, url, deadline.timeout(), stats))
+            solrStats = trace.details["solr"][-1]
+        except Exception as ex:
+            if not isTimeout(ex):
+                raise
+            deadline.degrade("solr")
+    if solrResponse is None:
+        response.searchHints = [] if request.returnSearchHints is True else None
+        response.wizardHints = None
+        response.startIndex = 0
+        response.itemCount = 0
+        response.items: list[models.ResultItem] = []
+        response.totalCount = 0
+        response.dropdownValues: list[models.EnumCountList] = []
+        return setDegraded(response, deadline)
+
+    # Remember the analysis for the user's next refinement (unless degraded, which might not happen next time)
+    if sessionStore is not None and not deadline.degradedStages:
+        sessionStore.put(originalRequest.userId,
+                         SearchSession(originalRequest, lemmatized, redirectResponse, url,
+                                       trimSolrResponse(solrResponse, collectionConfig)))
 
     # If we made enum detection and then didn't find anything, back off & do search w/o detection, using the orig. request
-    if int(solrResponse["response"]["numFound"]) == 0 and redirectResponse is not None and redirectResponse.anyDetection:
+    if int(solrResponse["response"]["numFound"]) == 0 and detectionKey is not None:
+        getOrCreateDetectionNegativeCache(collectionConfig).put(detectionKey, True)
+    if int(solrResponse["response"]["numFound"]) == 0 and redirectResponse is not None and redirectResponse.anyDetection \
+            and deadline.allows("backoff"):
         originalRequest.detectEnums = False
-        return search(originalRequest, config)
+        trace.details["backoff"] = True
+        return search(originalRequest, config, deadline, trace)
 
     # Generate hints
-    if request.returnSearchHints is True:
-        candidates = generateSearchHints(enumValues, notRelevantFields, solrResponse, collectionConfig)
-        response.searchHints = [downgradeSearchHint2EnumItem(x, collectionConfig) for x in candidates]
-    else:
-        response.searchHints = None
+    trace.details["facetCardinalities"] = {field: len(values) for field, values in getFacets(solrResponse, collectionConfig).items()}
+    with trace.stage("hints"):
+        if request.returnSearchHints is True:
+            candidates = generateSearchHints(enumValues, notRelevantFields, solrResponse, collectionConfig)
+            response.searchHints = [downgradeSearchHint2EnumItem(x, collectionConfig) for x in candidates]
+        else:
+            response.searchHints = None
 
-    if request.returnWizardHints is True:
-        candidates = generateWizardHints(enumValues, notRelevantFields, solrResponse, collectionConfig)
-        if len(candidates) > 0:
-            response.wizardHints = downgradeWizardHint2EnumList(candidates[0], collectionConfig)
-    else:
-        response.wizardHints = None
+        if request.returnWizardHints is True:
+            candidates = generateWizardHints(enumValues, notRelevantFields, solrResponse, collectionConfig)
+            if len(candidates) > 0:
+                response.wizardHints = downgradeWizardHint2EnumList(candidates[0], collectionConfig)
+        else:
+            response.wizardHints = None
+
+    # Compare a sample of the queries that went to Solr with the shadow query pattern, if there is one
+    shadow = getOrCreateShadowTraffic(collectionConfig)
+    if shadow is not None and solrStats and not solrStats.get("cached") and shadow.sample():
+        query, lemmatizedQuery = request.query, request.lemmatizedQuery
+        shadow.mirror(lambda: compareShadowQuery(collectionConfig, shadow, query, lemmatizedQuery,
+                                                 enumValues, notRelevantFields, solrResponse, solrStats))
 
     # Not implemented
     response.startIndex = 0
@@ -100,10 +197,20 @@ def search(request: models.SearchRequest, config: models.AppConfiguration) -> mo
     response.totalCount = 0
     response.dropdownValues: list[models.EnumCountList] = []
 
+    return setDegraded(response, deadline)
+
+
+def setDegraded(response: R, deadline: Deadline) -> R:
+    response.degraded = len(deadline.degradedStages) > 0
+    response.degradedStages = list(deadline.degradedStages)
     return response
 
 
-def hint(request: models.HintRequest, config: models.AppConfiguration) -> models.HintResponse:
+def hint(request: models.HintRequest, config: models.AppConfiguration, trace: Optional[RequestTrace] = None,
+         deadline: Optional[Deadline] = None) -> models.HintResponse:
+    trace = defaultIfNone(trace, RequestTrace("hint"))
+    deadline = defaultIfNone(deadline, Deadline(None))
+    trace.details.setdefault("query", request.textValue)
     # Get collection
     defaultCollection = asNotNone(
         config.defaultConfiguration).defaultCollection
@@ -115,27 +222,54 @@ def hint(request: models.HintRequest, config: models.AppConfiguration) -> models
     notRelevantFields = request.notRelevantValues
 
     # Generate URL for Solr
-    url = formatUrl(collectionConfig.solrQueryUrlPattern, request.textValue, hintingparams, enumValues, notRelevantFields)
-
-    # Call Solr
-    connection = urlopen(url)
-    solrResponse = json.load(connection)
+    url = getOrCreateUrlTemplate(collectionConfig).format(request.textValue, None, hintingparams, enumValues, notRelevantFields)
+
+    # Call Solr, unless the facets are precomputed (if we're out of time, return no hints)
+    solrResponse = lookupFacetSnapshot(collectionConfig, request.textValue, enumValues, notRelevantFields)
+    if solrResponse is None and deadline.allows("solr"):
+        try:
+            solrResponse = traceSolr(trace, lambda stats: querySolr(collectionConfig, url, deadline.timeout(), stats))
+        except Exception as ex:
+            if not isTimeout(ex):
+                raise
+            deadline.degrade("solr")
+    if solrResponse is None:
+        hintResponse = models.HintResponse()
+        hintResponse.searchHints = []
+        hintResponse.wizardHints = []
+        return setDegraded(hintResponse, deadline)
 
     # Generate response with additional data
-    hintResponse = models.HintResponse()
-    hintResponse.searchHints = generateSearchHints(
-        enumValues, notRelevantFields, solrResponse, collectionConfig)
-    hintResponse.wizardHints = generateWizardHints(
-        enumValues, notRelevantFields, solrResponse, collectionConfig)
+    trace.details["facetCardinalities"] = {field: len(values) for field, values in getFacets(solrResponse, collectionConfig).items()}
+    with trace.stage("hints"):
+        hintResponse = models.HintResponse()
+        hintResponse.searchHints = generateSearchHints(
+            enumValues, notRelevantFields, solrResponse, collectionConfig)
+        hintResponse.wizardHints = generateWizardHints(
+            enumValues, notRelevantFields, solrResponse, collectionConfig)
 
-    return hintResponse
+    return setDegraded(hintResponse, deadline)
 
 
-def redirect(request: models.RedirectRequest, config: models.CollectionConfiguration) -> models.RedirectResponse:
+def suggest(request: models.SuggestRequest, config: models.AppConfiguration) -> models.SuggestResponse:
+    # Get collection
+    defaultCollection = asNotNone(
+        config.defaultConfiguration).defaultCollection
+    collectionConfig = asNotNone(config.collections)[defaultCollection]
+
+    entries = getOrCreateSuggestIndex(collectionConfig).suggest(defaultIfNone(request.prefix, ""), defaultIfNone(request.limit, 10))
+
+    response = models.SuggestResponse()
+    response.suggestions = [models.Suggestion(text=entry.text, enumType=entry.enumType, valueCode=entry.valueCode, keywordId=entry.keywordId)
+                            for entry in entries]
+    return response
+
+
+def redirect(request: models.RedirectRequest, config: models.CollectionConfiguration, deadline: Optional[Deadline] = None) -> models.RedirectResponse:
     response = models.RedirectResponse()
     evCode2Val = getOrCreateValueCodeToValueMapping(config)
 
-    matches = [(kw, kw.regex.search(request.lemmatized.lemmatized)) for kw in config.keywords if kw.isDetected and kw.regex]
+    matches = [(kw, getOrCreateKeywordRegex(kw).search(request.lemmatized.lemmatized)) for kw in config.keywords if kw.isDetected and kw.regex]
     enum_matches = [(kw, m) for kw, m in matches if m and kw.enumValueCode]
 
     # Detect
@@ -145,9 +279,8 @@ def redirect(request: models.RedirectRequest, config: models.CollectionConfigura
         reduced_text = request.lemmatized.plain
         reduced_lemmas = request.lemmatized.lemmatized
         enum_ret = []
-        # XXX if redirection is needed, we'd need to work with alignment as well here (& recompute everything properly)
         for kw, m in enum_matches:
-            reduced_text = reduced_text[:request.lemmatized.mapIndex(m.start())] + reduced_text[request.lemmatized.mapIndex(m.end()):]
+            reduced_text = reduced_text[:request.lemmatized.mapBoundary(m.start())] + reduced_text[request.lemmatized.mapBoundary(m.end()):]
             reduced_lemmas = reduced_lemmas[:m.start()] + reduced_lemmas[m.end():]
             enum_ret.append(evCode2Val.get(kw.enumValueCode))
         # set resulting values
@@ -164,24 +297,135 @@ def redirect(request: models.RedirectRequest, config: models.CollectionConfigura
         response.detectedNotRelevantValues = [field for field in request.notRelevantValues]
 
     # Redirect
-    if request.doRedirection is True:
-        pass  # TODO
+    redirections = getOrCreateKeywordRedirections(config)
+    redirect_matches = [(kw, m) for kw, m in matches if m and kw.id in redirections]
+    if request.doRedirection is True and redirect_matches and (deadline is None or deadline.allows("detection")):
+        # detection & redirection edits of the original text, applied in one pass over its alignment
+        targetLemmas = getOrCreateRedirectionLemmas(config)
+        edits = []
+        for kw, m in sorted([(kw, m) for kw, m in matches if m], key=lambda i: (i[1].start(), -i[1].end())):
+            if edits and m.start() < edits[-1][1]:
+                continue  # overlaps the previous match
+            target = redirections.get(kw.id)
+            if target is not None and target.enumValueCode:
+                # the target's value replaces the keyword's own one
+                edits.append((m.start(), m.end(), None, [target.enumValueCode], True))
+            elif target is not None and target.text:
+                edits.append((m.start(), m.end(), targetLemmas[target.id], [], True))
+            elif request.detectEnums is True and kw.enumValueCode:
+                edits.append((m.start(), m.end(), None, [kw.enumValueCode], False))
+        redirected = spliceLemmatized(request.lemmatized, [(start, end, replacement) for start, end, replacement, _, _ in edits])
+        # set resulting values
+        response.anyRedirection = any(edit[4] for edit in edits)
+        response.redirectedTextValue = redirected.plain.replace('  ', ' ').strip()
+        response.redirectedLemmatizedValue = redirected.lemmatized.replace('  ', ' ').strip()
+        response.redirectedEnumValues = [evCode2Val.get(code) for edit in edits for code in edit[3]] \
+            if response.anyDetection or response.anyRedirection else response.detectedEnumValues
+        response.redirectedNotRelevantValues = response.detectedNotRelevantValues
     else:
         response.anyRedirection = False
         response.redirectedTextValue = response.detectedTextValue
         response.redirectedEnumValues = response.detectedEnumValues
         response.redirectedLemmatizedValue = response.detectedLemmatizedValue
-        response.redirectedNotRelevantValues = response.redirectedNotRelevantValues
+        response.redirectedNotRelevantValues = response.detectedNotRelevantValues
 
     return response
 
 
+def spliceLemmatized(lemmatized: models.LemmatizedString,
+                     edits: list[tuple[int, int, Optional[models.LemmatizedString]]]) -> models.LemmatizedString:
+    """Replace the given sorted, non-overlapping (start, end) spans of the lemmatized text & the aligned parts
+    of the plain text with the given replacements (None removes the span), recomputing the alignment."""
+    plain, lemmas, alignment = [], [], [(0, 0)]
+    plainLength, lemmaLength = 0, 0
+
+    def append(part: models.LemmatizedString, start: int, end: int):
+        nonlocal plainLength, lemmaLength
+        plainStart, plainEnd = part.mapBoundary(start), part.mapBoundary(end)
+        for lemmaPos, plainPos in part.alignment or []:
+            if start < lemmaPos < end:
+                alignment.append((lemmaLength + lemmaPos - start, plainLength + plainPos - plainStart))
+        plain.append(part.plain[plainStart:plainEnd])
+        lemmas.append(part.lemmatized[start:end])
+        plainLength += plainEnd - plainStart
+        lemmaLength += end - start
+        if alignment[-1] != (lemmaLength, plainLength):
+            alignment.append((lemmaLength, plainLength))
+
+    pos = 0
+    for start, end, replacement in edits:
+        append(lemmatized, pos, start)
+        if replacement is not None:
+            append(replacement, 0, len(replacement.lemmatized))
+        pos = end
+    append(lemmatized, pos, len(lemmatized.lemmatized))
+    return models.LemmatizedString(plain="".join(plain), lemmatized="".join(lemmas), alignment=alignment)
+
+
+def getOrCreateKeywordRegex(keyword: models.CollectionConfigurationKeyword) -> re.Pattern:
+    if keyword.precomputedRegex is not None:
+        return keyword.precomputedRegex
+
+    regex = re.compile(asNotNone(keyword.regex), re.IGNORECASE)
+    keyword.precomputedRegex = regex
+
+    return regex
+
+
+def getOrCreateKeywordRedirections(collectionConfig: models.CollectionConfiguration) -> dict[str, models.CollectionConfigurationKeyword]:
+    """Keyword ID -> final target of its chain of redirections, for all keywords that redirect.
+    Raises an exception on redirections to unknown keywords and on cycles."""
+    if collectionConfig.precomputedKeywordRedirections is not None:
+        return collectionConfig.precomputedKeywordRedirections
+
+    keywordsById = {kw.id: kw for kw in collectionConfig.keywords}
+    redirections = {}
+    for kw in collectionConfig.keywords:
+        chain = [kw.id]
+        target = kw
+        while target.redirection:
+            if target.redirection not in keywordsById:
+                raise Exception(f"Keyword {target.id} redirects to unknown keyword {target.redirection}")
+            if target.redirection in chain:
+                raise Exception(f"Keyword redirections form a cycle: {' -> '.join(chain + [target.redirection])}")
+            chain.append(target.redirection)
+            target = keywordsById[target.redirection]
+        if target is not kw:
+            redirections[kw.id] = target
+
+    collectionConfig.precomputedKeywordRedirections = redirections
+    return redirections
+
+
+def getOrCreateRedirectionLemmas(collectionConfig: models.CollectionConfiguration) -> dict[str, models.LemmatizedString]:
+    """Keyword ID -> lemmatized text, for all redirection targets with a text (lemmatized in one call).
+    If the lemmatizer fails, the texts are used as they are, like queries are when out of time."""
+    if collectionConfig.precomputedRedirectionLemmas is not None:
+        return collectionConfig.precomputedRedirectionLemmas
+
+    targets = {target.id: target.text for target in getOrCreateKeywordRedirections(collectionConfig).values() if target.text}
+    try:
+        lemmatized = lemmatizeAll(collectionConfig.lemmatizeUrlPattern, list(targets.values()), timeout=10.0)
+    except Exception:
+        logging.exception("Could not lemmatize keyword redirection targets, using their plain texts")
+        lemmatized = lemmatizeAll(None, list(targets.values()))
+    lemmas = dict(zip(targets.keys(), lemmatized))
+
+    collectionConfig.precomputedRedirectionLemmas = lemmas
+    return lemmas
+
+
 def getOrCreateSolrUrlParams(collectionConfig: models.CollectionConfiguration) -> str:
     if collectionConfig.precomputedSolrUrlParams is not None:
         return collectionConfig.precomputedSolrUrlParams
 
-    solrUrlQueryStatsArray = ["stats=true"]
+    solrUrlQueryStats = createSolrUrlParams(collectionConfig, asNotNone(collectionConfig.solrQueryUrlPattern))
+    collectionConfig.precomputedSolrUrlParams = solrUrlQueryStats
+    return solrUrlQueryStats
+
 
+def createSolrUrlParams(collectionConfig: models.CollectionConfiguration, urlPattern: str) -> str:
+    """Faceting parameters of the hint fields for the given Solr query URL pattern."""
     facetingFields = {}
     for field in asNotNone(collectionConfig.wizardHintFields):
         facetingFields[field] = True
@@ -189,15 +433,453 @@ def getOrCreateSolrUrlParams(collectionConfig: models.CollectionConfiguration) -
         facetingFields[field] = True
     for field in asNotNone(collectionConfig.dropdownFields):
         facetingFields[field] = True
-    for field in facetingFields:
-        solrUrlQueryStatsArray.append(f"stats.facet={field}")
 
-    idField = asNotNone(collectionConfig).idField
-    solrUrlQueryStatsArray.append(f"stats.field={idField}")
+    filterQueryFields = getFilterQueryFields(urlPattern)
+    if filterQueryFields:
+        # enum filters are separate fq's: use multi-select faceting, each field excluding its own filter
+        solrUrlQueryStatsArray = ["facet=true", "facet.limit=-1", "facet.mincount=1", "json.nl=map"]
+        for field in facetingFields:
+            facetField = f"{{!ex={field}}}{field}" if field in filterQueryFields else field
+            solrUrlQueryStatsArray.append(f"facet.field={quote(facetField)}")
+    else:
+        solrUrlQueryStatsArray = ["stats=true"]
+        for field in facetingFields:
+            solrUrlQueryStatsArray.append(f"stats.facet={field}")
 
-    solrUrlQueryStats = "&".join(solrUrlQueryStatsArray)
-    collectionConfig.precomputedSolrUrlParams = solrUrlQueryStats
-    return solrUrlQueryStats
+        idField = asNotNone(collectionConfig).idField
+        solrUrlQueryStatsArray.append(f"stats.field={idField}")
+
+    return "&".join(solrUrlQueryStatsArray)
+
+
+def precompute(collectionConfig: models.CollectionConfiguration):
+    """Build all lazily computed structures of the collection that don't hold runtime resources."""
+    getOrCreateSolrUrlParams(collectionConfig)
+    getOrCreateUrlTemplate(collectionConfig)
+    getOrCreateValueCodeToTextMapping(collectionConfig)
+    getOrCreateValueCodeToValueMapping(collectionConfig)
+    getOrCreateUnkIrrVals(collectionConfig)
+    getOrCreateKeywordRedirections(collectionConfig)
+    getOrCreateRedirectionLemmas(collectionConfig)
+    getOrCreateSuggestIndex(collectionConfig)
+
+
+def getOrCreateUrlTemplate(collectionConfig: models.CollectionConfiguration) -> UrlTemplate:
+    if collectionConfig.precomputedUrlTemplate is not None:
+        return collectionConfig.precomputedUrlTemplate
+
+    template = UrlTemplate(asNotNone(collectionConfig.solrQueryUrlPattern))
+    collectionConfig.precomputedUrlTemplate = template
+
+    return template
+
+
+def getOrCreateSolrPool(collectionConfig: models.CollectionConfiguration) -> SolrReplicaPool:
+    if collectionConfig.precomputedSolrPool is not None:
+        return collectionConfig.precomputedSolrPool
+
+    with runtimeLock:
+        if collectionConfig.precomputedSolrPool is not None:
+            return collectionConfig.precomputedSolrPool
+
+        pool = createSolrPool(collectionConfig)
+        collectionConfig.precomputedSolrPool = pool
+
+        return pool
+
+
+def createSolrPool(collectionConfig: models.CollectionConfiguration) -> SolrReplicaPool:
+    # without replicas configured, the whole URL from the pattern is used as is
+    return SolrReplicaPool(collectionConfig.solrReplicaUrls or [""],
+                           timeoutMs=defaultIfNone(collectionConfig.solrTimeoutMs, 10000),
+                           hedgePercentile=defaultIfNone(collectionConfig.solrHedgePercentile, 95.0),
+                           hedgeMinDelayMs=defaultIfNone(collectionConfig.solrHedgeMinDelayMs, 50),
+                           failureThreshold=defaultIfNone(collectionConfig.solrCircuitFailureThreshold, 5),
+                           cooldownSeconds=defaultIfNone(collectionConfig.solrCircuitCooldownSeconds, 30.0))
+
+
+def querySolr(collectionConfig: models.CollectionConfiguration, url: str, timeout: Optional[float] = None,
+              stats: Optional[dict] = None) -> models.SolrResponse:
+    """Run the Solr query, or take its (trimmed) response from the response caches if they're enabled.
+    The stats dict is filled only if Solr was actually queried."""
+    cache = getOrCreateSolrCache(collectionConfig)
+    sharedCache = getOrCreateSharedCache(collectionConfig)
+    if cache is None and sharedCache is None:
+        return getOrCreateSolrPool(collectionConfig).query(url, timeout, stats)
+
+    return getCached(cache, sharedCache, "solr", url,
+                     lambda: trimSolrResponse(getOrCreateSolrPool(collectionConfig).query(url, timeout, stats), collectionConfig),
+                     encode=lambda solrResponse: json.dumps(solrResponse, ensure_ascii=False).encode("utf-8"),
+                     decode=json.loads,
+                     maxAge=defaultIfNone(collectionConfig.solrCacheTtlSeconds, 300.0))
+
+
+def traceSolr(trace: RequestTrace, query: Callable[[dict], models.SolrResponse]) -> models.SolrResponse:
+    """Run the Solr query, recording its wall time & Solr's stats of the response (if not cached) in the trace."""
+    stats = {}
+    try:
+        with trace.stage("solr"):
+            return query(stats)
+    finally:
+        trace.details.setdefault("solr", []).append(stats if stats else {"cached": True})
+
+
+def getOrCreateSlowRequestLog(config: models.AppConfiguration) -> Optional[SlowRequestLog]:
+    defaultConfig = asNotNone(config.defaultConfiguration)
+    if defaultConfig.precomputedSlowRequestLog is not None:
+        return defaultConfig.precomputedSlowRequestLog
+
+    if not defaultConfig.slowLogPath:
+        return None
+
+    with runtimeLock:
+        if defaultConfig.precomputedSlowRequestLog is not None:
+            return defaultConfig.precomputedSlowRequestLog
+
+        slowLog = SlowRequestLog(defaultConfig.slowLogPath,
+                                 thresholdMs=defaultIfNone(defaultConfig.slowLogThresholdMs, 500.0),
+                                 sampleRate=defaultIfNone(defaultConfig.slowLogSampleRate, 0.0),
+                                 maxBytes=defaultIfNone(defaultConfig.slowLogMaxBytes, 10 << 20),
+                                 backupCount=defaultIfNone(defaultConfig.slowLogBackupCount, 5))
+        defaultConfig.precomputedSlowRequestLog = slowLog
+
+        return slowLog
+
+
+def recordTrace(trace: RequestTrace, config: models.AppConfiguration):
+    slowLog = getOrCreateSlowRequestLog(config)
+    if slowLog is not None:
+        slowLog.record(trace)
+
+
+def getOrCreateShadowTraffic(collectionConfig: models.CollectionConfiguration) -> Optional[ShadowTraffic]:
+    if collectionConfig.precomputedShadowTraffic is not None:
+        return collectionConfig.precomputedShadowTraffic
+
+    if not collectionConfig.shadowSolrQueryUrlPattern:
+        return None
+
+    with runtimeLock:
+        if collectionConfig.precomputedShadowTraffic is not None:
+            return collectionConfig.precomputedShadowTraffic
+
+        # a pool of its own, so that shadow queries don't affect hedging, load balancing & circuit breakers of the live ones
+        shadow = ShadowTraffic(collectionConfig.shadowSolrQueryUrlPattern,
+                               sampleRate=defaultIfNone(collectionConfig.shadowSampleRate, 0.01),
+                               maxInFlight=defaultIfNone(collectionConfig.shadowMaxInFlight, 2),
+                               pool=createSolrPool(collectionConfig),
+                               hintingParams=createSolrUrlParams(collectionConfig, collectionConfig.shadowSolrQueryUrlPattern))
+        collectionConfig.precomputedShadowTraffic = shadow
+
+        return shadow
+
+
+def compareShadowQuery(collectionConfig: models.CollectionConfiguration, shadow: ShadowTraffic, text: str,
+                       lemmatizedText: Optional[str], enumValues: dict[str, list[str]],
+                       notRelevantFields: dict[str, bool], solrResponse: models.SolrResponse, solrStats: dict) -> dict:
+    """Run the search's Solr query with the shadow pattern (bypassing the caches) & compare it with the primary one."""
+    url = shadow.template.format(text, lemmatizedText, shadow.hintingParams, enumValues, notRelevantFields)
+    shadowStats = {}
+    shadowResponse = shadow.pool.query(url, stats=shadowStats)
+
+    def summary(response: models.SolrResponse, stats: dict) -> dict:
+        searchHints = generateSearchHints(enumValues, notRelevantFields, response, collectionConfig)
+        wizardHints = generateWizardHints(enumValues, notRelevantFields, response, collectionConfig)
+        return {
+            "latencyMs": stats["fetchMs"] + stats["decodeMs"],
+            "qTimeMs": stats.get("qTimeMs"),
+            "bytes": stats["bytes"],
+            "numFound": int(response["response"]["numFound"]),
+            "searchHints": {tuple(sorted(hint.fieldsAndValues.items())) for hint in searchHints},
+            "wizardHint": wizardHints[0].field if wizardHints else None,
+        }
+
+    return {"primary": summary(solrResponse, solrStats), "shadow": summary(shadowResponse, shadowStats)}
+
+
+def shadowReport(config: models.AppConfiguration) -> dict:
+    """Comparison of the shadow query pattern with the primary one, by collection (where it's configured)."""
+    return {name: shadow.report() for name, shadow in
+            ((name, getOrCreateShadowTraffic(collectionConfig)) for name, collectionConfig in asNotNone(config.collections).items())
+            if shadow is not None}
+
+
+def getOrCreateDetectionNegativeCache(collectionConfig: models.CollectionConfiguration) -> Optional[LruCache]:
+    if collectionConfig.precomputedDetectionNegativeCache is not None:
+        return collectionConfig.precomputedDetectionNegativeCache
+
+    if defaultIfNone(collectionConfig.detectionNegativeCacheSize, 0) <= 0:
+        return None
+
+    with runtimeLock:
+        if collectionConfig.precomputedDetectionNegativeCache is not None:
+            return collectionConfig.precomputedDetectionNegativeCache
+
+        cache = LruCache("detectionNegativeCache", collectionConfig.detectionNegativeCacheSize)
+        collectionConfig.precomputedDetectionNegativeCache = cache
+
+        return cache
+
+
+def getOrCreateIndexGeneration(collectionConfig: models.CollectionConfiguration) -> IndexGeneration:
+    if collectionConfig.precomputedIndexGeneration is not None:
+        return collectionConfig.precomputedIndexGeneration
+
+    with runtimeLock:
+        if collectionConfig.precomputedIndexGeneration is not None:
+            return collectionConfig.precomputedIndexGeneration
+
+        # asked from each replica of the pool, any of them can answer the query
+        pool = getOrCreateSolrPool(collectionConfig)
+        relativeUrl = pool.relativeUrl(asNotNone(collectionConfig.solrQueryUrlPattern))
+        generation = IndexGeneration([indexVersionUrl(replica.baseUrl + relativeUrl) for replica in pool.replicas],
+                                     checkInterval=defaultIfNone(collectionConfig.indexGenerationCheckSeconds, 30.0))
+        collectionConfig.precomputedIndexGeneration = generation
+
+        return generation
+
+
+def getDetectionOutcomeKey(collectionConfig: models.CollectionConfiguration, lemmatizedText: Optional[str],
+                           enumValues: dict[str, list[str]], notRelevantFields: dict[str, bool]) -> Optional[tuple]:
+    """Key of the negative cache of detections: the lemmatized text & the enum filters (detected ones included)
+    after detection, and the index generation, so that the entries expire when the index changes.
+    None if the cache is disabled or the generation isn't known."""
+    if getOrCreateDetectionNegativeCache(collectionConfig) is None:
+        return None
+    generation = getOrCreateIndexGeneration(collectionConfig).current()
+    if generation is None:
+        return None
+    filters = frozenset((field, frozenset(values)) for field, values in enumValues.items() if values)
+    return lemmatizedText, filters, frozenset(notRelevantFields), generation
+
+
+def getOrCreateSolrCache(collectionConfig: models.CollectionConfiguration) -> Optional[LruCache]:
+    if collectionConfig.precomputedSolrCache is not None:
+        return collectionConfig.precomputedSolrCache
+
+    if defaultIfNone(collectionConfig.solrCacheSize, 0) <= 0:
+        return None
+
+    with runtimeLock:
+        if collectionConfig.precomputedSolrCache is not None:
+            return collectionConfig.precomputedSolrCache
+
+        cache = LruCache("solrCache", collectionConfig.solrCacheSize,
+                         ttlSeconds=defaultIfNone(collectionConfig.solrCacheTtlSeconds, 300.0))
+        collectionConfig.precomputedSolrCache = cache
+
+        return cache
+
+
+def lemmatizeQuery(collectionConfig: models.CollectionConfiguration, text: str, timeout: Optional[float] = None) -> models.LemmatizedString:
+    """Lemmatize the query, through the lemma caches & the collection's micro-batcher if they're enabled."""
+    if not text or text.isspace():
+        return lemmatize(None, text)
+    batcher = getOrCreateLemmatizerBatcher(collectionConfig)
+
+    def compute() -> models.LemmatizedString:
+        if batcher is None:
+            return lemmatize(collectionConfig.lemmatizeUrlPattern, text, timeout)
+        return batcher.lemmatize(text, timeout)
+
+    return getCached(getOrCreateLemmaCache(collectionConfig), getOrCreateSharedCache(collectionConfig), "lemma", text, compute,
+                     encode=lambda lemmatized: json.dumps(lemmatized.toJsonObject(), ensure_ascii=False).encode("utf-8"),
+                     decode=decodeLemmatized)
+
+
+def decodeLemmatized(data: bytes) -> models.LemmatizedString:
+    obj = json.loads(data)
+    alignment = obj["alignment"] and [tuple(pair) for pair in obj["alignment"]]
+    return models.LemmatizedString(plain=obj["plain"], lemmatized=obj["lemmatized"], alignment=alignment)
+
+
+def getCached(cache: Optional[LruCache], sharedCache: Optional[SharedCache], namespace: str, key: str,
+              compute: Callable[[], T], encode: Callable[[T], bytes], decode: Callable[[bytes], T],
+              maxAge: Optional[float] = None) -> T:
+    """Get a value from the in-process cache, then from the cache shared by worker processes, then compute it."""
+    value = cache.get(key) if cache is not None else None
+    if value is not None:
+        return value
+
+    data = sharedCache.get(namespace, key, maxAge) if sharedCache is not None else None
+    if data is not None:
+        value = decode(data)
+    else:
+        value = compute()
+        if sharedCache is not None:
+            sharedCache.put(namespace, key, encode(value))
+    if cache is not None:
+        cache.put(key, value)
+    return value
+
+
+def getOrCreateSharedCache(collectionConfig: models.CollectionConfiguration) -> Optional[SharedCache]:
+    if collectionConfig.precomputedSharedCache is not None:
+        return collectionConfig.precomputedSharedCache
+
+    if not collectionConfig.sharedCachePath:
+        return None
+
+    with runtimeLock:
+        if collectionConfig.precomputedSharedCache is not None:
+            return collectionConfig.precomputedSharedCache
+
+        cache = SharedCache(collectionConfig.sharedCachePath,
+                            maxBytes=defaultIfNone(collectionConfig.sharedCacheMaxBytes, 64 << 20))
+        collectionConfig.precomputedSharedCache = cache
+
+        return cache
+
+
+def getOrCreateLemmaCache(collectionConfig: models.CollectionConfiguration) -> Optional[LruCache]:
+    if collectionConfig.precomputedLemmaCache is not None:
+        return collectionConfig.precomputedLemmaCache
+
+    if defaultIfNone(collectionConfig.lemmaCacheSize, 0) <= 0:
+        return None
+
+    with runtimeLock:
+        if collectionConfig.precomputedLemmaCache is not None:
+            return collectionConfig.precomputedLemmaCache
+
+        cache = LruCache("lemmaCache", collectionConfig.lemmaCacheSize)
+        collectionConfig.precomputedLemmaCache = cache
+
+        return cache
+
+
+def getOrCreateLemmatizerBatcher(collectionConfig: models.CollectionConfiguration) -> Optional[LemmatizerBatcher]:
+    if collectionConfig.precomputedLemmatizerBatcher is not None:
+        return collectionConfig.precomputedLemmatizerBatcher
+
+    maxBatchSize = defaultIfNone(collectionConfig.lemmatizeBatchMaxSize, 1)
+    if not collectionConfig.lemmatizeUrlPattern or maxBatchSize <= 1:
+        return None
+
+    with runtimeLock:
+        if collectionConfig.precomputedLemmatizerBatcher is not None:
+            return collectionConfig.precomputedLemmatizerBatcher
+
+        batcher = LemmatizerBatcher(collectionConfig.lemmatizeUrlPattern,
+                                    maxWaitMs=defaultIfNone(collectionConfig.lemmatizeBatchMaxWaitMs, 5),
+                                    maxBatchSize=maxBatchSize)
+        collectionConfig.precomputedLemmatizerBatcher = batcher
+
+        return batcher
+
+
+def getOrCreateSessionStore(collectionConfig: models.CollectionConfiguration) -> Optional[SessionStore]:
+    if collectionConfig.precomputedSessionStore is not None:
+        return collectionConfig.precomputedSessionStore
+
+    maxSessions = defaultIfNone(collectionConfig.sessionMaxCount, 0)
+    if maxSessions <= 0:
+        return None
+
+    with runtimeLock:
+        if collectionConfig.precomputedSessionStore is not None:
+            return collectionConfig.precomputedSessionStore
+
+        store = SessionStore(maxSessions,
+                             idleTtlSeconds=defaultIfNone(collectionConfig.sessionIdleTtlSeconds, 600.0),
+                             maxSessionBytes=defaultIfNone(collectionConfig.sessionMaxBytes, 65536))
+        collectionConfig.precomputedSessionStore = store
+
+        return store
+
+
+def getOrCreateAdmissionController(config: models.AppConfiguration) -> Optional[AdmissionController]:
+    defaultConfig = asNotNone(config.defaultConfiguration)
+    if defaultConfig.precomputedAdmissionController is not None:
+        return defaultConfig.precomputedAdmissionController
+
+    maxInFlight = defaultIfNone(defaultConfig.admissionMaxInFlight, 0)
+    if maxInFlight <= 0:
+        return None
+
+    with runtimeLock:
+        if defaultConfig.precomputedAdmissionController is not None:
+            return defaultConfig.precomputedAdmissionController
+
+        controller = AdmissionController(maxInFlight,
+                                         maxQueueDepth=defaultIfNone(defaultConfig.admissionMaxQueueDepth, 4 * maxInFlight),
+                                         maxQueueWaitMs=defaultIfNone(defaultConfig.admissionMaxQueueWaitMs, 2000),
+                                         ratePerSecond=defaultConfig.rateLimitPerSecond,
+                                         burst=defaultIfNone(defaultConfig.rateLimitBurst, 10.0))
+        defaultConfig.precomputedAdmissionController = controller
+
+        return controller
+
+
+def searchPriority(request: models.SearchRequest, config: models.AppConfiguration) -> int:
+    """Searches that will likely be answered without lemmatizer & Solr calls (empty query, or only
+    the enum filters of the user's previous search changed) are cheap, the rest is expensive."""
+    if not request.query or request.query.isspace():
+        return PRIORITY_CHEAP
+    collectionConfig = asNotNone(config.collections)[asNotNone(config.defaultConfiguration).defaultCollection]
+    sessionStore = getOrCreateSessionStore(collectionConfig) if request.userId else None
+    session = sessionStore.get(request.userId) if sessionStore is not None else None
+    return PRIORITY_CHEAP if session is not None and session.matches(request) else PRIORITY_EXPENSIVE
+
+
+def getOrCreateSuggestIndex(collectionConfig: models.CollectionConfiguration) -> SuggestIndex:
+    if collectionConfig.precomputedSuggestIndex is not None:
+        return collectionConfig.precomputedSuggestIndex
+
+    index = SuggestIndex.fromCollection(collectionConfig)
+    collectionConfig.precomputedSuggestIndex = index
+
+    return index
+
+
+def getOrCreateFacetSnapshot(collectionConfig: models.CollectionConfiguration) -> Optional[FacetSnapshot]:
+    if collectionConfig.precomputedFacetSnapshot is not None:
+        return collectionConfig.precomputedFacetSnapshot
+
+    if not collectionConfig.facetSnapshotPath:
+        return None
+
+    with runtimeLock:
+        if collectionConfig.precomputedFacetSnapshot is not None:
+            return collectionConfig.precomputedFacetSnapshot
+
+        snapshot = FacetSnapshot(collectionConfig.facetSnapshotPath)
+        collectionConfig.precomputedFacetSnapshot = snapshot
+
+        return snapshot
+
+
+def lookupFacetSnapshot(collectionConfig: models.CollectionConfiguration, text: Optional[str],
+                        enumValues: Optional[dict[str, list[str]]], notRelevantFields: Optional[dict[str, bool]]) -> Optional[models.SolrResponse]:
+    """Get the facets of an empty query with no or a single-value enum filter from the precomputed snapshot.
+
+    Returns a response in the same form as trimSolrResponse, or None if the snapshot doesn't have it."""
+    if text and not text.isspace() or notRelevantFields:
+        return None
+    filters = [(field, values) for field, values in defaultIfNone(enumValues, {}).items() if values]
+    if len(filters) > 1 or filters and len(filters[0][1]) > 1:
+        return None
+    snapshot = getOrCreateFacetSnapshot(collectionConfig)
+    if snapshot is None:
+        return None
+
+    key = entryKey(filters[0][0], filters[0][1][0]) if filters else entryKey()
+    fields = asNotNone(collectionConfig.wizardHintFields) + asNotNone(collectionConfig.searchHintFields) + asNotNone(collectionConfig.dropdownFields)
+    entry = snapshot.lookup(key, fields)
+    if entry is None:
+        return None
+    metrics.increment("facetSnapshot.hits")
+    facets = {field: {value: {"count": count} for value, count in values.items()}
+              for field, values in entry["facets"].items()}
+    return {
+        "response": {"numFound": entry["numFound"]},
+        "stats": {"stats_fields": {collectionConfig.idField: {"facets": facets}}},
+    }
+
+
+def getFilterQueryFields(urlPattern: str) -> set[str]:
+    """Fields whose enum values are filtered by separate fq's in the given Solr query URL pattern."""
+    return set(re.findall(r'(?<!\\)\{enum:([^|}]*)\|convertFromId\|fq\}', urlPattern))
 
 
 def getOrCreateValueCodeToTextMapping(collectionConfig: models.CollectionConfiguration) -> dict[str, str]:
@@ -245,12 +927,12 @@ def addRedirectToResponse(oldSearchRequest: models.SearchRequest, redirectRespon
     req.returnSearchHints = oldSearchRequest.returnSearchHints
     req.returnWizardHints = oldSearchRequest.returnWizardHints
     req.enumValues: list[models.EnumList] = []
-    req.query = redirectResponse.detectedTextValue
-    req.lemmatizedQuery = redirectResponse.detectedLemmatizedValue
+    req.query = redirectResponse.redirectedTextValue
+    req.lemmatizedQuery = redirectResponse.redirectedLemmatizedValue
 
-    # group detected enum values by field
+    # group detected (& redirected) enum values by field
     fieldVals = {}
-    for val in asNotNone(redirectResponse.detectedEnumValues):
+    for val in asNotNone(redirectResponse.redirectedEnumValues):
         fieldVals[val.field] = fieldVals.get(val.field, [])
         fieldVals[val.field].append(val)
 
@@ -267,88 +949,9 @@ def addRedirectToResponse(oldSearchRequest: models.SearchRequest, redirectRespon
             enumList.values.append(enumListItem)
         req.enumValues.append(enumList)
 
-    for field in asNotNone(redirectResponse.detectedNotRelevantValues):
-        enumList = models.EnumList()
-        enumList.isNotRelevant = True
-        enumList.enumType = field
-        req.enumValues.append(field)
+    # keep the request's own enum values & not relevant fields, unless detected or redirected to
+    for enumList in oldSearchRequest.enumValues or []:
+        if enumList.enumType not in fieldVals:
+            req.enumValues.append(enumList)
 
     return req
-
-
-def lemmatize(urlPattern: str, text: str):
-    """Lemmatize using Morphodita API, if URL is set up; produce alignment between original and lemmatized"""
-    if urlPattern:
-        # get the lemmatized version
-        url = urlPattern.replace("{text}", quote(text))
-        connection = urlopen(url)
-        response = json.load(connection)
-        # compute alignment
-        lemmatized = ''
-        alignment = [(0, 0)]
-        plain_pos = 0
-        for tok in [tok for sent in response['result'] for tok in sent]:
-            space = tok.get('space', '')
-            lemmatized = lemmatized + tok['lemma'] + space
-            plain_pos += len(tok['token']) + len(space)
-            alignment.append((len(lemmatized), plain_pos))
-        return models.LemmatizedString(plain=text, lemmatized=lemmatized, alignment=alignment)
-    else:
-        # backoff to no lemmatization
-        return models.LemmatizedString(plain=text, lemmatized=text)
-
-
-def formatUrl(urlPattern: Optional[str],
-              text: Optional[str], lemmatizedText: Optional[str],
-              hintingParams: Optional[str], enumValues: Optional[dict[str, list[str]]],
-              notRelevantFields: Optional[dict[str, bool]]) -> str:
-
-    urlPattern, text, hintingParams, enumValues, notRelevantFields = defaultIfNone(urlPattern, ""), defaultIfNone(text, ""), defaultIfNone(hintingParams, ""), defaultIfNone(enumValues, {}), defaultIfNone(notRelevantFields, {})
-
-    # default lemmatized to plain text, if not available
-    lemmatized_text = defaultIfNone(lemmatizedText, text)
-
-    repls = list(re.finditer(r'(\\*)(\{[^\}]*\})', urlPattern))
-
-    offset = 0
-    url = ''
-    for repl in repls:
-        backslashes = repl.group(1)
-        repl_start = repl.start() + len(backslashes)
-        url += urlPattern[offset:repl_start]
-        offset = repl.end()
-        if len(backslashes) % 2:  # odd number of backslashes -- escaped, skip
-            url += urlPattern[repl_start:offset]
-            continue
-        # Replace known mark-ups
-        patternMatch = repl.group(2)
-        if patternMatch == "{hintingparams}":
-            url += hintingParams
-        elif patternMatch == "{text|unquoted}":
-            url += quote(text)
-        elif patternMatch == "{text|quoted}":
-            url += quote(f"\"{text}\"")
-        elif patternMatch == "{text|lemmatized,unquoted}":
-            url += quote(lemmatized_text)
-        elif patternMatch == "{text|lemmatized,quoted}":
-            url += quote(f"\"{lemmatized_text}\"")
-        elif patternMatch.startswith("{enum:"):
-            args = patternMatch[len("{enum:"):-1].split("|")
-            if len(args) != 3 or args[1] != "convertFromId" or args[2] != "pre-AND":
-                raise Exception(f"Invalid format of Solr query URL: Unsupported markup: {patternMatch}")
-            enumField = args[0]
-            if enumField not in enumValues or len(enumValues[enumField]) == 0 or enumField in notRelevantFields:
-                pass
-            else:
-                enumValuesSeparated = " OR ".join(map(lambda x: f"({enumField}:\"{x}\")", enumValues[enumField]))
-                url += quote(f" AND ({enumValuesSeparated})")
-        else:
-            raise Exception(f"Invalid format of Solr query URL: Unsupported markup: {patternMatch}")
-
-    url += urlPattern[offset:]
-
-    url = re.sub(r'\\([\\\{\}])', r'\1', url)  # unescape \, {, }
-    url = url.replace(" ", "%20")
-
-    logging.debug(url)
-    return url
@@ -0,0 +1,31 @@
+import threading
+
+# Process-wide counters and value distributions, reported by the /metrics endpoint
+lock = threading.Lock()
+counters: dict[str, int] = {}
+distributions: dict[str, dict[str, float]] = {}
+
+
+def increment(name: str, value: int = 1):
+    with lock:
+        counters[name] = counters.get(name, 0) + value
+
+
+def observe(name: str, value: float):
+    with lock:
+        dist = distributions.get(name)
+        if dist is None:
+            distributions[name] = {"count": 1, "sum": value, "min": value, "max": value}
+            return
+        dist["count"] += 1
+        dist["sum"] += value
+        dist["min"] = min(dist["min"], value)
+        dist["max"] = max(dist["max"], value)
+
+
+def snapshot() -> dict:
+    with lock:
+        return {
+            "counters": dict(counters),
+            "distributions": {name: dict(dist, mean=dist["sum"] / dist["count"]) for name, dist in distributions.items()},
+        }
@@ -104,6 +104,9 @@ class SearchResponse(ApiModel):
             obj, "redirectedFromReducedQuery", str)
         self.redirectedFromEnumValues = getArrayFromDict(
             obj, "redirectedFromEnumValues", lambda x: EnumList(x))
+        self.degraded = getNumberFromDict(obj, "degraded", bool)
+        self.degradedStages = getArrayFromDict(
+            obj, "degradedStages", lambda x: str(x))
 
 
 class EnumItem(ApiModel):
@@ -203,6 +206,9 @@ class HintResponse(ApiModel):
             obj, "wizardHints", lambda x: WizardHint(x))
         self.searchHints = getArrayFromDict(
             obj, "searchHints", lambda x: SearchHint(x))
+        self.degraded = getNumberFromDict(obj, "degraded", bool)
+        self.degradedStages = getArrayFromDict(
+            obj, "degradedStages", lambda x: str(x))
 
 
 class WizardHint(ApiModel):
@@ -226,6 +232,40 @@ class SearchHint(ApiModel):
         self.fieldsAndValues = getObjectFromDict(obj, "fieldsAndValues", dict)
 
 
+class SuggestRequest(ApiModel):
+    def __init__(self, obj: Optional[dict[str, Any]] = None, **kwargs):
+        ApiModel.__init__(self)
+        obj = kwargs if obj is None else obj
+        self._addValuesFromDict(obj)
+
+    def _addValuesFromDict(self, obj: dict[str, Any]):
+        self.prefix = getObjectFromDict(obj, "prefix", str)
+        self.limit = getNumberFromDict(obj, "limit", int)
+
+
+class SuggestResponse(ApiModel):
+    def __init__(self, obj: Optional[dict[str, Any]] = None, **kwargs):
+        ApiModel.__init__(self)
+        obj = kwargs if obj is None else obj
+        self._addValuesFromDict(obj)
+
+    def _addValuesFromDict(self, obj: dict[str, Any]):
+        self.suggestions = getArrayFromDict(obj, "suggestions", lambda x: Suggestion(x))
+
+
+class Suggestion(ApiModel):
+    def __init__(self, obj: Optional[dict[str, Any]] = None, **kwargs):
+        ApiModel.__init__(self)
+        obj = kwargs if obj is None else obj
+        self._addValuesFromDict(obj)
+
+    def _addValuesFromDict(self, obj: dict[str, Any]):
+        self.text = getObjectFromDict(obj, "text", str)
+        self.enumType = getObjectFromDict(obj, "enumType", str)
+        self.valueCode = getObjectFromDict(obj, "valueCode", str)
+        self.keywordId = getObjectFromDict(obj, "keywordId", str)
+
+
 class RedirectRequest(ApiModel):
     def __init__(self, obj: Optional[dict[str, Any]] = None, **kwargs):
         ApiModel.__init__(self)
@@ -280,6 +320,27 @@ class DefaultConfiguration(ApiModel):
     def _addValuesFromDict(self, obj: dict[str, Any]):
         self.defaultCollection = getObjectFromDict(
             obj, "DefaultCollection", str)
+        self.requestDeadlineMs = getNumberFromDict(obj, "RequestDeadlineMs", int)
+        self.degradeMinBudgetsMs : Optional[dict[str, int]] = getObjectFromDict(obj, "DegradeMinBudgetsMs", dict)
+        self.admissionMaxInFlight = getNumberFromDict(obj, "AdmissionMaxInFlight", int)
+        self.admissionMaxQueueDepth = getNumberFromDict(obj, "AdmissionMaxQueueDepth", int)
+        self.admissionMaxQueueWaitMs = getNumberFromDict(obj, "AdmissionMaxQueueWaitMs", int)
+        self.rateLimitPerSecond = getNumberFromDict(obj, "RateLimitPerSecond", float)
+        self.rateLimitBurst = getNumberFromDict(obj, "RateLimitBurst", float)
+        self.warmupTopN = getNumberFromDict(obj, "WarmupTopN", int)
+        self.warmupQueryLogPath = getObjectFromDict(obj, "WarmupQueryLogPath", str)
+        self.warmupConcurrency = getNumberFromDict(obj, "WarmupConcurrency", int)
+        self.slowLogPath = getObjectFromDict(obj, "SlowLogPath", str)
+        self.slowLogThresholdMs = getNumberFromDict(obj, "SlowLogThresholdMs", float)
+        self.slowLogSampleRate = getNumberFromDict(obj, "SlowLogSampleRate", float)
+        self.slowLogMaxBytes = getNumberFromDict(obj, "SlowLogMaxBytes", int)
+        self.slowLogBackupCount = getNumberFromDict(obj, "SlowLogBackupCount", int)
+        self.precomputedAdmissionController = None
+        self.precomputedSlowRequestLog = None
+
+    def __getstate__(self):
+        # the admission controller & the slow-request log are runtime objects, left out of compiled config snapshots
+        return dict(self.__dict__, precomputedAdmissionController=None, precomputedSlowRequestLog=None)
 
 
 class CollectionConfiguration(ApiModel):
@@ -290,7 +351,15 @@ class CollectionConfiguration(ApiModel):
     def _addValuesFromDict(self, obj: dict[str, Any]):
         self.solrQueryUrlPattern = getObjectFromDict(
             obj, "SolrQueryUrlPattern", str)
+        self.solrReplicaUrls = getArrayFromDict(obj, "SolrReplicaUrls", lambda x: str(x))
+        self.solrTimeoutMs = getNumberFromDict(obj, "SolrTimeoutMs", int)
+        self.solrHedgePercentile = getNumberFromDict(obj, "SolrHedgePercentile", float)
+        self.solrHedgeMinDelayMs = getNumberFromDict(obj, "SolrHedgeMinDelayMs", int)
+        self.solrCircuitFailureThreshold = getNumberFromDict(obj, "SolrCircuitFailureThreshold", int)
+        self.solrCircuitCooldownSeconds = getNumberFromDict(obj, "SolrCircuitCooldownSeconds", float)
         self.lemmatizeUrlPattern = getObjectFromDict(obj, "LemmatizeUrlPattern", str)
+        self.lemmatizeBatchMaxSize = getNumberFromDict(obj, "LemmatizeBatchMaxSize", int)
+        self.lemmatizeBatchMaxWaitMs = getNumberFromDict(obj, "LemmatizeBatchMaxWaitMs", float)
         self.idField = getObjectFromDict(obj, "IdField", str)
         self.searchField = getObjectFromDict(obj, "SearchField", str)
         self.wizardHintFields = getArrayFromDict(
@@ -302,10 +371,46 @@ class CollectionConfiguration(ApiModel):
         self.enumValues = getArrayFromDict(
             obj, "EnumValues", lambda x: CollectionConfigurationEnumValue(x))
         self.keywords = getArrayFromDict(obj, "Keywords", lambda x: CollectionConfigurationKeyword(x))
+        self.sessionMaxCount = getNumberFromDict(obj, "SessionMaxCount", int)
+        self.sessionIdleTtlSeconds = getNumberFromDict(obj, "SessionIdleTtlSeconds", float)
+        self.sessionMaxBytes = getNumberFromDict(obj, "SessionMaxBytes", int)
+        self.facetSnapshotPath = getObjectFromDict(obj, "FacetSnapshotPath", str)
+        self.lemmaCacheSize = getNumberFromDict(obj, "LemmaCacheSize", int)
+        self.solrCacheSize = getNumberFromDict(obj, "SolrCacheSize", int)
+        self.solrCacheTtlSeconds = getNumberFromDict(obj, "SolrCacheTtlSeconds", float)
+        self.sharedCachePath = getObjectFromDict(obj, "SharedCachePath", str)
+        self.sharedCacheMaxBytes = getNumberFromDict(obj, "SharedCacheMaxBytes", int)
+        self.shadowSolrQueryUrlPattern = getObjectFromDict(obj, "ShadowSolrQueryUrlPattern", str)
+        self.shadowSampleRate = getNumberFromDict(obj, "ShadowSampleRate", float)
+        self.shadowMaxInFlight = getNumberFromDict(obj, "ShadowMaxInFlight", int)
+        self.detectionNegativeCacheSize = getNumberFromDict(obj, "DetectionNegativeCacheSize", int)
+        self.indexGenerationCheckSeconds = getNumberFromDict(obj, "IndexGenerationCheckSeconds", float)
         self.precomputedSolrUrlParams: Optional[str] = None
         self.precomputedValueCodeToValueText: Optional[dict[str, str]] = None
         self.precomputedValueCodeToValue: Optional[dict[str, CollectionConfigurationEnumValue]] = None
         self.precomputedUnkIrrVals: Optional[set[(str, str)]] = None
+        self.precomputedKeywordRedirections: Optional[dict[str, CollectionConfigurationKeyword]] = None
+        self.precomputedRedirectionLemmas: Optional[dict[str, LemmatizedString]] = None
+        self.precomputedSolrPool = None
+        self.precomputedLemmatizerBatcher = None
+        self.precomputedSessionStore = None
+        self.precomputedFacetSnapshot = None
+        self.precomputedSuggestIndex = None
+        self.precomputedLemmaCache = None
+        self.precomputedSolrCache = None
+        self.precomputedSharedCache = None
+        self.precomputedUrlTemplate = None
+        self.precomputedShadowTraffic = None
+        self.precomputedDetectionNegativeCache = None
+        self.precomputedIndexGeneration = None
+
+    # Precomputed objects holding threads, locks, files or connections, left out of compiled config snapshots
+    RUNTIME_ATTRIBUTES = ["precomputedSolrPool", "precomputedLemmatizerBatcher", "precomputedSessionStore", "precomputedFacetSnapshot",
+                          "precomputedLemmaCache", "precomputedSolrCache", "precomputedSharedCache", "precomputedShadowTraffic",
+                          "precomputedDetectionNegativeCache", "precomputedIndexGeneration"]
+
+    def __getstate__(self):
+        return dict(self.__dict__, **{name: None for name in CollectionConfiguration.RUNTIME_ATTRIBUTES})
 
 
 class CollectionConfigurationEnumValue(ApiModel):
@@ -333,11 +438,15 @@ class CollectionConfigurationKeyword(ApiModel):
         self.redirection =  getObjectFromDict(obj, "redirection", str)
         self.isDetected =  getNumberFromDict(obj, "isDetected", bool)
         self.regex =  getObjectFromDict(obj, "regex", str)
-        if self.regex:
-            self.regex = re.compile(self.regex, re.IGNORECASE)
         self.anchors = getObjectFromDict(obj, "anchors", str)
         self.description = getObjectFromDict(obj, "description", str)
         self.text = getObjectFromDict(obj, "text", str)
+        # compiled here to validate the config, but left out of compiled config snapshots: unpickling a pattern
+        # compiles it again, so they're compiled on first use instead
+        self.precomputedRegex = re.compile(self.regex, re.IGNORECASE) if self.regex else None
+
+    def __getstate__(self):
+        return dict(self.__dict__, precomputedRegex=None)
 
 
 class LemmatizedString(ApiModel):
@@ -361,5 +470,17 @@ class LemmatizedString(ApiModel):
         pos = self.alignment[max(pos - 1, 0)]  # but never go left of 0
         return pos[1] + idx-pos[0]  # same character from start of given word
 
+    def mapBoundary(self, idx):
+        """Like mapIndex, but exact at word boundaries: the start of a lemma maps to the start of its word,
+        the end of a lemma to the end of its word (their lengths differ)"""
+        if not self.alignment:
+            return idx
+        pos = bisect.bisect_left(self.alignment, (idx, -1))  # the next word start
+        if pos < len(self.alignment):
+            gap = self.lemmatized[idx:self.alignment[pos][0]]
+            if not gap.strip():
+                return self.alignment[pos][1] - len(gap)
+        return self.mapIndex(idx)
+
 NotRelevantFields = dict[str, bool]
 SolrResponse = dict
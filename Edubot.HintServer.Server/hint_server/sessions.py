@@ -0,0 +1,68 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import hint_server.models as models
+
+
+class SearchSession:
+    """Query analysis and Solr facet response of a user's last search, for reuse while refining it."""
+
+    def __init__(self, request: models.SearchRequest, lemmatized: models.LemmatizedString,
+                 redirectResponse: Optional[models.RedirectResponse], solrUrl: str, solrResponse: Optional[dict]):
+        self.key = SearchSession.requestKey(request)
+        self.lemmatized = lemmatized
+        self.redirectResponse = redirectResponse
+        self.solrUrl = solrUrl
+        self.solrResponse = solrResponse
+        self.lastUsed = time.monotonic()
+
+    @staticmethod
+    def requestKey(request: models.SearchRequest) -> tuple:
+        """Parts of the request that determine lemmatization & detection (i.e. everything except enum filters)."""
+        return (request.query, request.detectEnums, request.doRedirection, request.useLemmatizer)
+
+    def matches(self, request: models.SearchRequest) -> bool:
+        return self.key == SearchSession.requestKey(request)
+
+
+class SessionStore:
+    """Bounded LRU store of search sessions keyed by user ID, with an idle TTL.
+
+    Facet responses bigger than maxSessionBytes are not kept (only the query analysis is)."""
+
+    def __init__(self, maxSessions: int, idleTtlSeconds: float, maxSessionBytes: int):
+        self.maxSessions = maxSessions
+        self.idleTtlSeconds = idleTtlSeconds
+        self.maxSessionBytes = maxSessionBytes
+        self.sessions: OrderedDict[str, SearchSession] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, userId: str) -> Optional[SearchSession]:
+        now = time.monotonic()
+        with self.lock:
+            session = self.sessions.get(userId)
+            if session is None:
+                return None
+            if now - session.lastUsed > self.idleTtlSeconds:
+                del self.sessions[userId]
+                return None
+            session.lastUsed = now
+            self.sessions.move_to_end(userId)
+            return session
+
+    def put(self, userId: str, session: SearchSession):
+        if session.solrResponse is not None and len(json.dumps(session.solrResponse)) > self.maxSessionBytes:
+            session.solrResponse = None
+        with self.lock:
+            self.sessions[userId] = session
+            self.sessions.move_to_end(userId)
+            # drop expired sessions from the LRU end, then anything over the limit
+            now = time.monotonic()
+            while self.sessions:
+                oldestId, oldest = next(iter(self.sessions.items()))
+                if len(self.sessions) <= self.maxSessions and now - oldest.lastUsed <= self.idleTtlSeconds:
+                    break
+                del self.sessions[oldestId]
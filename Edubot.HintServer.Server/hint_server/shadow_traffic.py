@@ -0,0 +1,108 @@
+import logging
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+import hint_server.metrics as metrics
+from hint_server.solr import SolrReplicaPool
+from hint_server.url_template import UrlTemplate
+
+
+class ShadowTraffic:
+    """Mirrors a sample of searches to Solr with an alternative query pattern and compares the results
+    with the primary query: latency, response size, numFound & hints.
+
+    Comparisons run in a background pool; when maxInFlight of them are already running, the sample is
+    dropped instead of queued, so shadow traffic can never pile up behind a slow variant. Shadow queries
+    go through a Solr pool of their own with the pattern's own faceting params."""
+
+    def __init__(self, pattern: str, sampleRate: float, maxInFlight: int, pool: SolrReplicaPool, hintingParams: str,
+                 window: int = 1000):
+        self.template = UrlTemplate(pattern)
+        self.pool = pool
+        self.hintingParams = hintingParams
+        self.sampleRate = sampleRate
+        self.slots = threading.BoundedSemaphore(maxInFlight)
+        self.executor = ThreadPoolExecutor(max_workers=maxInFlight, thread_name_prefix="shadow")
+        self.lock = threading.Lock()
+        self.counts = {"mirrored": 0, "dropped": 0, "failed": 0, "compared": 0,
+                       "sameNumFound": 0, "sameWizardHint": 0}
+        self.searchHintOverlapSum = 0.0
+        # recent samples of each side: (latency ms, Solr QTime ms, response bytes)
+        self.samples = {"primary": deque(maxlen=window), "shadow": deque(maxlen=window)}
+
+    def sample(self) -> bool:
+        return self.sampleRate > 0 and random.random() < self.sampleRate
+
+    def mirror(self, compare: Callable[[], Optional[dict]]) -> bool:
+        """Run the comparison in the background, unless too many are running already."""
+        if not self.slots.acquire(blocking=False):
+            self._count("dropped")
+            return False
+        self._count("mirrored")
+        try:
+            self.executor.submit(self._run, compare)
+        except RuntimeError:  # shut down
+            self.slots.release()
+            return False
+        return True
+
+    def _run(self, compare: Callable[[], Optional[dict]]):
+        try:
+            self.record(compare())
+        except Exception:
+            logging.exception("Shadow query failed")
+            self._count("failed")
+        finally:
+            self.slots.release()
+
+    def record(self, comparison: dict):
+        """Add a comparison: latencyMs, qTimeMs, bytes, numFound, searchHints (set) & wizardHint of both sides."""
+        primary, shadow = comparison["primary"], comparison["shadow"]
+        union = primary["searchHints"] | shadow["searchHints"]
+        overlap = len(primary["searchHints"] & shadow["searchHints"]) / len(union) if union else 1.0
+        with self.lock:
+            self.counts["compared"] += 1
+            self.counts["sameNumFound"] += primary["numFound"] == shadow["numFound"]
+            self.counts["sameWizardHint"] += primary["wizardHint"] == shadow["wizardHint"]
+            self.searchHintOverlapSum += overlap
+            for side in ["primary", "shadow"]:
+                self.samples[side].append((comparison[side]["latencyMs"], comparison[side]["qTimeMs"], comparison[side]["bytes"]))
+        metrics.observe("shadow.latencyMsDelta", shadow["latencyMs"] - primary["latencyMs"])
+
+    def report(self) -> dict:
+        with self.lock:
+            counts = dict(self.counts)
+            overlapSum = self.searchHintOverlapSum
+            samples = {side: list(values) for side, values in self.samples.items()}
+        compared = counts["compared"]
+        return {
+            "pattern": self.template.pattern,
+            "sampleRate": self.sampleRate,
+            "counts": counts,
+            "numFoundAgreement": counts["sameNumFound"] / compared if compared else None,
+            "wizardHintAgreement": counts["sameWizardHint"] / compared if compared else None,
+            "searchHintOverlap": overlapSum / compared if compared else None,
+            "primary": summarize(samples["primary"]),
+            "shadow": summarize(samples["shadow"]),
+        }
+
+    def _count(self, key: str):
+        with self.lock:
+            self.counts[key] += 1
+
+
+def summarize(samples: list[tuple[float, Optional[float], int]]) -> Optional[dict]:
+    """Percentiles of latency & means of QTime and size of the recent samples of one side."""
+    if not samples:
+        return None
+    latencies = sorted(sample[0] for sample in samples)
+    qTimes = [sample[1] for sample in samples if sample[1] is not None]
+    return {
+        "samples": len(samples),
+        "latencyMs": {f"p{p}": round(latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))], 1) for p in [50, 90, 99]},
+        "meanQTimeMs": round(sum(qTimes) / len(qTimes), 1) if qTimes else None,
+        "meanBytes": round(sum(sample[2] for sample in samples) / len(samples)),
+    }
@@ -0,0 +1,167 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import hint_server.metrics as metrics
+
+# Version of the file's schema; files of other versions are emptied (it's a cache)
+SCHEMA_VERSION = 2
+
+
+class SharedCache:
+    """Cache shared by all worker processes on the host, in a SQLite file.
+
+    Values are JSON bytes stored under a namespace & key. The file is memory-mapped, so a read is a lookup
+    in the mapped pages and a single copy of the value into the returned bytes (which the JSON decoder
+    needs anyway), without read system calls; benchmarks/shared_cache.py measures it. WAL mode lets readers
+    run alongside a writer: reads take an idle connection of a pool (or open another one).
+
+    Requests never write: puts and the access times of hits are queued for a background writer, which
+    applies them in batches, one transaction each. Writers of different processes are serialized by
+    SQLite's locking, so only the writer thread waits for them. If the queue is full, the put is skipped.
+    When the stored values exceed maxBytes, the least recently used entries are evicted; access times are
+    updated at most once per touchIntervalSeconds per entry.
+
+    If the file can't be set up (e.g. it's locked for too long or not writable), the cache stays disabled
+    and only the in-process caches are used."""
+
+    def __init__(self, path: str, maxBytes: int, busyTimeoutMs: int = 1000, maxPendingWrites: int = 1000,
+                 touchIntervalSeconds: float = 60.0):
+        self.path = path
+        self.maxBytes = maxBytes
+        self.busyTimeout = busyTimeoutMs / 1000
+        self.touchInterval = touchIntervalSeconds
+        self.readers = queue.LifoQueue()  # idle read connections
+        self.pending = queue.Queue(maxsize=maxPendingWrites)  # (namespace, key, value or None for a hit, time)
+        self.connection = None
+        try:
+            connection = self._connect()
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                if connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                    connection.execute("DROP TABLE IF EXISTS entries")
+                    connection.execute("DROP TABLE IF EXISTS totals")
+                    connection.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+                connection.execute("CREATE TABLE IF NOT EXISTS entries (namespace TEXT, key TEXT, value BLOB, size INTEGER, stored REAL, used REAL, PRIMARY KEY (namespace, key))")
+                connection.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+                connection.execute("CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY, size INTEGER)")
+                connection.execute("INSERT OR IGNORE INTO totals VALUES (0, 0)")
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            logging.exception(f"Could not open shared cache {path}, it's disabled")
+            return
+        self.connection = connection
+        self.writer = threading.Thread(target=self._write, name="shared-cache-writer", daemon=True)
+        self.writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=self.busyTimeout, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA synchronous=NORMAL")  # it's a cache, losing the last writes on power loss is fine
+        connection.execute(f"PRAGMA mmap_size={2 * self.maxBytes}")
+        return connection
+
+    def get(self, namespace: str, key: str, maxAge: Optional[float] = None) -> Optional[bytes]:
+        if self.connection is None:
+            return None
+        try:
+            try:
+                reader = self.readers.get_nowait()
+            except queue.Empty:
+                reader = self._connect()
+            row = reader.execute("SELECT value, stored, used FROM entries WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+            self.readers.put(reader)
+        except sqlite3.Error:
+            logging.exception("Reading from shared cache failed")
+            return None
+        now = time.time()
+        if row is None or maxAge is not None and now - row[1] > maxAge:
+            metrics.increment(f"sharedCache.{namespace}.misses")
+            return None
+        metrics.increment(f"sharedCache.{namespace}.hits")
+        if now - row[2] >= self.touchInterval:
+            self._enqueue((namespace, key, None, now))
+        return row[0]
+
+    def put(self, namespace: str, key: str, value: bytes):
+        if self.connection is None:
+            return
+        if not self._enqueue((namespace, key, value, time.time())):
+            metrics.increment("sharedCache.skippedPuts")
+
+    def flush(self):
+        """Wait until the queued writes are done."""
+        if self.connection is not None:
+            self.pending.join()
+
+    def close(self):
+        if self.connection is not None:
+            self.pending.put(None)
+            self.writer.join()
+
+    def _enqueue(self, item: tuple) -> bool:
+        try:
+            self.pending.put_nowait(item)
+            return True
+        except queue.Full:
+            return False
+
+    def _write(self):
+        while True:
+            batch = [self.pending.get()]
+            while len(batch) < 100:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._apply([item for item in batch if item is not None])
+            except sqlite3.Error:
+                # e.g. another process holding the write lock for too long; the values just won't be shared
+                logging.exception("Writing to shared cache failed")
+            finally:
+                for _ in batch:
+                    self.pending.task_done()
+            if None in batch:
+                return
+
+    def _apply(self, batch: list[tuple]):
+        if not batch:
+            return
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            for namespace, key, value, now in batch:
+                if value is None:
+                    self.connection.execute("UPDATE entries SET used = ? WHERE namespace = ? AND key = ?", (now, namespace, key))
+                    continue
+                old = self.connection.execute("SELECT size FROM entries WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+                self.connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)", (namespace, key, value, len(value), now, now))
+                self.connection.execute("UPDATE totals SET size = size + ? WHERE id = 0", (len(value) - (old[0] if old else 0),))
+            total = self.connection.execute("SELECT size FROM totals WHERE id = 0").fetchone()[0]
+            if total > self.maxBytes:
+                self._evict(total - self.maxBytes)
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def _evict(self, excessBytes: int):
+        """Delete the least recently used entries freeing at least the given size (within the open transaction)."""
+        evicted = []
+        freed = 0
+        cursor = self.connection.execute("SELECT namespace, key, size FROM entries ORDER BY used")
+        for namespace, key, size in cursor:
+            evicted.append((namespace, key))
+            freed += size
+            if freed >= excessBytes:
+                break
+        cursor.close()
+        self.connection.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", evicted)
+        self.connection.execute("UPDATE totals SET size = size - ? WHERE id = 0", (freed,))
+        metrics.increment("sharedCache.evictions", len(evicted))
@@ -0,0 +1,68 @@
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+
+class RequestTrace:
+    """Wall time of the stages of one request & details about it, for the slow-request log."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.monotonic()
+        self.stages: dict[str, float] = {}  # stage -> ms, summed over repeated runs (e.g. in the backoff rerun)
+        self.details: dict[str, Any] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.addStage(name, (time.monotonic() - started) * 1000)
+
+    def addStage(self, name: str, ms: float):
+        self.stages[name] = self.stages.get(name, 0.0) + ms
+
+    def elapsedMs(self) -> float:
+        return (time.monotonic() - self.started) * 1000
+
+
+class SlowRequestLog:
+    """JSON lines log of requests slower than the threshold, plus a random sample of the others.
+
+    Entries are handed over to a background thread through a queue and written to a rotating file
+    there, so that the request thread never waits for the disk."""
+
+    def __init__(self, path: str, thresholdMs: float, sampleRate: float = 0.0, maxBytes: int = 10 << 20, backupCount: int = 5):
+        self.thresholdMs = thresholdMs
+        self.sampleRate = sampleRate
+        fileHandler = logging.handlers.RotatingFileHandler(path, maxBytes=maxBytes, backupCount=backupCount, encoding="utf8")
+        fileHandler.setFormatter(logging.Formatter("%(message)s"))
+        entries = queue.SimpleQueue()
+        self.listener = logging.handlers.QueueListener(entries, fileHandler)
+        self.listener.start()
+        self.logger = logging.getLogger(f"hint_server.slow_requests.{id(self)}")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.addHandler(logging.handlers.QueueHandler(entries))
+
+    def record(self, trace: RequestTrace):
+        elapsedMs = trace.elapsedMs()
+        if elapsedMs >= self.thresholdMs:
+            reason = "slow"
+        elif self.sampleRate > 0 and random.random() < self.sampleRate:
+            reason = "sampled"
+        else:
+            return
+        entry = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "reason": reason, "endpoint": trace.endpoint,
+                 "ms": round(elapsedMs, 1), "stages": {name: round(ms, 1) for name, ms in trace.stages.items()}}
+        entry.update(trace.details)
+        self.logger.info(json.dumps(entry, ensure_ascii=False))
+
+    def close(self):
+        self.listener.stop()
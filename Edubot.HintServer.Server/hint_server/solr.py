@@ -0,0 +1,189 @@
+import json
+import logging
+import threading
+import time
+import urllib.error
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.request import urlopen
+from typing import Optional
+
+from hint_server.deadline import isTimeout
+
+
+class SolrUnavailableError(Exception):
+    pass
+
+
+class SolrReplica:
+    """One Solr base URL, with its load, average latency and circuit breaker state."""
+
+    def __init__(self, baseUrl: str):
+        self.baseUrl = baseUrl
+        self.outstanding = 0
+        self.latency: Optional[float] = None  # moving average of response time
+        self.consecutiveFailures = 0
+        self.openedAt: Optional[float] = None  # time the circuit was opened, None if closed
+        self.probing = False  # a half-open probe request is in flight
+
+
+class SolrReplicaPool:
+    """Equivalent Solr replicas of one collection.
+
+    Requests go to the replica with the least outstanding requests (ties broken by average latency);
+    if it does not answer within the given percentile of recent latencies, a hedged duplicate is sent
+    to another replica and the first answer wins. Replicas failing repeatedly are ejected for a cooldown
+    period, then a single probe request is let through to bring them back in. The last replica that isn't
+    ejected never is, so a single Solr (or the last one up) is always tried."""
+
+    def __init__(self, baseUrls: list[str], timeoutMs: int, hedgePercentile: float, hedgeMinDelayMs: int,
+                 failureThreshold: int, cooldownSeconds: float, latencyWindow: int = 500):
+        self.replicas = [SolrReplica(baseUrl) for baseUrl in baseUrls]
+        self.timeout = timeoutMs / 1000
+        self.hedgePercentile = hedgePercentile
+        self.hedgeMinDelay = hedgeMinDelayMs / 1000
+        self.failureThreshold = failureThreshold
+        self.cooldownSeconds = cooldownSeconds
+        self.latencies = deque(maxlen=latencyWindow)
+        self.lock = threading.Lock()
+        self.executor = None
+        if len(self.replicas) > 1:
+            self.executor = ThreadPoolExecutor(thread_name_prefix="solr")
+
+    def relativeUrl(self, url: str) -> str:
+        """Strip the replica base URL the query URL was generated with."""
+        for replica in self.replicas:
+            if url.startswith(replica.baseUrl):
+                return url[len(replica.baseUrl):]
+        raise Exception(f"Solr query URL does not start with any of the configured replica URLs: {url}")
+
+    def hedgeDelay(self) -> float:
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if len(latencies) < 20:  # too few samples for a percentile yet
+            return self.hedgeMinDelay
+        idx = min(len(latencies) - 1, int(len(latencies) * self.hedgePercentile / 100))
+        return max(self.hedgeMinDelay, latencies[idx])
+
+    def query(self, url: str, timeout: Optional[float] = None, stats: Optional[dict] = None) -> dict:
+        """Run the given Solr query URL on the best replica(s), return the decoded JSON response.
+
+        If a stats dict is given, it's filled with the replica, size & fetch/decode times of the response used."""
+        suffix = self.relativeUrl(url)
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+
+        if self.executor is None:
+            replica = self._pick([])
+            if replica is None:
+                raise SolrUnavailableError(f"Solr replica {self.replicas[0].baseUrl} is ejected by circuit breaker")
+            return self._result(self._fetch(replica, suffix, timeout), stats, hedged=False)
+
+        tried = []
+        pending = set()
+        errors = []
+
+        def launch() -> bool:
+            replica = self._pick(tried)
+            if replica is None:
+                return False
+            tried.append(replica)
+            pending.add(self.executor.submit(self._fetch, replica, suffix, timeout))
+            return True
+
+        if not launch():
+            raise SolrUnavailableError("All Solr replicas are ejected by circuit breaker")
+
+        hedged = False
+        while pending:
+            done, pending = wait(pending, timeout=None if hedged else self.hedgeDelay(), return_when=FIRST_COMPLETED)
+            if not done:
+                # first replica is slow, send a hedged duplicate (only once per request)
+                hedged = True
+                if launch():
+                    logging.debug(f"Hedging Solr request to {tried[-1].baseUrl}")
+                continue
+            for future in done:
+                try:
+                    return self._result(future.result(), stats, hedged)
+                except Exception as ex:
+                    errors.append(ex)
+            if not pending:
+                launch()  # everything we sent failed, fail over to an untried replica
+
+        if errors:
+            raise errors[-1]
+        raise SolrUnavailableError("All Solr replicas are ejected by circuit breaker")
+
+    def _pick(self, exclude: list[SolrReplica]) -> Optional[SolrReplica]:
+        now = time.monotonic()
+        with self.lock:
+            candidates = [replica for replica in self.replicas
+                          if replica not in exclude and self._isAvailable(replica, now)]
+            if not candidates:
+                return None
+            replica = min(candidates, key=lambda r: (r.outstanding, r.latency or 0.0))
+            if replica.openedAt is not None:
+                replica.probing = True
+                logging.info(f"Probing ejected Solr replica {replica.baseUrl}")
+            replica.outstanding += 1
+            return replica
+
+    def _isAvailable(self, replica: SolrReplica, now: float) -> bool:
+        if replica.openedAt is None:
+            return True
+        # half-open: let one probe through after the cooldown
+        return not replica.probing and now - replica.openedAt >= self.cooldownSeconds
+
+    @staticmethod
+    def _result(fetched: tuple[dict, dict], stats: Optional[dict], hedged: bool) -> dict:
+        response, fetchStats = fetched
+        if stats is not None:
+            stats.update(fetchStats, hedged=hedged)
+        return response
+
+    def _fetch(self, replica: SolrReplica, suffix: str, timeout: float) -> tuple[dict, dict]:
+        start = time.monotonic()
+        try:
+            with urlopen(replica.baseUrl + suffix, timeout=timeout) as connection:
+                data = connection.read()
+            fetched = time.monotonic()
+            response = json.loads(data)
+        except urllib.error.HTTPError as ex:
+            # client errors mean a bad query, they say nothing about the replica
+            self._release(replica, None if ex.code < 500 else False)
+            raise
+        except Exception as ex:
+            # running out of the request's own deadline says nothing about the replica
+            self._release(replica, None if isTimeout(ex) and timeout < self.timeout else False)
+            raise
+        decoded = time.monotonic()
+        self._release(replica, True, decoded - start)
+        return response, {"replica": replica.baseUrl, "bytes": len(data), "qTimeMs": response.get("responseHeader", {}).get("QTime"),
+                          "fetchMs": round((fetched - start) * 1000, 1), "decodeMs": round((decoded - fetched) * 1000, 1)}
+
+    def _release(self, replica: SolrReplica, success: Optional[bool], latency: Optional[float] = None):
+        """Record the end of a request to the replica; success None counts neither as a success, nor a failure."""
+        with self.lock:
+            replica.outstanding -= 1
+            if success is None:
+                if replica.probing:
+                    replica.probing = False  # let another probe through
+                return
+            if latency is not None:
+                self.latencies.append(latency)
+                replica.latency = latency if replica.latency is None else 0.8 * replica.latency + 0.2 * latency
+            if success:
+                if replica.openedAt is not None:
+                    logging.info(f"Solr replica {replica.baseUrl} is back in")
+                replica.consecutiveFailures = 0
+                replica.openedAt = None
+                replica.probing = False
+                return
+            replica.consecutiveFailures += 1
+            if not replica.probing and all(other.openedAt is not None for other in self.replicas if other is not replica):
+                return  # never eject the last replica in, the requests would have nowhere to go
+            if replica.probing or replica.consecutiveFailures >= self.failureThreshold:
+                if not replica.probing:
+                    logging.warning(f"Ejecting Solr replica {replica.baseUrl} after {replica.consecutiveFailures} failures")
+                replica.openedAt = time.monotonic()
+                replica.probing = False
@@ -0,0 +1,80 @@
+import bisect
+import heapq
+import re
+import unicodedata
+from typing import Optional
+
+import hint_server.models as models
+
+# Static weights of suggestion sources, and a bonus for matching the start of the whole text (not just a word)
+ENUM_VALUE_WEIGHT = 3.0
+KEYWORD_TEXT_WEIGHT = 2.0
+KEYWORD_ID_WEIGHT = 2.0
+KEYWORD_ANCHOR_WEIGHT = 1.0
+TEXT_START_BONUS = 0.5
+
+
+def foldText(text: str) -> str:
+    """Lowercase & strip diacritics."""
+    return "".join(c for c in unicodedata.normalize("NFKD", text.lower()) if not unicodedata.combining(c))
+
+
+class SuggestEntry:
+    def __init__(self, text: str, enumType: Optional[str], valueCode: Optional[str], keywordId: Optional[str], weight: float):
+        self.text = text
+        self.enumType = enumType
+        self.valueCode = valueCode
+        self.keywordId = keywordId
+        self.weight = weight
+
+
+class SuggestIndex:
+    """Prefix index of suggestion texts: a sorted array of folded keys (each text & each of its word starts)."""
+
+    def __init__(self, entries: list[SuggestEntry]):
+        self.entries = entries
+        keys = []
+        for entryIdx, entry in enumerate(entries):
+            folded = foldText(entry.text)
+            for m in re.finditer(r'\w+', folded):
+                bonus = TEXT_START_BONUS if m.start() == 0 else 0.0
+                keys.append((folded[m.start():], -(entry.weight + bonus), entryIdx))
+        keys.sort()
+        self.keys = [key for key, _, _ in keys]
+        self.postings = [(negWeight, entryIdx) for _, negWeight, entryIdx in keys]
+
+    @staticmethod
+    def fromCollection(collectionConfig: models.CollectionConfiguration) -> "SuggestIndex":
+        evCode2Field = {ev.code: ev.field for ev in collectionConfig.enumValues}
+        entries = []
+        seen = set()
+
+        def add(text: Optional[str], valueCode: Optional[str], keywordId: Optional[str], weight: float):
+            text = (text or "").strip()
+            if not text or (foldText(text), valueCode) in seen:
+                return
+            seen.add((foldText(text), valueCode))
+            entries.append(SuggestEntry(text, evCode2Field.get(valueCode), valueCode, keywordId, weight))
+
+        for ev in collectionConfig.enumValues:
+            if not ev.isUnknown and not ev.isNotRelevant:
+                add(ev.text, ev.code, None, ENUM_VALUE_WEIGHT)
+        for kw in collectionConfig.keywords:
+            add(kw.text, kw.enumValueCode, kw.id, KEYWORD_TEXT_WEIGHT)
+            add(re.sub(r'\s*\[[^\]]*\]$', '', kw.id or ""), kw.enumValueCode, kw.id, KEYWORD_ID_WEIGHT)  # strip "[category]"
+            for anchor in (kw.anchors or "").split(";"):
+                add(anchor, kw.enumValueCode, kw.id, KEYWORD_ANCHOR_WEIGHT)
+        return SuggestIndex(entries)
+
+    def suggest(self, prefix: str, limit: int) -> list[SuggestEntry]:
+        """Best-weighted entries with a text or word starting with the given prefix (folded)."""
+        prefix = foldText(prefix).lstrip()
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + "\uffff", start)
+        best = {}
+        for negWeight, entryIdx in self.postings[start:end]:
+            best[entryIdx] = min(best.get(entryIdx, 0.0), negWeight)
+        top = heapq.nsmallest(limit, best.items(), key=lambda item: (item[1], len(self.entries[item[0]].text), item[0]))
+        return [self.entries[entryIdx] for entryIdx, _ in top]
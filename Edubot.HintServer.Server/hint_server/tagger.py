@@ -0,0 +1,77 @@
+import json
+import logging
+from urllib.request import urlopen
+from urllib.parse import quote, urlencode, parse_qsl
+from typing import Optional
+
+# Separator of texts in a batched call; an empty line always ends a sentence for the tagger
+BATCH_SEPARATOR = "\n\n"
+# Longer texts are POSTed as a form instead of being put into the URL
+MAX_GET_TEXT_LENGTH = 2000
+
+
+def callTagger(urlPattern: str, text: str, timeout: Optional[float] = None) -> list[dict]:
+    """Call the Morphodita tagger, return all tokens of all sentences."""
+    if len(text) <= MAX_GET_TEXT_LENGTH:
+        url = urlPattern.replace("{text}", quote(text))
+        connection = urlopen(url, timeout=timeout)
+    else:
+        url, _, query = urlPattern.partition("?")
+        params = [(name, text if value == "{text}" else value) for name, value in parse_qsl(query, keep_blank_values=True)]
+        connection = urlopen(url, data=urlencode(params).encode("utf-8"), timeout=timeout)
+    response = json.load(connection)
+    return [tok for sent in response['result'] for tok in sent]
+
+
+def lemmatizedText(tokens: list[dict]) -> str:
+    return ''.join(tok['lemma'] + tok.get('space', '') for tok in tokens)
+
+
+def splitBatchTokens(texts: list[str], tokens: list[dict]) -> Optional[list[list[dict]]]:
+    """Split tokens of texts tagged as one BATCH_SEPARATOR-joined input back per text.
+
+    Tokens are assigned by their character offsets; the trailing whitespace of each text's last token
+    is cut at the text end, so each part is the same as if the text was tagged alone.
+    Returns None if the tokens don't cover the input exactly (e.g. the tagger normalized something)."""
+    parts = [[] for _ in texts]
+    ends = []
+    offset = 0
+    for text in texts:
+        ends.append(offset + len(text))
+        offset += len(text) + len(BATCH_SEPARATOR)
+
+    idx = 0
+    pos = 0
+    for tok in tokens:
+        while idx < len(texts) and pos >= ends[idx]:
+            idx += 1
+        if idx == len(texts):
+            return None
+        space = tok.get('space', '')
+        tokEnd = pos + len(tok['token'])
+        if tokEnd > ends[idx]:
+            return None
+        pos = tokEnd + len(space)
+        if pos > ends[idx]:
+            tok = dict(tok, space=space[:ends[idx] - tokEnd])
+        parts[idx].append(tok)
+    if pos != offset - len(BATCH_SEPARATOR):
+        return None
+    return parts
+
+
+def tagBatch(urlPattern: str, texts: list[str], timeout: Optional[float] = None) -> list[list[dict]]:
+    """Tag several texts in one tagger call, return tokens per text.
+
+    Empty texts are not sent; if the batch can't be split back, the texts are tagged one by one."""
+    nonEmpty = [text for text in texts if text]
+    parts = None
+    if len(nonEmpty) > 1:
+        tokens = callTagger(urlPattern, BATCH_SEPARATOR.join(nonEmpty), timeout)
+        parts = splitBatchTokens(nonEmpty, tokens)
+        if parts is None:
+            logging.warning("Lemmatizer batch could not be split back, lemmatizing texts one by one")
+    if parts is None:
+        parts = [callTagger(urlPattern, text, timeout) for text in nonEmpty]
+    tagged = iter(parts)
+    return [next(tagged) if text else [] for text in texts]
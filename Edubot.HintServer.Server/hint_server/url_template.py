@@ -0,0 +1,200 @@
+import re
+import logging
+from urllib.parse import quote
+from typing import Optional
+
+# Kinds of template parts
+LITERAL = "literal"
+HINTING_PARAMS = "hintingparams"
+TEXT = "text"
+ENUM = "enum"
+CLAUSES = "clauses"
+
+# Text mark-up -> (lemmatized, quoted)
+TEXT_MARKUPS = {
+    "{text|unquoted}": (False, False),
+    "{text|quoted}": (False, True),
+    "{text|lemmatized,unquoted}": (True, False),
+    "{text|lemmatized,quoted}": (True, True),
+}
+
+# Literals around the text clauses of a parenthesized OR group: "(field:(", ")^boost OR field:(", ")^boost)"
+CLAUSES_START = re.compile(r'\(([\w.]+):\($')
+CLAUSES_SEPARATOR = re.compile(r'^\)(?:\^([0-9.]+))?%20OR%20([\w.]+):\($')
+CLAUSES_END = re.compile(r'^\)(?:\^([0-9.]+))?\)')
+
+
+class UrlTemplate:
+    """Solr query URL pattern parsed once into parts: literal text (already unescaped), or mark-ups
+    that are replaced by the query text, enum value filters & hinting parameters.
+
+    Each part is a tuple (kind, *args): (LITERAL, text), (HINTING_PARAMS,), (TEXT, lemmatized, quoted),
+    (ENUM, field, mode), or (CLAUSES, clauses) for an OR group of text clauses "field:({text|...})^boost",
+    each clause being a tuple (field, lemmatized, quoted, boost).
+
+    The text clauses are rewritten for each query by a plan: clauses rendering identically (the same field
+    with the same text, e.g. plain & lemmatized text when the lemmatizer is off) are merged keeping the higher
+    boost, and clauses with empty text are dropped. Plans depend only on which of the texts are equal or
+    empty, so they're cached by that. The rewrites are logged (at debug level) once, when a plan is built,
+    not each time it's applied."""
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.parts: list[tuple] = []
+
+        literal = ''
+        offset = 0
+        for repl in re.finditer(r'(\\*)(\{[^\}]*\})', pattern):
+            backslashes = repl.group(1)
+            repl_start = repl.start() + len(backslashes)
+            literal += pattern[offset:repl_start]
+            offset = repl.end()
+            if len(backslashes) % 2:  # odd number of backslashes -- escaped, skip
+                literal += pattern[repl_start:offset]
+                continue
+            self._addLiteral(literal)
+            literal = ''
+            self.parts.append(UrlTemplate.parseMarkup(repl.group(2)))
+        self._addLiteral(literal + pattern[offset:])
+        self.parts = groupClauses(self.parts)
+        self.plans: dict[tuple, tuple] = {}
+
+    @staticmethod
+    def parseMarkup(markup: str) -> tuple:
+        if markup == "{hintingparams}":
+            return (HINTING_PARAMS,)
+        if markup in TEXT_MARKUPS:
+            return (TEXT,) + TEXT_MARKUPS[markup]
+        if markup.startswith("{enum:"):
+            args = markup[len("{enum:"):-1].split("|")
+            if len(args) == 3 and args[1] == "convertFromId" and args[2] in ["pre-AND", "fq"]:
+                return (ENUM, args[0], args[2])
+        raise Exception(f"Invalid format of Solr query URL: Unsupported markup: {markup}")
+
+    def _addLiteral(self, literal: str):
+        literal = re.sub(r'\\([\\\{\}])', r'\1', literal)  # unescape \, {, }
+        literal = literal.replace(" ", "%20")
+        if literal:
+            self.parts.append((LITERAL, literal))
+
+    def format(self, text: Optional[str], lemmatizedText: Optional[str], hintingParams: Optional[str],
+               enumValues: Optional[dict[str, list[str]]], notRelevantFields: Optional[dict[str, bool]]) -> str:
+        text = "" if text is None else text
+        hintingParams = "" if hintingParams is None else hintingParams
+        enumValues = {} if enumValues is None else enumValues
+        notRelevantFields = {} if notRelevantFields is None else notRelevantFields
+
+        # default lemmatized to plain text, if not available
+        lemmatized_text = text if lemmatizedText is None else lemmatizedText
+
+        url = []
+        for index, part in enumerate(self.parts):
+            kind = part[0]
+            if kind == LITERAL:
+                url.append(part[1])
+            elif kind == CLAUSES:
+                clauses = []
+                for field, lemmatized, quoted, boost in self.plan(index, part[1], text, lemmatized_text):
+                    value = lemmatized_text if lemmatized else text
+                    value = quote(f"\"{value}\"" if quoted else value)
+                    clauses.append(f"{field}:({value})" + (f"^{boost}" if boost else ""))
+                url.append("%20OR%20".join(clauses) if clauses else "*:*")
+            elif kind == HINTING_PARAMS:
+                url.append(hintingParams)
+            elif kind == TEXT:
+                value = lemmatized_text if part[1] else text
+                url.append(quote(f"\"{value}\"" if part[2] else value))
+            else:
+                enumField, mode = part[1], part[2]
+                if enumField not in enumValues or len(enumValues[enumField]) == 0 or enumField in notRelevantFields:
+                    continue
+                if mode == "fq":
+                    # separate filter query, cached by Solr on its own; tagged so that facets can exclude it
+                    enumValuesSeparated = " OR ".join(map(lambda x: f"{enumField}:\"{x}\"", enumValues[enumField]))
+                    url.append("&fq=" + quote(f"{{!tag={enumField}}}({enumValuesSeparated})"))
+                else:
+                    enumValuesSeparated = " OR ".join(map(lambda x: f"({enumField}:\"{x}\")", enumValues[enumField]))
+                    url.append(quote(f" AND ({enumValuesSeparated})"))
+
+        url = "".join(url)
+        logging.debug(url)
+        return url
+
+    def plan(self, index: int, clauses: tuple, text: str, lemmatizedText: str) -> tuple:
+        """Clauses of the group at the given index to send for the given texts."""
+        key = (index, text == lemmatizedText, not text.strip(), not lemmatizedText.strip())
+        plan = self.plans.get(key)
+        if plan is None:
+            plan = planClauses(clauses, *key[1:])
+            self.plans[key] = plan
+        return plan
+
+
+def groupClauses(parts: list[tuple]) -> list[tuple]:
+    """Replace runs of literals & text mark-ups forming an OR group of text clauses by CLAUSES parts."""
+    grouped = []
+    i = 0
+    while i < len(parts):
+        start = CLAUSES_START.search(parts[i][1]) if parts[i][0] == LITERAL else None
+        if start is None:
+            grouped.append(parts[i])
+            i += 1
+            continue
+
+        clauses = []
+        field = start.group(1)
+        j = i + 1
+        end = None
+        while j + 1 < len(parts) and parts[j][0] == TEXT and parts[j + 1][0] == LITERAL:
+            separator = CLAUSES_SEPARATOR.match(parts[j + 1][1])
+            if separator is not None:
+                clauses.append((field, parts[j][1], parts[j][2], separator.group(1)))
+                field = separator.group(2)
+                j += 2
+                continue
+            end = CLAUSES_END.match(parts[j + 1][1])
+            if end is not None:
+                clauses.append((field, parts[j][1], parts[j][2], end.group(1)))
+            break
+
+        if end is None:  # not a group of clauses after all
+            grouped.append(parts[i])
+            i += 1
+            continue
+        prefix = parts[i][1][:start.start() + 1]
+        grouped.append((LITERAL, prefix))
+        grouped.append((CLAUSES, tuple(clauses)))
+        grouped.append((LITERAL, ")" + parts[j + 1][1][end.end():]))
+        i = j + 2
+    return grouped
+
+
+def planClauses(clauses: tuple, sameText: bool, textEmpty: bool, lemmatizedEmpty: bool) -> tuple:
+    """Merge clauses rendering identically (keeping the higher boost) & drop clauses with empty text."""
+    planned = []
+    kept = {}  # (field, uses lemmas, quoted) -> index in planned
+    for clause in clauses:
+        field, lemmatized, quoted, boost = clause
+        usesLemmas = lemmatized and not sameText
+        if lemmatizedEmpty if usesLemmas else textEmpty:
+            logging.debug(f"Query plan: dropping clause {describeClause(clause)} with empty text")
+            continue
+        key = (field, usesLemmas, quoted)
+        if key not in kept:
+            kept[key] = len(planned)
+            planned.append(clause)
+            continue
+        other = planned[kept[key]]
+        if float(boost or 1) > float(other[3] or 1):
+            planned[kept[key]] = other[:3] + (boost,)
+        logging.debug(f"Query plan: merging clause {describeClause(clause)} into {describeClause(other)}, "
+                      f"boost {max(float(boost or 1), float(other[3] or 1)):g}")
+    if not planned:
+        logging.debug("Query plan: no text clauses left, matching all documents")
+    return tuple(planned)
+
+
+def describeClause(clause: tuple) -> str:
+    field, lemmatized, quoted, boost = clause
+    markup = ("lemmatized," if lemmatized else "") + ("quoted" if quoted else "unquoted")
+    return f"{field}:({{text|{markup}}})" + (f"^{boost}" if boost else "")
@@ -0,0 +1,113 @@
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import hint_server.models as models
+import hint_server.logic as logic
+
+# Warm-up progress, reported by the readiness endpoint
+lock = threading.Lock()
+status = {"state": "pending", "source": None, "queries": 0, "done": 0, "failed": 0, "seconds": None}
+
+
+def readQueryLog(path: str, topN: int) -> list[str]:
+    """Get the most frequent queries from a log with one query per line, either as plain text
+    or as a JSON object with a "query" field (e.g. a logged search request)."""
+    counts = Counter()
+    with open(path, "r", encoding="utf8") as file:
+        for line in file:
+            line = line.strip()
+            if line.startswith("{"):
+                try:
+                    line = json.loads(line).get("query") or ""
+                except ValueError:
+                    pass
+            if line:
+                counts[line] += 1
+    return [query for query, _ in counts.most_common(topN)]
+
+
+def synthesizeQueries(collectionConfig: models.CollectionConfiguration, topN: int) -> list[str]:
+    """Queries made of the keyword texts & anchors and the enum value texts of the collection."""
+    queries = {"": None}
+    for kw in collectionConfig.keywords:
+        for text in [kw.text] + (kw.anchors or "").split(";"):
+            if text and text.strip():
+                queries[text.strip()] = None
+    for ev in collectionConfig.enumValues:
+        if not ev.isUnknown and not ev.isNotRelevant:
+            queries[ev.text] = None
+    return list(queries)[:topN]
+
+
+def warmUp(config: models.AppConfiguration) -> dict:
+    """Run the configured warm-up queries through the normal search pipeline, to fill the lemma & Solr
+    response caches and build all lazily computed structures."""
+    defaultConfig = config.defaultConfiguration
+    collectionConfig = config.collections[defaultConfig.defaultCollection]
+    topN = logic.defaultIfNone(defaultConfig.warmupTopN, 0)
+    if topN <= 0:
+        return setStatus(state="done", source=None)
+
+    started = time.monotonic()
+    if defaultConfig.warmupQueryLogPath:
+        source = defaultConfig.warmupQueryLogPath
+        queries = readQueryLog(defaultConfig.warmupQueryLogPath, topN)
+    else:
+        source = "config"
+        queries = synthesizeQueries(collectionConfig, topN)
+    setStatus(state="running", source=source, queries=len(queries))
+    logging.info(f"Warming up with {len(queries)} queries from {source}")
+
+    def run(query: str):
+        request = models.SearchRequest(query=query, enumValues=[], detectEnums=True, doRedirection=True,
+                                       returnSearchHints=True, returnWizardHints=True)
+        try:
+            logic.search(request, config)
+            countQuery("done")
+        except Exception:
+            logging.exception(f"Warm-up query failed: {query}")
+            countQuery("failed")
+
+    with ThreadPoolExecutor(max_workers=logic.defaultIfNone(defaultConfig.warmupConcurrency, 4), thread_name_prefix="warmup") as executor:
+        list(executor.map(run, queries))
+
+    lemmaCache = logic.getOrCreateLemmaCache(collectionConfig)
+    solrCache = logic.getOrCreateSolrCache(collectionConfig)
+    result = setStatus(state="done", seconds=round(time.monotonic() - started, 3),
+                       lemmaCacheEntries=None if lemmaCache is None else len(lemmaCache),
+                       solrCacheEntries=None if solrCache is None else len(solrCache))
+    logging.info(f"Warm-up done: {result}")
+    return result
+
+
+def startWarmUp(config: models.AppConfiguration):
+    """Warm up in the background; the server reports ready when it's done (even if it failed)."""
+    def run():
+        try:
+            warmUp(config)
+        except Exception as ex:
+            logging.exception("Warm-up failed")
+            setStatus(state="done", error=str(ex))
+
+    threading.Thread(target=run, name="warmup", daemon=True).start()
+
+
+def countQuery(key: str):
+    with lock:
+        status[key] += 1
+
+
+def setStatus(**values) -> dict:
+    with lock:
+        status.update(values)
+        return dict(status)
+
+
+def getStatus() -> dict:
+    with lock:
+        return dict(status)
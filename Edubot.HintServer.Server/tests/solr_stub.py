@@ -0,0 +1,50 @@
+"""A minimal stand-in for Solr replicas in tests: answers indexversion & select requests, counting them."""
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class SolrStub:
+
+    def __init__(self, generation: int = 1, numFound: int = 5):
+        self.generation = generation
+        self.numFound = numFound
+        self.failing = False
+        self.errorStatus = 503  # of the failing responses
+        self.delay = 0.0  # of select responses, in seconds
+        self.requests: list[str] = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests.append(self.path)
+                if stub.delay and "command=indexversion" not in self.path:
+                    time.sleep(stub.delay)
+                if stub.failing:
+                    self.send_error(stub.errorStatus)
+                    return
+                if "command=indexversion" in self.path:
+                    body = {"indexversion": stub.generation * 1000, "generation": stub.generation}
+                else:
+                    body = {"responseHeader": {"QTime": 1}, "response": {"numFound": stub.numFound, "docs": []},
+                            "stats": {"stats_fields": {"id": {"facets": {}}}}}
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def selects(self) -> int:
+        return sum("command=indexversion" not in path for path in self.requests)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
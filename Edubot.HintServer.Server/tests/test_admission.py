@@ -0,0 +1,49 @@
+"""Admission control: shedding of queued requests without a request deadline.
+
+Usage: python -m pytest tests (or python -m unittest discover tests)"""
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from hint_server.admission import AdmissionController, AdmissionRejectedError, PRIORITY_EXPENSIVE
+from hint_server.deadline import Deadline
+
+
+class AdmissionTest(unittest.TestCase):
+
+    def controller(self, maxQueueWaitMs: int) -> AdmissionController:
+        return AdmissionController(maxInFlight=1, maxQueueDepth=10, ratePerSecond=None, burst=1, maxQueueWaitMs=maxQueueWaitMs)
+
+    def test_queued_request_is_rejected_after_max_queue_wait(self):
+        controller = self.controller(100)
+        with controller.admit(None, PRIORITY_EXPENSIVE, Deadline(None)):
+            started = time.monotonic()
+            with self.assertRaisesRegex(AdmissionRejectedError, "waited too long"):
+                controller.admit(None, PRIORITY_EXPENSIVE, Deadline(None))
+            self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(controller.inFlight, 0)
+        self.assertEqual(controller.waiting, [])
+
+    def test_expected_wait_over_max_queue_wait_is_rejected_right_away(self):
+        controller = self.controller(100)
+        controller.serviceTime[PRIORITY_EXPENSIVE] = 1.0  # requests take a second
+        with controller.admit(None, PRIORITY_EXPENSIVE, Deadline(None)):
+            started = time.monotonic()
+            with self.assertRaisesRegex(AdmissionRejectedError, "expected wait"):
+                controller.admit(None, PRIORITY_EXPENSIVE, Deadline(None))
+            self.assertLess(time.monotonic() - started, 0.05)
+
+    def test_queued_request_gets_the_released_slot(self):
+        controller = self.controller(2000)
+        ticket = controller.admit(None, PRIORITY_EXPENSIVE, Deadline(None))
+        threading.Timer(0.05, ticket.__exit__).start()
+        with controller.admit(None, PRIORITY_EXPENSIVE, Deadline(None)):
+            self.assertEqual(controller.inFlight, 1)
+        self.assertEqual(controller.inFlight, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""Compiled config snapshots: what they hash, when they're used & what they leave out.
+
+Usage: python -m pytest tests (or python -m unittest discover tests)"""
+import json
+import os
+import pickle
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import hint_server.config as config
+import hint_server.logic as logic
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "app.config.json")
+
+
+class ConfigSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        with open(CONFIG_PATH, encoding="utf8") as file:
+            self.appConfig = json.load(file)
+        self.collectionName = self.appConfig["DefaultConfiguration"]["DefaultCollection"]
+        self.appConfig["Collections"][self.collectionName]["LemmatizeUrlPattern"] = ""
+        self.configPath = os.path.join(directory.name, "app.config.json")
+        self.snapshotPath = os.path.join(directory.name, "app.config.snapshot")
+        self.writeConfig()
+
+    def writeConfig(self):
+        with open(self.configPath, "w", encoding="utf8") as file:
+            json.dump(self.appConfig, file, ensure_ascii=False)
+
+    def keywords(self) -> list:
+        return [kw for kw in config.config.collections[self.collectionName].keywords if kw.regex]
+
+    def test_snapshot_is_loaded_and_compiles_keyword_regexes_on_use(self):
+        self.assertTrue(config.compileConfig(self.configPath, self.snapshotPath), config.error_description)
+        config.config = None
+        config.loadConfig(self.configPath, self.snapshotPath)
+        collection = config.config.collections[self.collectionName]
+        self.assertIsNotNone(collection.precomputedUrlTemplate)  # precomputed in the snapshot
+        keyword = self.keywords()[0]
+        self.assertIsNone(keyword.precomputedRegex)
+        self.assertEqual(logic.getOrCreateKeywordRegex(keyword).pattern, keyword.regex)
+
+    def test_hashed_modules_are_those_of_pickled_classes(self):
+        config.compileConfig(self.configPath, self.snapshotPath)
+        with open(self.snapshotPath, "rb") as file:
+            sources = pickle.load(file)
+        self.assertEqual(sorted(sources["modules"]),
+                         ["hint_server.logic", "hint_server.models", "hint_server.suggest", "hint_server.url_template"])
+
+    def test_stale_snapshot_is_not_used(self):
+        config.compileConfig(self.configPath, self.snapshotPath)
+        self.appConfig["Collections"][self.collectionName]["Keywords"] = []
+        self.writeConfig()
+        config.loadConfig(self.configPath, self.snapshotPath)
+        self.assertEqual(self.keywords(), [])
+
+    def test_no_snapshot_by_default(self):
+        config.compileConfig(self.configPath, self.snapshotPath)
+        config.config = None
+        config.loadConfig(self.configPath)
+        self.assertIsNone(config.config.collections[self.collectionName].precomputedUrlTemplate)
+        self.assertIsNotNone(self.keywords()[0].precomputedRegex)
+
+
+if __name__ == "__main__":
+    unittest.main()
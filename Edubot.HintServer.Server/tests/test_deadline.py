@@ -0,0 +1,89 @@
+"""Request deadlines in /hint and in the lemmatizer micro-batcher.
+
+Usage: python -m pytest tests (or python -m unittest discover tests)"""
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+import hint_server.config as config
+import hint_server.lemmatizer as lemmatizer
+import hint_server.logic as logic
+import hint_server.models as models
+from hint_server.deadline import Deadline
+from solr_stub import SolrStub
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "app.config.json")
+
+
+class LemmatizerBatcherDeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []  # (texts, timeout)
+        original = lemmatizer.tagBatch
+        lemmatizer.tagBatch = lambda urlPattern, texts, timeout: self.calls.append((texts, timeout)) or \
+            [[{"token": text, "lemma": text}] for text in texts]
+        self.addCleanup(setattr, lemmatizer, "tagBatch", original)
+
+    def test_tagger_call_gets_the_remaining_budget(self):
+        batcher = lemmatizer.LemmatizerBatcher("http://tagger/?data={text}", maxWaitMs=1, maxBatchSize=10, timeoutMs=10000)
+        batcher.lemmatize("zlomky", timeout=0.5)
+        (texts, timeout), = self.calls
+        self.assertEqual(texts, ["zlomky"])
+        self.assertLess(timeout, 0.5)
+        batcher.lemmatize("zlomky")
+        self.assertEqual(self.calls[-1][1], 10.0)
+
+    def test_texts_out_of_time_are_not_sent(self):
+        batcher = lemmatizer.LemmatizerBatcher("http://tagger/?data={text}", maxWaitMs=200, maxBatchSize=10, timeoutMs=10000)
+        with self.assertRaises(FutureTimeoutError):
+            batcher.lemmatize("zlomky", timeout=0.05)
+        time.sleep(0.3)
+        self.assertEqual(self.calls, [])
+
+
+class HintDeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.solr = SolrStub()
+        self.addCleanup(self.solr.close)
+        with open(CONFIG_PATH, encoding="utf8") as file:
+            appConfig = json.load(file)
+        collectionName = appConfig["DefaultConfiguration"]["DefaultCollection"]
+        collection = appConfig["Collections"][collectionName]
+        collection["SolrQueryUrlPattern"] = self.solr.url + "/solr/ema/select?" + collection["SolrQueryUrlPattern"].split("?", 1)[1]
+        collection.pop("SolrReplicaUrls", None)
+        collection.pop("ShadowSolrQueryUrlPattern", None)
+        collection["LemmatizeUrlPattern"] = ""
+        appConfig["DefaultConfiguration"]["SlowLogPath"] = None
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf8") as file:
+            json.dump(appConfig, file, ensure_ascii=False)
+        self.addCleanup(os.remove, file.name)
+        config.readAndValidateConfig(file.name)
+        self.assertIsNotNone(config.config, config.error_description)
+        self.config = config.config
+
+    def hint(self, deadline: Deadline) -> models.HintResponse:
+        return logic.hint(models.HintRequest(textValue="zlomky", enumValues={}, notRelevantValues=[]), self.config, deadline=deadline)
+
+    def test_slow_solr_degrades_the_hints(self):
+        self.solr.delay = 0.5
+        started = time.monotonic()
+        response = self.hint(Deadline(200))
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertTrue(response.degraded)
+        self.assertEqual(response.degradedStages, ["solr"])
+        self.assertEqual(response.searchHints, [])
+
+    def test_in_time(self):
+        response = self.hint(Deadline(5000))
+        self.assertFalse(response.degraded)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+import hint_server.config as config
+import hint_server.logic as logic
+import hint_server.metrics as metrics
+import hint_server.models as models
+from solr_stub import SolrStub
+from test_index_generation import waitFor
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "app.config.json")
+
+
+class DetectionNegativeCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.solr = SolrStub(generation=1, numFound=0)
+        self.addCleanup(self.solr.close)
+        with open(CONFIG_PATH, encoding="utf8") as file:
+            appConfig = json.load(file)
+        collectionName = appConfig["DefaultConfiguration"]["DefaultCollection"]
+        collection = appConfig["Collections"][collectionName]
+        collection["SolrQueryUrlPattern"] = self.solr.url + "/solr/ema/select?" + collection["SolrQueryUrlPattern"].split("?", 1)[1]
+        collection.pop("SolrReplicaUrls", None)
+        collection.pop("ShadowSolrQueryUrlPattern", None)
+        collection["LemmatizeUrlPattern"] = ""
+        collection["DetectionNegativeCacheSize"] = 10
+        collection["IndexGenerationCheckSeconds"] = 0.05
+        appConfig["DefaultConfiguration"]["SlowLogPath"] = None
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf8") as file:
+            json.dump(appConfig, file, ensure_ascii=False)
+        self.addCleanup(os.remove, file.name)
+        config.readAndValidateConfig(file.name)
+        self.assertIsNotNone(config.config, config.error_description)
+        self.config = config.config
+        self.collection = self.config.collections[collectionName]
+        self.addCleanup(lambda: self.collection.precomputedIndexGeneration.close())
+        self.assertTrue(waitFor(lambda: logic.getOrCreateIndexGeneration(self.collection).current() == 1))
+
+    def search(self) -> int:
+        """Number of Solr queries of a search with detection finding nothing."""
+        before = self.solr.selects()
+        request = models.SearchRequest(query="pracovní listy pro MŠ", enumValues=[], detectEnums=True, doRedirection=True,
+                                       returnSearchHints=True, returnWizardHints=True)
+        logic.search(request, self.config)
+        return self.solr.selects() - before
+
+    def saved(self) -> int:
+        return metrics.snapshot()["counters"].get("detectionNegativeCache.savedSolrCalls", 0)
+
+    def test_skips_detection_known_to_find_nothing(self):
+        saved = self.saved()
+        self.assertEqual(self.search(), 2)  # detected query & the backoff
+        self.assertEqual(self.search(), 1)  # straight to the backoff
+        self.assertEqual(self.saved(), saved + 1)
+
+    def test_expires_with_index_generation(self):
+        self.assertEqual(self.search(), 2)
+        self.solr.generation = 2
+        self.assertTrue(waitFor(lambda: logic.getOrCreateIndexGeneration(self.collection).current() == 2))
+        self.assertEqual(self.search(), 2)
+        self.assertEqual(self.search(), 1)
+
+    def test_not_used_without_generation(self):
+        self.solr.generation = None  # answers without a usable generation
+        self.assertTrue(waitFor(lambda: logic.getOrCreateIndexGeneration(self.collection).current() is None))
+        self.assertEqual(self.search(), 2)
+        self.assertEqual(self.search(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
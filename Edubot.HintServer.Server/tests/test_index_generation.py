@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+from hint_server.index_generation import IndexGeneration, indexVersionUrl
+from solr_stub import SolrStub
+
+
+def waitFor(condition, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+class IndexGenerationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.replicas = [SolrStub(generation=3), SolrStub(generation=3)]
+
+    def tearDown(self):
+        for replica in self.replicas:
+            replica.close()
+
+    def generation(self, checkInterval: float = 0.05) -> IndexGeneration:
+        generation = IndexGeneration([indexVersionUrl(f"{replica.url}/solr/ema/select?q={{text|unquoted}}")
+                                      for replica in self.replicas], checkInterval=checkInterval, timeout=1.0)
+        self.addCleanup(generation.close)
+        return generation
+
+    def test_url(self):
+        self.assertEqual(indexVersionUrl("http://solr/solr/ema/select?q=({text|unquoted})&rows=10"),
+                         "http://solr/solr/ema/replication?command=indexversion&wt=json")
+
+    def test_polled_in_background(self):
+        generation = self.generation()
+        self.assertTrue(waitFor(lambda: generation.current() == 3))
+        for replica in self.replicas:
+            replica.generation = 4
+        self.assertTrue(waitFor(lambda: generation.current() == 4))
+        self.assertTrue(all(path.startswith("/solr/ema/replication") for replica in self.replicas for path in replica.requests))
+
+    def test_unknown_while_replicas_differ(self):
+        self.replicas[1].generation = 2
+        generation = self.generation()
+        self.assertTrue(waitFor(lambda: len(self.replicas[1].requests) >= 2))
+        self.assertIsNone(generation.current())
+        self.replicas[1].generation = 3
+        self.assertTrue(waitFor(lambda: generation.current() == 3))
+
+    def test_unknown_when_a_replica_fails(self):
+        generation = self.generation()
+        self.assertTrue(waitFor(lambda: generation.current() == 3))
+        self.replicas[0].failing = True
+        self.assertTrue(waitFor(lambda: generation.current() is None))
+
+    def test_reading_does_not_wait_for_solr(self):
+        generation = self.generation(checkInterval=60)
+        started = time.monotonic()
+        for _ in range(100):
+            generation.current()
+        self.assertLess(time.monotonic() - started, 0.05)
+        self.assertTrue(waitFor(lambda: generation.current() == 3))
+        self.assertEqual(len(self.replicas[0].requests), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import hint_server.config as config
+import hint_server.logic as logic
+import hint_server.models as models
+from hint_server.lemmatizer import alignTokens
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "app.config.json")
+
+
+def tagged(pairs: list[tuple[str, str]]) -> models.LemmatizedString:
+    """Lemmatized text of (token, lemma) pairs separated by spaces."""
+    tokens = [{"token": token, "lemma": lemma, "space": " "} for token, lemma in pairs]
+    tokens[-1]["space"] = ""
+    return alignTokens(" ".join(token for token, _ in pairs), tokens)
+
+
+class RedirectTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(CONFIG_PATH, encoding="utf8") as file:
+            appConfig = json.load(file)
+        collectionName = appConfig["DefaultConfiguration"]["DefaultCollection"]
+        collection = appConfig["Collections"][collectionName]
+        collection["LemmatizeUrlPattern"] = ""
+        collection.pop("SolrReplicaUrls", None)
+        appConfig["DefaultConfiguration"]["SlowLogPath"] = None
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf8") as file:
+            json.dump(appConfig, file, ensure_ascii=False)
+        self.addCleanup(os.remove, file.name)
+        config.readAndValidateConfig(file.name)
+        self.assertIsNotNone(config.config, config.error_description)
+        self.collection = config.config.collections[collectionName]
+
+    def redirect(self, lemmatized: models.LemmatizedString, detectEnums: bool = True) -> models.RedirectResponse:
+        request = models.RedirectRequest()
+        request.detectEnums = detectEnums
+        request.doRedirection = True
+        request.textValue = lemmatized.plain
+        request.lemmatized = lemmatized
+        request.enumValues = {}
+        request.notRelevantValues = []
+        return logic.redirect(request, self.collection)
+
+    def test_target_lemmas_are_spliced_in(self):
+        self.collection.precomputedRedirectionLemmas["Zlomek [pojem]"] = tagged([("zlomky", "zlomek")])
+        response = self.redirect(tagged([("příklady", "příklad"), ("na", "na"), ("čitatele", "čitatel")]))
+        self.assertTrue(response.anyRedirection)
+        self.assertEqual(response.redirectedTextValue, "příklady na zlomky")
+        self.assertEqual(response.redirectedLemmatizedValue, "příklad na zlomek")
+
+    def test_target_enum_value_replaces_the_keywords_one(self):
+        response = self.redirect(tagged([("pracovní", "pracovní"), ("list", "list"), ("zlomky", "zlomek")]))
+        self.assertEqual([value.code for value in response.redirectedEnumValues], ["8-MS"])
+        self.assertEqual(response.redirectedTextValue, "zlomky")
+        self.assertEqual(response.redirectedLemmatizedValue, "zlomek")
+
+    def test_target_enum_value_without_detection(self):
+        response = self.redirect(tagged([("pracovní", "pracovní"), ("list", "list"), ("zlomky", "zlomek")]), detectEnums=False)
+        self.assertFalse(response.anyDetection)
+        self.assertTrue(response.anyRedirection)
+        self.assertEqual([value.code for value in response.redirectedEnumValues], ["8-MS"])
+        self.assertEqual(response.redirectedTextValue, "zlomky")
+
+    def test_splice_recomputes_alignment(self):
+        lemmatized = tagged([("příklady", "příklad"), ("na", "na"), ("čitatele", "čitatel"), ("a", "a"), ("jmenovatele", "jmenovatel")])
+        replacement = tagged([("zlomky", "zlomek")])
+        start = lemmatized.lemmatized.index("čitatel")
+        spliced = logic.spliceLemmatized(lemmatized, [(start, start + len("čitatel"), replacement)])
+        self.assertEqual(spliced.plain, "příklady na zlomky a jmenovatele")
+        self.assertEqual(spliced.lemmatized, "příklad na zlomek a jmenovatel")
+        self.assertEqual(spliced.alignment[-1], (len(spliced.lemmatized), len(spliced.plain)))
+        # each lemma maps to the start of its word in the plain text
+        for lemma, plain in [("na", "na"), ("zlomek", "zlomky"), ("jmenovatel", "jmenovatele")]:
+            self.assertEqual(spliced.mapBoundary(spliced.lemmatized.index(lemma)), spliced.plain.index(plain))
+
+
+if __name__ == "__main__":
+    unittest.main()
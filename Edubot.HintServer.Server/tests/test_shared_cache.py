@@ -0,0 +1,80 @@
+"""Shared cache: background writes, LRU eviction & puts not waiting for other processes' writes.
+
+Usage: python -m pytest tests (or python -m unittest discover tests)"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import hint_server.metrics as metrics
+from hint_server.shared_cache import SharedCache
+
+
+class SharedCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, "shared.sqlite")
+
+    def cache(self, **options) -> SharedCache:
+        cache = SharedCache(self.path, **options)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_put_is_visible_to_other_processes_after_the_write(self):
+        cache = self.cache(maxBytes=1000)
+        cache.put("lemma", "a", b"1")
+        cache.flush()
+        self.assertEqual(self.cache(maxBytes=1000).get("lemma", "a"), b"1")
+
+    def test_evicts_least_recently_used(self):
+        cache = self.cache(maxBytes=25, touchIntervalSeconds=0)
+        cache.put("solr", "a", b"a" * 10)
+        cache.put("solr", "b", b"b" * 10)
+        cache.flush()
+        time.sleep(0.01)
+        self.assertIsNotNone(cache.get("solr", "a"))  # a is used after b now
+        cache.flush()
+        cache.put("solr", "c", b"c" * 10)
+        cache.flush()
+        self.assertIsNotNone(cache.get("solr", "a"))
+        self.assertIsNone(cache.get("solr", "b"))
+        self.assertIsNotNone(cache.get("solr", "c"))
+
+    def test_put_does_not_wait_for_another_writer(self):
+        cache = self.cache(maxBytes=1000, busyTimeoutMs=2000)
+        other = sqlite3.connect(self.path, isolation_level=None)
+        self.addCleanup(other.close)
+        other.execute("BEGIN IMMEDIATE")  # another process writing
+        started = time.monotonic()
+        cache.put("lemma", "a", b"1")
+        self.assertLess(time.monotonic() - started, 0.1)
+        other.execute("COMMIT")
+        cache.flush()
+        self.assertEqual(cache.get("lemma", "a"), b"1")
+
+    def test_full_queue_skips_puts(self):
+        cache = self.cache(maxBytes=1000, maxPendingWrites=1, busyTimeoutMs=2000)
+        other = sqlite3.connect(self.path, isolation_level=None)
+        self.addCleanup(other.close)
+        other.execute("BEGIN IMMEDIATE")
+        skipped = metrics.snapshot()["counters"].get("sharedCache.skippedPuts", 0)
+        for i in range(5):
+            cache.put("lemma", str(i), b"1")
+        self.assertGreaterEqual(metrics.snapshot()["counters"].get("sharedCache.skippedPuts", 0), skipped + 3)
+        other.execute("COMMIT")
+
+    def test_unusable_file_disables_the_cache(self):
+        cache = SharedCache(os.path.join(self.dir, "missing", "shared.sqlite"), maxBytes=1000)
+        self.assertIsNone(cache.connection)
+        cache.put("lemma", "a", b"1")
+        self.assertIsNone(cache.get("lemma", "a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
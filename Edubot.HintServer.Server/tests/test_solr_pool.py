@@ -0,0 +1,65 @@
+"""Circuit breakers of the Solr replica pool against stub replicas.
+
+Usage: python -m pytest tests (or python -m unittest discover tests)"""
+import os
+import sys
+import time
+import unittest
+import urllib.error
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+from hint_server.solr import SolrReplicaPool
+from solr_stub import SolrStub
+
+QUERY = "/solr/ema/select?q=*:*"
+
+
+class SolrPoolTest(unittest.TestCase):
+
+    def replicas(self, count: int) -> list[SolrStub]:
+        replicas = [SolrStub() for _ in range(count)]
+        for replica in replicas:
+            self.addCleanup(replica.close)
+        return replicas
+
+    def pool(self, urls: list[str]) -> SolrReplicaPool:
+        return SolrReplicaPool(urls, timeoutMs=2000, hedgePercentile=95.0, hedgeMinDelayMs=1000,
+                               failureThreshold=2, cooldownSeconds=60.0)
+
+    def fail(self, pool: SolrReplicaPool, url: str, times: int):
+        for _ in range(times):
+            with self.assertRaises(urllib.error.HTTPError):
+                pool.query(url)
+
+    def test_single_replica_is_never_ejected(self):
+        solr, = self.replicas(1)
+        pool = self.pool([""])  # no replicas configured, whole URLs
+        solr.failing = True
+        self.fail(pool, solr.url + QUERY, 5)
+        self.assertIsNone(pool.replicas[0].openedAt)
+        solr.failing = False
+        self.assertEqual(pool.query(solr.url + QUERY)["response"]["numFound"], 5)
+
+    def test_last_replica_in_is_not_ejected(self):
+        first, second = self.replicas(2)
+        pool = self.pool([first.url, second.url])
+        first.failing = second.failing = True
+        self.fail(pool, first.url + QUERY, 6)
+        self.assertEqual(sum(replica.openedAt is None for replica in pool.replicas), 1)
+        first.failing = second.failing = False
+        self.assertEqual(pool.query(first.url + QUERY)["response"]["numFound"], 5)
+
+    def test_client_errors_dont_count_as_successes(self):
+        solr, = self.replicas(1)
+        other, = self.replicas(1)
+        pool = self.pool([solr.url, other.url])
+        pool.replicas[1].openedAt = time.monotonic()  # keep the queries on the first replica
+        pool.replicas[0].consecutiveFailures = 1
+        solr.failing, solr.errorStatus = True, 400
+        self.fail(pool, solr.url + QUERY, 1)
+        self.assertEqual(pool.replicas[0].consecutiveFailures, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+"""Solr URLs of the optimized templates (merged & dropped text clauses) against the plain mark-up substitution.
+
+Usage: python -m pytest tests (or python -m unittest discover tests)"""
+import json
+import os
+import re
+import sys
+import unittest
+from urllib.parse import quote, unquote
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from hint_server.url_template import UrlTemplate, TEXT_MARKUPS, CLAUSES
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "app.config.json")
+
+PATTERN = ("http://solr/core/select?q=(nazev:({text|unquoted})^10 OR nazev:({text|lemmatized,unquoted})^8"
+           " OR popis:({text|quoted}) OR popis:({text|quoted})^3){enum:typ|convertFromId|pre-AND}&rows=10&{hintingparams}")
+
+
+def renderBaseline(pattern: str, text: str, lemmatizedText: str, hintingParams: str) -> str:
+    """The URL as it was rendered before query plans: every mark-up substituted in place."""
+    def substitute(match: re.Match) -> str:
+        markup = match.group(0)
+        if markup == "{hintingparams}":
+            return hintingParams
+        if markup in TEXT_MARKUPS:
+            lemmatized, quoted = TEXT_MARKUPS[markup]
+            value = lemmatizedText if lemmatized else text
+            return quote(f"\"{value}\"" if quoted else value)
+        return ""  # enum filters, not used here
+    return re.sub(r'\{[^\}]*\}', substitute, pattern).replace(" ", "%20")
+
+
+def textClauses(url: str) -> dict[tuple[str, str], float]:
+    """Text clauses of the query: (field, value) -> the highest boost."""
+    query = unquote(url.split("q=", 1)[1].split("&", 1)[0])
+    clauses = {}
+    for field, value, boost in re.findall(r'([\w.]+):\(([^)]*)\)(?:\^([0-9.]+))?', query):
+        clauses[(field, value)] = max(clauses.get((field, value), 0.0), float(boost or 1))
+    return clauses
+
+
+class UrlTemplateTest(unittest.TestCase):
+
+    def format(self, template: UrlTemplate, text: str, lemmatizedText: str, enumValues: dict = None) -> str:
+        return template.format(text, lemmatizedText, "stats=true", enumValues, {})
+
+    def test_clauses_are_grouped(self):
+        template = UrlTemplate(PATTERN)
+        groups = [part[1] for part in template.parts if part[0] == CLAUSES]
+        self.assertEqual(groups, [(("nazev", False, False, "10"), ("nazev", True, False, "8"),
+                                   ("popis", False, True, None), ("popis", False, True, "3"))])
+
+    def test_different_texts_keep_all_distinct_clauses(self):
+        url = self.format(UrlTemplate(PATTERN), "pracovní listy", "pracovní list")
+        baseline = renderBaseline(PATTERN, "pracovní listy", "pracovní list", "stats=true")
+        self.assertEqual(textClauses(url), textClauses(baseline))
+        # the duplicate quoted popis clause is merged into one with the higher boost
+        self.assertEqual(url.count("popis:"), 1)
+        self.assertIn("popis:(" + quote("\"pracovní listy\"") + ")^3", url)
+        self.assertEqual(url.count("nazev:"), 2)
+
+    def test_same_texts_merge_clauses(self):
+        url = self.format(UrlTemplate(PATTERN), "zlomky", "zlomky")
+        baseline = renderBaseline(PATTERN, "zlomky", "zlomky", "stats=true")
+        self.assertEqual(textClauses(url), textClauses(baseline))
+        self.assertEqual(url, "http://solr/core/select?q=(nazev:(zlomky)^10%20OR%20popis:(%22zlomky%22)^3)&rows=10&stats=true")
+
+    def test_empty_lemmas_drop_their_clauses(self):
+        url = self.format(UrlTemplate(PATTERN), "zlomky", " ")
+        baseline = renderBaseline(PATTERN, "zlomky", " ", "stats=true")
+        expected = {clause: boost for clause, boost in textClauses(baseline).items() if clause[1].strip()}
+        self.assertEqual(textClauses(url), expected)
+        self.assertNotIn("nazev:(%20)", url)
+
+    def test_empty_text_matches_all(self):
+        url = self.format(UrlTemplate(PATTERN), "", "")
+        self.assertEqual(url, "http://solr/core/select?q=(*:*)&rows=10&stats=true")
+
+    def test_enum_filters_are_kept(self):
+        template = UrlTemplate(PATTERN)
+        url = self.format(template, "zlomky", "zlomky", {"typ": ["video"]})
+        self.assertIn(quote(" AND ((typ:\"video\"))"), url)
+        self.assertTrue(url.startswith("http://solr/core/select?q=(nazev:(zlomky)^10%20OR%20popis:(%22zlomky%22)^3)%20AND"))
+
+    def test_plans_are_cached_by_text_equality(self):
+        template = UrlTemplate(PATTERN)
+        self.format(template, "zlomky", "zlomky")
+        self.format(template, "video", "video")
+        self.format(template, "listy", "list")
+        self.assertEqual(len(template.plans), 2)
+
+    def test_configured_pattern(self):
+        with open(CONFIG_PATH, encoding="utf8") as file:
+            config = json.load(file)
+        for collection in config["Collections"].values():
+            pattern = collection["SolrQueryUrlPattern"]
+            template = UrlTemplate(pattern)
+            self.assertTrue(any(part[0] == CLAUSES for part in template.parts))
+            for text, lemmatizedText in [("pracovní listy", "pracovní list"), ("zlomky", "zlomky")]:
+                url = self.format(template, text, lemmatizedText)
+                baseline = renderBaseline(pattern, text, lemmatizedText, "stats=true")
+                self.assertEqual(textClauses(url), textClauses(baseline))
+                self.assertEqual(len(textClauses(url)), len(re.findall(r'[\w.]+:\(', unquote(url.split("q=", 1)[1].split("&", 1)[0]))))
+                # everything after the query is untouched
+                self.assertEqual(url.split("&", 1)[1], baseline.split("&", 1)[1])
+
+
+if __name__ == "__main__":
+    unittest.main()